@@ -0,0 +1,89 @@
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import db
+
+# --- Configuración ---
+# Periodo por defecto del panel y diagnósticos que se muestran
+DIAS_PANEL = 30
+MAXIMO_DIAGNOSTICOS = 10
+SIN_DIAGNOSTICO = "(sin diagnóstico)"
+
+
+# --- Carga ---
+# Los resúmenes tienen unas pocas filas por día (ver db._resumenes): cargarlos y
+# agregarlos con pandas cuesta lo mismo con mil historias que con un millón
+def cargar(desde: date, hasta: date) -> tuple[pd.DataFrame, pd.DataFrame]:
+    """Resúmenes del periodo: diario (dia, usuario, estado, total) y diagnósticos (dia, diagnostico, total)."""
+    diario = pd.DataFrame(
+        db.resumen_por_dia(desde.isoformat(), hasta.isoformat()),
+        columns=["dia", "usuario", "estado", "total"],
+    )
+    diagnosticos = pd.DataFrame(
+        db.resumen_por_diagnostico(desde.isoformat(), hasta.isoformat()),
+        columns=["dia", "diagnostico", "total"],
+    )
+    # Con el periodo vacío las columnas quedarían como object
+    for tabla in (diario, diagnosticos):
+        tabla["dia"] = pd.to_datetime(tabla["dia"])
+        tabla["total"] = tabla["total"].astype(np.int64)
+    return diario, diagnosticos
+
+
+# --- Agregados ---
+def tasa(parte: np.ndarray, total: np.ndarray) -> np.ndarray:
+    """parte / total elemento a elemento; 0 donde no hay atenciones."""
+    parte, total = np.asarray(parte, dtype=float), np.asarray(total, dtype=float)
+    return np.divide(parte, total, out=np.zeros_like(total), where=total > 0)
+
+
+def _por_estado(diario: pd.DataFrame, indice: str) -> pd.DataFrame:
+    """Totales con una columna por estado (todas, aunque no haya atenciones en alguno)."""
+    tabla = diario.pivot_table(
+        index=indice, columns="estado", values="total", aggfunc="sum", fill_value=0
+    )
+    return tabla.reindex(columns=list(db.ESTADOS), fill_value=0).astype(np.int64)
+
+
+def por_tripulacion(diario: pd.DataFrame) -> pd.DataFrame:
+    """Atenciones por tripulación y estado, con total y tasa de completas, de más a menos atenciones."""
+    tabla = _por_estado(diario, "usuario")
+    tabla["total"] = tabla[list(db.ESTADOS)].sum(axis=1)
+    tabla["tasa_completas"] = tasa(
+        tabla["completa"].to_numpy(), tabla["total"].to_numpy()
+    )
+    tabla.columns.name = None
+    return tabla.sort_values(["total", "tasa_completas"], ascending=False)
+
+
+def por_dia(diario: pd.DataFrame, desde: date, hasta: date) -> pd.DataFrame:
+    """Atenciones por día y estado; los días sin atenciones aparecen en cero."""
+    tabla = _por_estado(diario, "dia").reindex(
+        pd.date_range(desde, hasta, freq="D", name="dia"), fill_value=0
+    )
+    tabla.columns.name = None
+    return tabla
+
+
+def top_diagnosticos(
+    diagnosticos: pd.DataFrame, n: int = MAXIMO_DIAGNOSTICOS
+) -> pd.Series:
+    """Los n diagnósticos más frecuentes del periodo."""
+    serie = diagnosticos.groupby("diagnostico")["total"].sum().nlargest(n)
+    return serie.rename(index={"": SIN_DIAGNOSTICO}).rename("atenciones")
+
+
+def panel(desde: date, hasta: date, n: int = MAXIMO_DIAGNOSTICOS) -> dict:
+    """Todo lo que muestra el panel de supervisión para el periodo."""
+    diario, diagnosticos = cargar(desde, hasta)
+    totales = diario.groupby("estado")["total"].sum()
+    total = int(totales.sum())
+    return {
+        "total": total,
+        "tasa_completas": float(tasa(totales.get("completa", 0), total)),
+        "por_tripulacion": por_tripulacion(diario),
+        "por_dia": por_dia(diario, desde, hasta),
+        "diagnosticos": top_diagnosticos(diagnosticos, n),
+    }
@@ -1,69 +1,178 @@
+import os
 import streamlit as st
-from datetime import datetime, timedelta
-from db import init_db, crear_usuario, validar_usuario, obtener_consecutivo, guardar_historia, obtener_historias_por_estado
+from streamlit.errors import StreamlitAPIException
+from datetime import date, datetime, timedelta
+from db import (
+    init_db,
+    crear_usuario,
+    validar_usuario,
+    obtener_consecutivo,
+    obtener_historias_pagina,
+    buscar_historias,
+    cola_ia_estado,
+    obtener_muletillas,
+    guardar_muletillas,
+    borrador_obtener,
+    borrador_descartar,
+    borrador_promover,
+    edad_entera,
+    EDAD_MAXIMA,
+    ESTADOS,
+)
 import google.generativeai as genai
 import json
+from concurrent.futures import ThreadPoolExecutor
 from utils_audio import guardar_y_transcribir
+from servicio_transcripcion import ServicioTranscripcion
+from utils_ia import analizar_texto, consumo_por_historia
+from cola_ia import TrabajadorCola
+from borradores import AutoguardadoBorrador
+from reanalisis import ReanalisisEnFondo
+import instrumentacion
+import telemetria
+import analitica
 
 # --- CONFIGURACIÓN DE PÁGINA ---
-st.set_page_config(page_title="Historias Clínicas - Ambulancia IA", page_icon="🚑", layout="wide")
-init_db()
+st.set_page_config(
+    page_title="Historias Clínicas - Ambulancia IA", page_icon="🚑", layout="wide"
+)
+instrumentacion.iniciar_rerun()
+
+
+# --- ARRANQUE ---
+# Tablas y configuración de Gemini una sola vez por proceso, no en cada rerun
+@st.cache_resource
+def arrancar() -> None:
+    init_db()
+    genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
+
+
+arrancar()
 
-# --- CONFIGURACIÓN GEMINI ---
-genai.configure(api_key=st.secrets["GEMINI_API_KEY"])
 
 # --- FUNCIÓN IA CORRECTORA ---
 def analizar_con_gemini(texto: str):
-    prompt = f"""
-    Eres un asistente médico de ambulancia experto en dictados clínicos.
-    Corrige el texto en español latino médico y extrae:
-    paciente, edad, motivo, diagnóstico y tratamiento.
-    Devuelve **solo un JSON válido** con este formato:
-
-    {{
-      "texto_corregido": "Texto corregido con sentido clínico",
-      "paciente": "Nombre del paciente o 'No especificado'",
-      "edad": número entero o 0,
-      "motivo": "Motivo de atención",
-      "diagnostico": "Diagnóstico probable",
-      "tratamiento": "Tratamiento realizado"
-    }}
-
-    Texto a analizar:
-    \"\"\"{texto}\"\"\"
-    """
+    try:
+        return analizar_texto(texto, avisar=st.warning)
+    except RuntimeError:
+        st.error("❌ No se pudo procesar con los modelos disponibles.")
+        raise
+
+
+# --- ADMINISTRACIÓN ---
+# Usuarios (separados por comas) que ven Administración: reanálisis masivo, rendimiento y métricas
+ADMINISTRADORES = frozenset(
+    u.strip() for u in os.environ.get("ADMINISTRADORES", "").split(",") if u.strip()
+)
+
+
+def es_administrador(usuario: str) -> bool:
+    return usuario in ADMINISTRADORES
+
+
+# --- CREDENCIALES ---
+# scrypt consume CPU y memoria a propósito: se verifica fuera del hilo del script
+# y con dos verificaciones a la vez como máximo, compartidas por todas las sesiones
+@st.cache_resource
+def ejecutor_credenciales() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="credenciales")
+
+
+# --- SERVICIO DE TRANSCRIPCIÓN ---
+# Procesos con Whisper cargado, compartidos por todas las sesiones (solo bajo `streamlit run`)
+@st.cache_resource
+def iniciar_servicio_transcripcion() -> ServicioTranscripcion:
+    return ServicioTranscripcion()
+
+
+# --- REANÁLISIS MASIVO ---
+# Uno a la vez para todo el servidor, en su propio hilo: la página de Administración solo muestra el progreso
+@st.cache_resource
+def reanalisis_en_fondo() -> ReanalisisEnFondo:
+    return ReanalisisEnFondo()
+
+
+# --- COLA DE ANÁLISIS SIN CONEXIÓN ---
+# Un solo trabajador por proceso; analiza en segundo plano los dictados guardados sin análisis
+@st.cache_resource
+def iniciar_trabajador_cola() -> TrabajadorCola:
+    trabajador = TrabajadorCola()
+    trabajador.iniciar()
+    return trabajador
+
+
+# --- CONSULTAS EN CACHÉ ---
+# Cada rerun repetía las mismas lecturas. Se guardan unos segundos (los cambios de
+# otras tripulaciones o de la cola tardan como mucho eso en verse) y se invalidan al guardar.
+SEGUNDOS_CACHE = 30
+
+
+@st.cache_data(ttl=SEGUNDOS_CACHE, show_spinner=False)
+def consecutivo_en_cache() -> str:
+    return obtener_consecutivo()
+
 
-    modelos = ["gemini-2.5-flash", "gemini-2.5-flash-lite"]
+@st.cache_data(ttl=SEGUNDOS_CACHE, show_spinner=False)
+def pagina_en_cache(
+    usuario: str, estado: str, tamano: int, cursor: tuple[str, int] | None
+):
+    return obtener_historias_pagina(usuario, estado, tamano, cursor)
 
-    for modelo_id in modelos:
-        try:
-            modelo = genai.GenerativeModel(modelo_id)
-            respuesta = modelo.generate_content(prompt, generation_config={"temperature": 0.3})
-            salida = respuesta.text.strip()
 
-            # Extraer JSON puro
-            if "{" in salida and "}" in salida:
-                salida = salida[salida.find("{"):salida.rfind("}") + 1]
+@st.cache_data(ttl=SEGUNDOS_CACHE, show_spinner=False)
+def busqueda_en_cache(usuario: str, texto: str, estado: str, tamano: int, pagina: int):
+    return buscar_historias(usuario, texto, estado, tamano, pagina)
 
-            # Validar JSON
-            try:
-                json.loads(salida)
-                return salida
-            except json.JSONDecodeError:
-                salida = salida.replace("'", '"').replace(",}", "}").replace(",]", "]")
-                json.loads(salida)
-                return salida
 
-        except Exception as e:
-            st.warning(f"⚠️ {modelo_id} falló: {str(e)[:80]}")
-            continue
+@st.cache_data(ttl=5, show_spinner=False)
+def estado_cola_en_cache() -> tuple[int, float | None]:
+    return cola_ia_estado()
 
-    st.error("❌ No se pudo procesar con los modelos disponibles.")
-    raise RuntimeError("Fallo en análisis IA.")
+
+@st.cache_data(ttl=SEGUNDOS_CACHE, show_spinner=False)
+def panel_en_cache(desde: date, hasta: date) -> dict:
+    return analitica.panel(desde, hasta)
+
+
+@st.cache_data(ttl=SEGUNDOS_CACHE, show_spinner=False)
+def muletillas_en_cache(usuario: str) -> list[str]:
+    return obtener_muletillas(usuario)
+
+
+def invalidar_historias() -> None:
+    """Tras guardar o reanalizar: consecutivo, listados, búsquedas, cola y panel cambian."""
+    for cacheada in (
+        consecutivo_en_cache,
+        pagina_en_cache,
+        busqueda_en_cache,
+        estado_cola_en_cache,
+        panel_en_cache,
+    ):
+        cacheada.clear()
+
+
+def recargar() -> None:
+    """st.rerun() del script completo cerrando antes su medición."""
+    instrumentacion.terminar_rerun()
+    st.rerun()
+
+
+def recargar_fragmento() -> None:
+    """
+    st.rerun() solo del fragmento en curso. Si el fragmento se está ejecutando
+    dentro del script completo (p. ej. con AppTest), Streamlit no lo permite y se
+    recarga el script.
+    """
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        recargar()
 
 
 # --- ESTILOS ---
-st.markdown("""
+# No se puede cachear: Streamlit solo muestra lo que se emite en cada ejecución
+st.markdown(
+    """
 <style>
     * {font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;}
     .main {background: linear-gradient(135deg, #f7f9fc 0%, #e8f0f7 100%);}
@@ -96,120 +205,232 @@ st.markdown("""
         box-shadow: 0 4px 12px rgba(43, 84, 126, 0.3) !important;
     }
 </style>
-""", unsafe_allow_html=True)
-
-
-# --- LOGIN ---
-if "logueado" not in st.session_state:
-    st.session_state.logueado = False
-if "usuario" not in st.session_state:
-    st.session_state.usuario = ""
-if "grabando" not in st.session_state:
-    st.session_state.grabando = False  # 🔴 Control del botón toggle de grabación
-
-if not st.session_state.logueado:
-    st.markdown("<p class='titulo-principal'>🚑 Sistema de Historias Clínicas - Ambulancia</p>", unsafe_allow_html=True)
-    with st.container():
-        st.markdown("<div class='seccion'>", unsafe_allow_html=True)
-        col1, col2 = st.columns(2)
-        
-        with col1:
-            usuario = st.text_input("👤 Usuario", key="login_usuario")
-        with col2:
-            contrasena = st.text_input("🔒 Contraseña", type="password", key="login_pass")
-
-        col1, col2 = st.columns(2)
-        with col1:
-            if st.button("Iniciar sesión", use_container_width=True):
-                if usuario and contrasena:
-                    if validar_usuario(usuario, contrasena):
-                        st.session_state.logueado = True
-                        st.session_state.usuario = usuario
-                        st.success("✅ Inicio de sesión exitoso")
-                        st.rerun()
-                    else:
-                        st.error("❌ Usuario o contraseña incorrectos")
-                else:
-                    st.warning("⚠️ Completa todos los campos")
-
-        with col2:
-            if st.button("Crear cuenta", use_container_width=True):
-                if usuario and contrasena:
-                    crear_usuario(usuario, contrasena)
-                    st.success("✅ Usuario creado correctamente")
-                else:
-                    st.warning("⚠️ Completa todos los campos")
-        st.markdown("</div>", unsafe_allow_html=True)
-
-else:
-    st.sidebar.image("https://cdn-icons-png.flaticon.com/512/2966/2966481.png", width=90)
-    st.sidebar.markdown(f"**👋 Bienvenido, {st.session_state.usuario}**")
-    opcion = st.sidebar.radio("📋 Menú principal", ["Nueva historia", "Historias incompletas", "Historias completadas", "Cerrar sesión"])
-
-    if opcion == "Cerrar sesión":
-        st.session_state.logueado = False
-        st.rerun()
+""",
+    unsafe_allow_html=True,
+)
+
+
+# --- FRAGMENTOS ---
+# Grabar, analizar, buscar o cambiar de página solo vuelve a ejecutar su fragmento,
+# no el script completo (estilos, menú, estado de la cola...)
+def reset_form():
+    """Resetea solo los campos del formulario sin cerrar sesión."""
+    keys = [
+        "paciente_auto",
+        "edad_auto",
+        "motivo_auto",
+        "diagnostico_auto",
+        "tratamiento_auto",
+        "texto_corregido",
+        "texto_libre",
+        "paciente",
+        "edad",
+        "motivo_text",
+        "diag_text",
+        "trat_text",
+    ]
+    for k in keys:
+        if k in st.session_state:
+            del st.session_state[k]
+
+
+# Campo de la historia -> key de su widget en el formulario
+CLAVES_FORMULARIO = {
+    "paciente": "paciente",
+    "edad": "edad",
+    "motivo": "motivo_text",
+    "diagnostico": "diag_text",
+    "tratamiento": "trat_text",
+}
+
+
+def llenar_formulario() -> None:
+    """Pide que el siguiente rerun del formulario muestre los campos *_auto."""
+    st.session_state["autollenar_pendiente"] = True
+
+
+def aplicar_llenado_pendiente() -> None:
+    """
+    Un widget con key ignora los cambios de `value`: lo que llenó la IA o el
+    borrador se copia a sus keys, antes de crear los widgets.
+    """
+    if st.session_state.pop("autollenar_pendiente", False):
+        for campo, clave in CLAVES_FORMULARIO.items():
+            st.session_state[clave] = st.session_state.get(f"{campo}_auto", "")
+
+
+def autoguardado() -> AutoguardadoBorrador:
+    """Autoguardado del borrador de la sesión, partiendo de lo que ya hay en la base."""
+    if "autoguardado" not in st.session_state:
+        usuario = st.session_state.usuario
+        st.session_state.autoguardado = AutoguardadoBorrador(
+            usuario, borrador_obtener(usuario)
+        )
+    return st.session_state.autoguardado
+
+
+def recuperar_borrador(usuario: str) -> None:
+    """Al iniciar sesión: vuelve a llenar el formulario con el borrador pendiente, si lo hay."""
+    borrador = borrador_obtener(usuario)
+    if not borrador:
+        return
+    for campo in ("paciente", "edad", "motivo", "diagnostico", "tratamiento"):
+        st.session_state[f"{campo}_auto"] = borrador[campo]
+    st.session_state["texto_libre"] = borrador["texto_libre"]
+    if borrador["texto_corregido"]:
+        st.session_state["texto_corregido"] = borrador["texto_corregido"]
+    st.session_state["borrador_recuperado"] = borrador["actualizado"]
+    llenar_formulario()
+
+
+def autollenar(resultado: str) -> None:
+    datos = json.loads(resultado)
+    st.session_state["paciente_auto"] = datos.get("paciente", "")
+    edad = datos.get("edad")
+    st.session_state["edad_auto"] = "" if edad is None else str(edad)
+    st.session_state["motivo_auto"] = datos.get("motivo", "")
+    st.session_state["diagnostico_auto"] = datos.get("diagnostico", "")
+    st.session_state["tratamiento_auto"] = datos.get("tratamiento", "")
+    st.session_state["texto_corregido"] = datos.get("texto_corregido", "")
+    llenar_formulario()
+    # Lo que devuelve la IA se escribe ya, sin esperar al rebote
+    autoguardado().actualizar(
+        {
+            campo: st.session_state[f"{campo}_auto"]
+            for campo in ("paciente", "edad", "motivo", "diagnostico", "tratamiento")
+        }
+        | {
+            "texto_corregido": st.session_state["texto_corregido"],
+            "texto_libre": st.session_state.get("texto_libre", ""),
+        }
+    )
+    autoguardado().vaciar()
+
+
+@st.fragment(run_every=2)
+def progreso_reanalisis():
+    """Lanza o detiene el reanálisis en segundo plano y muestra su progreso cada 2 s."""
+    reanalisis = reanalisis_en_fondo()
+    estado_reanalisis = reanalisis.estado()
+    if estado_reanalisis["en_marcha"]:
+        if st.button("⏹️ Detener reanálisis", use_container_width=True):
+            reanalisis.detener(espera=0)
+    else:
+        reiniciar = st.checkbox(
+            "Empezar desde el principio (ignorar el progreso guardado)"
+        )
+        if st.button("🔁 Reanalizar incompletas", use_container_width=True):
+            reanalisis.iniciar(reiniciar=reiniciar, al_terminar=invalidar_historias)
+            recargar_fragmento()
+
+    resumen = estado_reanalisis["resumen"]
+    if resumen is not None:
+        if resumen["total"]:
+            st.progress(min(1.0, resumen["procesadas"] / resumen["total"]))
+        restante = (
+            "—"
+            if resumen["restante_s"] is None
+            else f"{resumen['restante_s'] / 60:.1f} min"
+        )
+        st.caption(
+            f"{resumen['procesadas']}/{resumen['total']} historias · {resumen['por_segundo']:.2f}/s · "
+            f"errores {resumen['tasa_error']:.0%} · restante {restante}"
+        )
+        if estado_reanalisis["detenido"]:
+            st.info(
+                "⏸️ Reanálisis detenido: la próxima vez retoma desde el último lote guardado."
+            )
+        elif not estado_reanalisis["en_marcha"]:
+            st.success(
+                f"✅ Reanálisis terminado: {resumen['procesadas'] - resumen['errores']} historias completadas"
+            )
+    elif estado_reanalisis["en_marcha"]:
+        st.caption("⏳ Preparando el reanálisis...")
+    if estado_reanalisis["error"]:
+        st.error(f"Error en el reanálisis: {estado_reanalisis['error']}")
+
+
+@st.fragment
+def formulario_historia():
+    with instrumentacion.medir("fragmento: nueva historia"):
+        # Solo vista previa: el número definitivo se asigna al guardar
+        consecutivo = consecutivo_en_cache()
+        st.write(f"**Consecutivo:** {consecutivo}")
 
-    elif opcion == "Nueva historia":
-        st.markdown("<p class='titulo-principal'>🩺 Nueva Historia Clínica</p>", unsafe_allow_html=True)
-        st.markdown("<div class='seccion'>", unsafe_allow_html=True)
+        if "borrador_recuperado" in st.session_state:
+            col_aviso, col_descartar = st.columns([3, 1])
+            with col_aviso:
+                guardado_en = datetime.fromtimestamp(
+                    st.session_state["borrador_recuperado"]
+                ).strftime("%Y-%m-%d %H:%M")
+                st.info(f"📝 Se recuperó el borrador sin guardar del {guardado_en}.")
+            with col_descartar:
+                if st.button("🗑️ Descartar borrador", use_container_width=True):
+                    autoguardado().descartar()
+                    borrador_descartar(st.session_state.usuario)
+                    reset_form()
+                    del st.session_state["borrador_recuperado"]
+                    recargar_fragmento()
 
-        # Helper para resetear solo los campos del formulario sin cerrar sesión
-        def reset_form():
-            keys = [
-                "paciente_auto", "edad_auto", "motivo_auto", "diagnostico_auto", "tratamiento_auto",
-                "texto_corregido", "texto_libre", "paciente", "edad", "motivo_text", "diag_text", "trat_text"
-            ]
-            for k in keys:
-                if k in st.session_state:
-                    del st.session_state[k]
-
-        consecutivo = obtener_consecutivo()
-        st.write(f"**Consecutivo:** {consecutivo}")
+        aplicar_llenado_pendiente()
 
         col1, col2 = st.columns(2)
         with col1:
-            paciente = st.text_input("👨‍⚕️ Nombre del paciente", value=st.session_state.get("paciente_auto", ""))
-            edad = st.text_input("🎂 Edad", value=st.session_state.get("edad_auto", ""))
+            paciente = st.text_input("👨‍⚕️ Nombre del paciente", key="paciente")
+            edad = st.text_input("🎂 Edad", key="edad")
         with col2:
-            motivo = st.text_area("📋 Motivo de atención", value=st.session_state.get("motivo_auto", ""), height=100, key="motivo_text")
-            diagnostico = st.text_area("💊 Diagnóstico", value=st.session_state.get("diagnostico_auto", ""), height=100, key="diag_text")
+            motivo = st.text_area(
+                "📋 Motivo de atención", height=100, key="motivo_text"
+            )
+            diagnostico = st.text_area("💊 Diagnóstico", height=100, key="diag_text")
 
-        tratamiento = st.text_area("🩹 Tratamiento realizado", value=st.session_state.get("tratamiento_auto", ""), height=100, key="trat_text")
+        tratamiento = st.text_area(
+            "🩹 Tratamiento realizado", height=100, key="trat_text"
+        )
 
         if "texto_corregido" in st.session_state:
-            st.text_area("🧾 Texto corregido por IA", st.session_state["texto_corregido"], height=120, disabled=True)
+            st.text_area(
+                "🧾 Texto corregido por IA",
+                st.session_state["texto_corregido"],
+                height=120,
+                disabled=True,
+            )
 
         st.divider()
 
         # --- BOTÓN DE GRABACIÓN TOGGLE ---
-        col_audio, col_text = st.columns([1, 1])
+        col_audio, _ = st.columns([1, 1])
         with col_audio:
             if not st.session_state.grabando:
                 if st.button("🎤 Iniciar grabación", use_container_width=True):
                     st.session_state.grabando = True
                     st.info("🎙️ Grabando... presiona el botón nuevamente para detener.")
-                    st.rerun()
+                    recargar_fragmento()
             else:
                 if st.button("🛑 Detener grabación", use_container_width=True):
                     with st.spinner("Procesando audio..."):
                         try:
-                            texto_transcrito = guardar_y_transcribir()
+                            servicio = (
+                                iniciar_servicio_transcripcion()
+                                if st.runtime.exists()
+                                else None
+                            )
+                            texto_transcrito = guardar_y_transcribir(
+                                muletillas_extra=muletillas_en_cache(
+                                    st.session_state.usuario
+                                ),
+                                servicio=servicio,
+                            )
+                            if servicio is not None and servicio.caido:
+                                # Este dictado ya se transcribió aquí; el siguiente arranca procesos nuevos
+                                iniciar_servicio_transcripcion.clear()
+                                servicio.cerrar()
                             st.session_state["texto_libre"] = texto_transcrito
 
                             # --- Envío automático a la IA ---
                             try:
-                                resultado = analizar_con_gemini(texto_transcrito)
-                                datos = json.loads(resultado)
-
                                 # Llenar los campos automáticamente
-                                st.session_state["paciente_auto"] = datos.get("paciente", "")
-                                st.session_state["edad_auto"] = str(datos.get("edad", ""))
-                                st.session_state["motivo_auto"] = datos.get("motivo", "")
-                                st.session_state["diagnostico_auto"] = datos.get("diagnostico", "")
-                                st.session_state["tratamiento_auto"] = datos.get("tratamiento", "")
-                                st.session_state["texto_corregido"] = datos.get("texto_corregido", "")
-
+                                autollenar(analizar_con_gemini(texto_transcrito))
                                 st.success("✅ Transcripción y análisis completados")
                             except Exception as e:
                                 st.error(f"Error al analizar con IA: {str(e)[:120]}")
@@ -218,13 +439,28 @@ else:
                             st.error(f"Error al grabar o transcribir: {str(e)[:120]}")
                         finally:
                             st.session_state.grabando = False
-                            st.rerun()
-
-        texto_libre = st.text_area("🎙️ Dictado / Texto libre para IA",
-                                   value=st.session_state.get("texto_libre", ""),
-                                   placeholder="Escribe o dicta la descripción completa...",
-                                   height=150,
-                                   key="texto_libre")
+                            recargar_fragmento()
+
+        st.text_area(
+            "🎙️ Dictado / Texto libre para IA",
+            value=st.session_state.get("texto_libre", ""),
+            placeholder="Escribe o dicta la descripción completa...",
+            height=150,
+            key="texto_libre",
+        )
+
+        # Borrador: solo se escriben los campos que cambiaron, con rebote
+        autoguardado().actualizar(
+            {
+                "paciente": paciente,
+                "edad": edad,
+                "motivo": motivo,
+                "diagnostico": diagnostico,
+                "tratamiento": tratamiento,
+                "texto_libre": st.session_state.get("texto_libre", ""),
+                "texto_corregido": st.session_state.get("texto_corregido", ""),
+            }
+        )
 
         col_analyze, _ = st.columns([1, 3])
         with col_analyze:
@@ -233,18 +469,9 @@ else:
                 if texto:
                     with st.spinner("Analizando con IA..."):
                         try:
-                            resultado = analizar_con_gemini(texto)
-                            datos = json.loads(resultado)
-
-                            st.session_state["paciente_auto"] = datos.get("paciente", "")
-                            st.session_state["edad_auto"] = str(datos.get("edad", ""))
-                            st.session_state["motivo_auto"] = datos.get("motivo", "")
-                            st.session_state["diagnostico_auto"] = datos.get("diagnostico", "")
-                            st.session_state["tratamiento_auto"] = datos.get("tratamiento", "")
-                            st.session_state["texto_corregido"] = datos.get("texto_corregido", "")
-
+                            autollenar(analizar_con_gemini(texto))
                             st.success("✅ Análisis completado y campos auto-llenados")
-                            st.rerun()
+                            recargar_fragmento()
                         except Exception as e:
                             st.error(f"Error al analizar con IA: {str(e)[:120]}")
                 else:
@@ -252,31 +479,420 @@ else:
 
         st.divider()
         if st.button("💾 Guardar historia", use_container_width=True):
-            if paciente and edad and motivo:
+            if paciente and edad_entera(edad) is not None and motivo:
+                # Dictado sin análisis (p. ej. sin conexión): se encola con la historia
+                texto_pendiente = st.session_state.get("texto_libre", "").strip()
+                pendiente = (
+                    bool(texto_pendiente) and "texto_corregido" not in st.session_state
+                )
                 try:
-                    guardar_historia(consecutivo, st.session_state.usuario, paciente, edad, motivo, diagnostico, tratamiento)
-                    st.success("✅ Historia guardada correctamente")
+                    # Historia, cola y borrador en una sola transacción
+                    autoguardado().descartar()
+                    consecutivo = borrador_promover(
+                        st.session_state.usuario,
+                        {
+                            "paciente": paciente,
+                            "edad": edad,
+                            "motivo": motivo,
+                            "diagnostico": diagnostico,
+                            "tratamiento": tratamiento,
+                        },
+                        texto_pendiente if pendiente else None,
+                    )
+                    invalidar_historias()
+                    st.success(f"✅ Historia {consecutivo} guardada correctamente")
                     reset_form()
+                    st.session_state.pop("borrador_recuperado", None)
                 except Exception as e:
                     st.error(f"Error al guardar: {str(e)[:120]}")
+                else:
+                    if pendiente:
+                        st.info(
+                            "📡 El dictado se analizará con IA en cuanto haya conexión."
+                        )
+            elif edad and edad_entera(edad) is None:
+                st.warning(
+                    f"⚠️ La edad debe ser un número de años entre 0 y {EDAD_MAXIMA} (p. ej. 45 o «8 meses»)"
+                )
             else:
                 st.warning("⚠️ Completa los campos obligatorios")
 
-        st.markdown("</div>", unsafe_allow_html=True)
-    else:
-        estado = "incompleta" if opcion == "Historias incompletas" else "completa"
-        historias = obtener_historias_por_estado(st.session_state.usuario, estado)
 
-        st.markdown(f"<p class='titulo-principal'>📂 Historias {estado.capitalize()}</p>", unsafe_allow_html=True)
+@st.fragment
+def listado_historias(estado: str):
+    with instrumentacion.medir("fragmento: listado"):
+        busqueda = st.text_input(
+            "🔍 Buscar",
+            placeholder="Paciente, motivo, diagnóstico o tratamiento",
+            key=f"busqueda_{estado}",
+        ).strip()
+        tamano = st.selectbox("Historias por página", [25, 50, 100], index=1)
+
+        if busqueda:
+            # Resultados por relevancia, paginados por número de página
+            clave_pagina = f"pagina_busqueda_{estado}_{tamano}_{busqueda}"
+            pagina = st.session_state.setdefault(clave_pagina, 0)
+            historias, hay_mas = busqueda_en_cache(
+                st.session_state.usuario, busqueda, estado, tamano, pagina
+            )
+            numero_pagina, hay_anterior = pagina + 1, pagina > 0
+        else:
+            # Pila de cursores: el último es el inicio de la página actual
+            clave_cursores = f"cursores_{estado}_{tamano}"
+            cursores = st.session_state.setdefault(clave_cursores, [None])
+            historias, siguiente = pagina_en_cache(
+                st.session_state.usuario, estado, tamano, cursores[-1]
+            )
+            numero_pagina, hay_anterior, hay_mas = (
+                len(cursores),
+                len(cursores) > 1,
+                siguiente is not None,
+            )
+
         if historias:
-            for hist in historias:
-                st.markdown("<div class='seccion'>", unsafe_allow_html=True)
-                st.write(f"**Consecutivo:** {hist[0]}")
-                st.write(f"**Paciente:** {hist[2]}")
-                st.write(f"**Edad:** {hist[3]}")
-                st.write(f"**Motivo:** {hist[4]}")
-                st.write(f"**Diagnóstico:** {hist[5]}")
-                st.write(f"**Tratamiento:** {hist[6]}")
-                st.markdown("</div>", unsafe_allow_html=True)
+            st.dataframe(
+                [
+                    {
+                        "Consecutivo": h[0],
+                        "Paciente": h[2],
+                        "Edad": h[3],
+                        "Motivo": h[4],
+                        "Diagnóstico": h[5],
+                        "Tratamiento": h[6],
+                        "Fecha": h[7],
+                    }
+                    for h in historias
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+            col_ant, col_pag, col_sig = st.columns([1, 2, 1])
+            with col_ant:
+                if st.button(
+                    "⬅️ Anterior", disabled=not hay_anterior, use_container_width=True
+                ):
+                    if busqueda:
+                        st.session_state[clave_pagina] -= 1
+                    else:
+                        cursores.pop()
+                    recargar_fragmento()
+            with col_pag:
+                st.caption(f"Página {numero_pagina}")
+            with col_sig:
+                if st.button(
+                    "Siguiente ➡️", disabled=not hay_mas, use_container_width=True
+                ):
+                    if busqueda:
+                        st.session_state[clave_pagina] += 1
+                    else:
+                        cursores.append(siguiente)
+                    recargar_fragmento()
+        elif busqueda:
+            st.info("No hay historias que coincidan con la búsqueda.")
         else:
             st.info("No hay historias para mostrar.")
+
+
+# --- LOGIN ---
+if "logueado" not in st.session_state:
+    st.session_state.logueado = False
+if "usuario" not in st.session_state:
+    st.session_state.usuario = ""
+if "grabando" not in st.session_state:
+    st.session_state.grabando = False  # 🔴 Control del botón toggle de grabación
+
+if not st.session_state.logueado:
+    st.markdown(
+        "<p class='titulo-principal'>🚑 Sistema de Historias Clínicas - Ambulancia</p>",
+        unsafe_allow_html=True,
+    )
+    with st.container():
+        st.markdown("<div class='seccion'>", unsafe_allow_html=True)
+        col1, col2 = st.columns(2)
+
+        with col1:
+            usuario = st.text_input("👤 Usuario", key="login_usuario")
+        with col2:
+            contrasena = st.text_input(
+                "🔒 Contraseña", type="password", key="login_pass"
+            )
+
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Iniciar sesión", use_container_width=True):
+                if usuario and contrasena:
+                    with st.spinner("Verificando..."):
+                        valido = (
+                            ejecutor_credenciales()
+                            .submit(validar_usuario, usuario, contrasena)
+                            .result()
+                        )
+                    if valido:
+                        st.session_state.logueado = True
+                        st.session_state.usuario = usuario
+                        recuperar_borrador(usuario)
+                        st.success("✅ Inicio de sesión exitoso")
+                        recargar()
+                    else:
+                        st.error("❌ Usuario o contraseña incorrectos")
+                else:
+                    st.warning("⚠️ Completa todos los campos")
+
+        with col2:
+            if st.button("Crear cuenta", use_container_width=True):
+                if usuario and contrasena:
+                    with st.spinner("Creando cuenta..."):
+                        ejecutor_credenciales().submit(
+                            crear_usuario, usuario, contrasena
+                        ).result()
+                    st.success("✅ Usuario creado correctamente")
+                else:
+                    st.warning("⚠️ Completa todos los campos")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+else:
+    st.sidebar.image(
+        "https://cdn-icons-png.flaticon.com/512/2966/2966481.png", width=90
+    )
+    st.sidebar.markdown(f"**👋 Bienvenido, {st.session_state.usuario}**")
+    opciones = [
+        "Nueva historia",
+        "Historias incompletas",
+        "Historias completadas",
+        "Mis muletillas",
+    ]
+    if es_administrador(st.session_state.usuario):
+        opciones += ["Panel de supervisión", "Administración"]
+    opcion = st.sidebar.radio("📋 Menú principal", opciones + ["Cerrar sesión"])
+
+    # Estado de la cola de análisis pendientes
+    # (el trabajador solo arranca bajo `streamlit run`; en pruebas solo se lee la tabla)
+    if st.runtime.exists():
+        estadisticas_cola = iniciar_trabajador_cola().estadisticas()
+    else:
+        pendientes, mas_antiguo = estado_cola_en_cache()
+        estadisticas_cola = {
+            "pendientes": pendientes,
+            "antiguedad_s": (
+                (datetime.now().timestamp() - mas_antiguo) if mas_antiguo else 0.0
+            ),
+            "latencia_p50_s": None,
+            "ultimo_error": None,
+        }
+    with st.sidebar.expander(f"📡 Análisis en cola: {estadisticas_cola['pendientes']}"):
+        if estadisticas_cola["pendientes"]:
+            st.caption(
+                f"El más antiguo espera hace {estadisticas_cola['antiguedad_s'] / 60:.0f} min"
+            )
+        if estadisticas_cola["latencia_p50_s"] is not None:
+            st.caption(
+                f"Latencia de proceso (p50): {estadisticas_cola['latencia_p50_s']:.0f} s"
+            )
+        if estadisticas_cola["ultimo_error"]:
+            st.caption(f"Último error: {estadisticas_cola['ultimo_error'][:80]}")
+
+    if opcion == "Cerrar sesión":
+        # El borrador queda guardado y se recupera en el próximo inicio de sesión
+        if "autoguardado" in st.session_state:
+            st.session_state.pop("autoguardado").vaciar()
+        reset_form()
+        st.session_state.pop("borrador_recuperado", None)
+        st.session_state.logueado = False
+        recargar()
+
+    elif opcion == "Nueva historia":
+        st.markdown(
+            "<p class='titulo-principal'>🩺 Nueva Historia Clínica</p>",
+            unsafe_allow_html=True,
+        )
+        st.markdown("<div class='seccion'>", unsafe_allow_html=True)
+        formulario_historia()
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    elif opcion == "Panel de supervisión" and es_administrador(
+        st.session_state.usuario
+    ):
+        st.markdown(
+            "<p class='titulo-principal'>📊 Panel de supervisión</p>",
+            unsafe_allow_html=True,
+        )
+        st.markdown("<div class='seccion'>", unsafe_allow_html=True)
+
+        hoy = datetime.now().date()
+        periodo = st.date_input(
+            "📅 Periodo",
+            value=(hoy - timedelta(days=analitica.DIAS_PANEL - 1), hoy),
+            max_value=hoy,
+            format="YYYY-MM-DD",
+        )
+        if len(periodo) != 2:
+            st.info("Elige también la fecha final del periodo.")
+        else:
+            desde, hasta = periodo
+            panel = panel_en_cache(desde, hasta)
+            col_total, col_tasa, col_tripulaciones = st.columns(3)
+            col_total.metric("Atenciones", f"{panel['total']:,}")
+            col_tasa.metric("Completas", f"{panel['tasa_completas']:.0%}")
+            col_tripulaciones.metric(
+                "Tripulaciones activas", len(panel["por_tripulacion"])
+            )
+
+            if not panel["total"]:
+                st.info("No hay atenciones en el periodo.")
+            else:
+                st.subheader("Atenciones por día")
+                st.bar_chart(panel["por_dia"], stack=True)
+
+                st.subheader("Por tripulación")
+                st.bar_chart(
+                    panel["por_tripulacion"][list(ESTADOS)], horizontal=True, stack=True
+                )
+                st.dataframe(
+                    panel["por_tripulacion"],
+                    column_config={
+                        "incompleta": "Incompletas",
+                        "completa": "Completas",
+                        "total": "Total",
+                        "tasa_completas": st.column_config.ProgressColumn(
+                            "Completas (%)", format="percent", min_value=0, max_value=1
+                        ),
+                    },
+                    use_container_width=True,
+                )
+
+                st.subheader("Diagnósticos más frecuentes")
+                st.bar_chart(panel["diagnosticos"], horizontal=True)
+
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    elif opcion == "Mis muletillas":
+        st.markdown(
+            "<p class='titulo-principal'>🗣️ Mis muletillas</p>", unsafe_allow_html=True
+        )
+        st.markdown("<div class='seccion'>", unsafe_allow_html=True)
+        st.caption(
+            "Palabras que se quitan de tus dictados además de las comunes (eh, este, pues...)."
+        )
+        muletillas = st.text_input(
+            "Separadas por comas",
+            value=", ".join(muletillas_en_cache(st.session_state.usuario)),
+            key="muletillas_propias",
+        )
+        if st.button("💾 Guardar muletillas", use_container_width=True):
+            guardar_muletillas(st.session_state.usuario, muletillas.split(","))
+            muletillas_en_cache.clear()
+            st.success("✅ Muletillas guardadas")
+        st.markdown("</div>", unsafe_allow_html=True)
+
+    elif opcion == "Administración" and es_administrador(st.session_state.usuario):
+        st.markdown(
+            "<p class='titulo-principal'>🛠️ Administración</p>", unsafe_allow_html=True
+        )
+        st.markdown("<div class='seccion'>", unsafe_allow_html=True)
+
+        st.subheader("Reanálisis de historias incompletas")
+        st.caption(
+            "Completa con IA el diagnóstico y el tratamiento que faltan, en segundo plano. "
+            "Si se interrumpe, retoma desde el último lote guardado."
+        )
+        progreso_reanalisis()
+
+        st.divider()
+        st.subheader("Rendimiento de la interfaz")
+        st.caption(
+            "Tiempo y consultas a la base de las últimas ejecuciones del script y de cada fragmento."
+        )
+        rendimiento = instrumentacion.resumen()
+        if rendimiento:
+            st.dataframe(
+                [
+                    {
+                        "Ejecución": nombre,
+                        "Veces": r["veces"],
+                        "p50 (ms)": round(r["p50_ms"], 1),
+                        "Máx. (ms)": round(r["max_ms"], 1),
+                        "Consultas (p50)": r["consultas_p50"],
+                    }
+                    for nombre, r in rendimiento.items()
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+
+        st.divider()
+        st.subheader("Métricas del dictado")
+        st.caption(
+            "Dónde se va el tiempo entre detener la grabación y ver los campos llenos (todas las sesiones)."
+        )
+        activa = st.toggle("Registrar métricas", value=telemetria.registro.activa)
+        if activa != telemetria.registro.activa:
+            telemetria.registro.activa = activa
+        metricas_dictado = telemetria.historico()
+        if metricas_dictado["tramos"]:
+            st.dataframe(
+                [
+                    {
+                        "Tramo": nombre,
+                        "Veces": t["veces"],
+                        "p50 (ms)": round(t["p50_s"] * 1000, 1),
+                        "p95 (ms)": round(t["p95_s"] * 1000, 1),
+                        "Total (s)": round(t["suma_s"], 1),
+                    }
+                    for nombre, t in metricas_dictado["tramos"].items()
+                ],
+                hide_index=True,
+                use_container_width=True,
+            )
+            st.caption("p50 y p95 se estiman a partir de los histogramas guardados.")
+        else:
+            st.info("Aún no hay métricas registradas.")
+        if metricas_dictado["contadores"]:
+            st.write(
+                " · ".join(
+                    f"**{nombre}**: {valor}"
+                    for nombre, valor in metricas_dictado["contadores"].items()
+                )
+            )
+        consumo = consumo_por_historia(metricas_dictado["contadores"])
+        if consumo["historias"]:
+            st.caption(
+                f"Gemini por historia ({consumo['historias']} analizadas): "
+                f"{consumo['solicitudes_por_historia']:.2f} solicitudes · "
+                f"{consumo['tokens_entrada_por_historia']:.0f} tokens de entrada · "
+                f"{consumo['tokens_salida_por_historia']:.0f} de salida"
+            )
+        col_prom, col_json = st.columns(2)
+        with col_prom:
+            st.download_button(
+                "⬇️ Prometheus",
+                telemetria.a_prometheus(metricas_dictado),
+                file_name="ambulancias.prom",
+                mime="text/plain",
+                use_container_width=True,
+            )
+        with col_json:
+            st.download_button(
+                "⬇️ JSON",
+                telemetria.a_json(metricas_dictado),
+                file_name="ambulancias_metricas.json",
+                mime="application/json",
+                use_container_width=True,
+            )
+
+        st.markdown("</div>", unsafe_allow_html=True)
+    else:
+        estado = "incompleta" if opcion == "Historias incompletas" else "completa"
+        st.markdown(
+            f"<p class='titulo-principal'>📂 Historias {estado.capitalize()}</p>",
+            unsafe_allow_html=True,
+        )
+        listado_historias(estado)
+
+# --- PRECARGA DE WHISPER ---
+# Con la página ya enviada, los procesos del servicio cargan el modelo en segundo plano (solo bajo `streamlit run`)
+if st.runtime.exists():
+    iniciar_servicio_transcripcion()
+
+# --- MEDICIÓN DEL RERUN ---
+instrumentacion.terminar_rerun()
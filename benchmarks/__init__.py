@@ -0,0 +1 @@
+"""Benchmarks de rendimiento. Se ejecutan desde la raíz con ``python -m benchmarks.<modulo>``."""
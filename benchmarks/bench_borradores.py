@@ -0,0 +1,88 @@
+"""
+Amplificación de escritura del autoguardado de borradores: escrituras y campos
+por minuto en una sesión de edición simulada, guardando en cada rerun (ingenuo)
+frente al autoguardado con rebote de borradores.py, contra SQLite real.
+
+    python -m benchmarks.bench_borradores --minutos 10 --rerun-medio 1.5
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+import borradores
+import db
+
+CAMPOS = ("paciente", "edad", "motivo", "diagnostico", "tratamiento", "texto_libre")
+
+
+def sesion(
+    minutos: float, rerun_medio: float, semilla: int
+) -> list[tuple[float, dict[str, str]]]:
+    """Instantes de rerun con el estado del formulario; en cada uno cambia un campo."""
+    azar = random.Random(semilla)
+    formulario = {campo: "" for campo in CAMPOS}
+    ahora, eventos = 0.0, []
+    while ahora < minutos * 60:
+        # Ráfagas de edición separadas por pausas (pensar, atender al paciente...)
+        ahora += (
+            azar.expovariate(1 / rerun_medio)
+            if azar.random() < 0.9
+            else azar.uniform(15, 60)
+        )
+        campo = azar.choice(CAMPOS)
+        formulario[campo] += azar.choice("abcdefghij ")
+        eventos.append((ahora, dict(formulario)))
+    return eventos
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--minutos", type=float, default=10.0)
+    parser.add_argument(
+        "--rerun-medio",
+        type=float,
+        default=1.5,
+        help="segundos medios entre reruns en una ráfaga",
+    )
+    parser.add_argument("--semilla", type=int, default=7)
+    args = parser.parse_args()
+
+    eventos = sesion(args.minutos, args.rerun_medio, args.semilla)
+    duracion_min = eventos[-1][0] / 60
+    print(f"{len(eventos)} reruns con cambios en {duracion_min:.1f} min")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configurar_db(os.path.join(tmp, "borradores.db"))
+        db.init_db()
+
+        inicio = time.perf_counter()
+        for _, formulario in eventos:
+            db.borrador_guardar("ingenuo", formulario)
+        segundos = time.perf_counter() - inicio
+        print(
+            f"{'ingenuo':10} {len(eventos) / duracion_min:7.1f} escrituras/min  "
+            f"{len(eventos) * len(CAMPOS) / duracion_min:7.1f} campos/min  {segundos * 1000:7.1f} ms en SQLite"
+        )
+
+        auto = borradores.AutoguardadoBorrador("rebote", temporizador=False)
+        inicio = time.perf_counter()
+        for ahora, formulario in eventos:
+            auto.procesar(ahora)
+            auto.actualizar(formulario, ahora=ahora)
+        auto.vaciar()
+        segundos = time.perf_counter() - inicio
+        print(
+            f"{'rebote':10} {auto.escrituras / duracion_min:7.1f} escrituras/min  "
+            f"{auto.campos_escritos / duracion_min:7.1f} campos/min  {segundos * 1000:7.1f} ms en SQLite "
+            f"(tope {60 / borradores.ESPERA_MAXIMA:.0f}/min editando sin pausa)"
+        )
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Latencia de búsqueda: índice FTS5 frente a un recorrido LIKE '%…%'.
+
+    python -m benchmarks.bench_busqueda --historias 500000
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+import db
+
+NOMBRES = [
+    "Juan",
+    "Ana",
+    "Luis",
+    "María",
+    "Pedro",
+    "Lucía",
+    "José",
+    "Carmen",
+    "Andrés",
+    "Sofía",
+]
+APELLIDOS = [
+    "Pérez",
+    "Gómez",
+    "Rodríguez",
+    "López",
+    "Martínez",
+    "Sánchez",
+    "Ramírez",
+    "Torres",
+    "Díaz",
+    "Ruiz",
+]
+MOTIVOS = [
+    "Dolor torácico",
+    "Caída de altura",
+    "Disnea súbita",
+    "Convulsión",
+    "Accidente de tránsito",
+    "Dolor abdominal",
+    "Síncope",
+    "Herida por arma blanca",
+    "Fiebre alta",
+    "Cefalea intensa",
+]
+DIAGNOSTICOS = [
+    "Sospecha IAM",
+    "Trauma craneoencefálico",
+    "EPOC exacerbado",
+    "Epilepsia",
+    "Politraumatismo",
+    "Apendicitis",
+    "Hipotensión ortostática",
+    "Hemorragia",
+    "Neumonía",
+    "Migraña",
+]
+TRATAMIENTOS = [
+    "Aspirina y oxígeno",
+    "Inmovilización cervical",
+    "Nebulización",
+    "Diazepam",
+    "Líquidos IV",
+    "Analgesia",
+    "Posición Trendelenburg",
+    "Compresión directa",
+    "Antipirético",
+    "Ketorolaco",
+]
+CONSULTAS = [
+    "toracico",
+    "perez",
+    "neumonia",
+    "inmovilizacion cervical",
+    "juan torres",
+    "hemorragia",
+]
+
+
+def sembrar(total: int, usuarios: int) -> None:
+    rng = random.Random(0)
+    filas = (
+        (
+            f"HC-2026-{i + 1:07d}",
+            f"tripulacion{i % usuarios}",
+            f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+            str(rng.randint(0, 99)),
+            rng.choice(MOTIVOS),
+            rng.choice(DIAGNOSTICOS),
+            rng.choice(TRATAMIENTOS),
+            f"2026-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d} 12:00:00",
+            rng.choice(("incompleta", "completa")),
+        )
+        for i in range(total)
+    )
+    db.importar_historias(filas)
+
+
+def buscar_like(usuario: str, texto: str, tamano: int) -> list:
+    """Recorrido sin índice: cada término debe aparecer en alguno de los cuatro campos."""
+    condiciones, parametros = [], [usuario]
+    for termino in texto.split():
+        condiciones.append(
+            "(paciente LIKE ? OR motivo LIKE ? OR diagnostico LIKE ? OR tratamiento LIKE ?)"
+        )
+        parametros += [f"%{termino}%"] * 4
+    with db.conexion() as conn:
+        return conn.execute(
+            f"SELECT consecutivo FROM historias WHERE usuario_id=(SELECT id FROM usuarios WHERE usuario=?)"
+            f" AND {' AND '.join(condiciones)}"
+            " ORDER BY fecha_creacion DESC LIMIT ?",
+            parametros + [tamano],
+        ).fetchall()
+
+
+def medir(consulta, repeticiones: int) -> str:
+    muestras = []
+    for _ in range(repeticiones):
+        for texto in CONSULTAS:
+            t0 = time.perf_counter()
+            consulta(texto)
+            muestras.append(time.perf_counter() - t0)
+    cuantiles = statistics.quantiles(muestras, n=100)
+    return f"p50={cuantiles[49] * 1000:8.2f} ms  p95={cuantiles[94] * 1000:8.2f} ms"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--historias", type=int, default=500_000)
+    parser.add_argument("--usuarios", type=int, default=5)
+    parser.add_argument("--tamano", type=int, default=20)
+    parser.add_argument("--repeticiones", type=int, default=5)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configurar_db(Path(tmp) / "bench.db")
+        db.init_db()
+        t0 = time.perf_counter()
+        sembrar(args.historias, args.usuarios)
+        print(
+            f"{args.historias} historias sembradas e indexadas en {time.perf_counter() - t0:.1f} s"
+        )
+
+        # Los términos de LIKE van sin tildes igual que los de FTS5, aunque LIKE no las ignora
+        print(
+            f"LIKE '%…%'  {medir(lambda t: buscar_like('tripulacion0', t, args.tamano), args.repeticiones)}"
+        )
+        print(
+            f"FTS5 MATCH  {medir(lambda t: db.buscar_historias('tripulacion0', t, tamano=args.tamano), args.repeticiones)}"
+        )
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Prueba de carga de la app con streamlit.testing (AppTest): --sesiones
+sesiones simultáneas recorren --flujos veces el flujo completo abrir la app e
+iniciar sesión → dictar (micrófono y Whisper falsos) → análisis con Gemini
+falso → guardar historia, cada vez en una sesión nueva, sobre una base
+compartida con --historias historias sintéticas. Da p50/p95 de cada paso y
+flujos por segundo.
+
+AppTest no admite dos ejecuciones a la vez en un proceso (el Runtime y
+st.secrets son globales), así que cada sesión corre en su propio proceso con
+su servicio de transcripción (--procesos, Whisper falso) y su cola de IA,
+como bajo `streamlit run`. Antes de medir, cada sesión hace un flujo de
+calentamiento y todas arrancan a la vez.
+
+El dictado incluye la grabación: el WAV (--segundos) y los 3 s de silencio
+que la cierran, al ritmo real dividido por --velocidad.
+
+    python -m benchmarks.bench_carga_app --sesiones 8 --flujos 3 --latencia-gemini 0.8
+"""
+
+import argparse
+import logging
+import multiprocessing
+import statistics
+import tempfile
+import time
+from functools import partial
+from pathlib import Path
+
+from streamlit.testing.v1 import AppTest
+
+import db
+import servicio_transcripcion
+from benchmarks import entorno
+
+RUTA_APP = str(Path(__file__).resolve().parents[1] / "app.py")
+PASOS = ("login", "dictar", "guardar")
+CONTRASENA = "clave-de-carga"
+# Segundos máximos de cada ejecución del script
+TIMEOUT = 120.0
+
+
+class FlujoFallido(RuntimeError):
+    """La app no llegó al estado esperado en algún paso del flujo."""
+
+
+def _boton(at: AppTest, etiqueta: str):
+    for boton in at.button:
+        if etiqueta in boton.label:
+            return boton
+    raise FlujoFallido(f"no aparece el botón «{etiqueta}»")
+
+
+def _comprobar(at: AppTest, paso: str) -> None:
+    if at.exception:
+        raise FlujoFallido(f"{paso}: {at.exception[0].message}")
+
+
+def abrir() -> AppTest:
+    """Una pestaña nueva de la app (sin red: la clave de Gemini es ficticia)."""
+    at = AppTest.from_file(RUTA_APP, default_timeout=TIMEOUT)
+    at.secrets["GEMINI_API_KEY"] = "sin-red"
+    return at.run()
+
+
+def flujo(usuario: str) -> dict[str, float]:
+    """
+    Abrir la app e iniciar sesión → dictar y analizar → guardar, en una sesión
+    nueva (como otra pestaña). Devuelve los segundos de cada paso.
+    """
+    tiempos = {}
+    inicio = time.perf_counter()
+    at = abrir()
+    at.text_input(key="login_usuario").input(usuario)
+    at.text_input(key="login_pass").input(CONTRASENA)
+    _boton(at, "Iniciar sesión").click().run()
+    _comprobar(at, "login")
+    if not at.session_state["logueado"]:
+        raise FlujoFallido(f"login: {[aviso.value for aviso in at.error]}")
+    tiempos["login"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    _boton(at, "Iniciar grabación").click().run()
+    _boton(at, "Detener grabación").click().run()
+    _comprobar(at, "dictar")
+    if not at.text_input(key="paciente").value:
+        raise FlujoFallido(
+            f"dictar: el análisis no llenó el formulario {[aviso.value for aviso in at.error]}"
+        )
+    tiempos["dictar"] = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    _boton(at, "Guardar historia").click().run()
+    _comprobar(at, "guardar")
+    if not any("guardada correctamente" in aviso.value for aviso in at.success):
+        raise FlujoFallido(
+            f"guardar: {[aviso.value for aviso in at.warning + at.error]}"
+        )
+    tiempos["guardar"] = time.perf_counter() - inicio
+    return tiempos
+
+
+def _sesion(i: int, ruta_db: str, parametros: dict, barrera, resultados) -> None:
+    """Proceso de una tripulación: calienta con un flujo, espera a las demás y mide."""
+    logging.disable(logging.WARNING)
+    db.configurar_db(ruta_db)
+    whisper = {
+        "base": parametros["latencia_whisper"],
+        "por_segundo": parametros["latencia_whisper"] / 5,
+    }
+    servicio_transcripcion.ServicioTranscripcion = partial(
+        servicio_transcripcion.ServicioTranscripcion,
+        procesos=parametros["procesos"],
+        iniciar=entorno.iniciar_whisper_falso,
+        transcribir=partial(entorno.transcribir_falso, **whisper),
+    )
+    latencia = parametros["latencia_gemini"]
+    usuario = f"carga{i}"
+    muestras, error, inicio = {paso: [] for paso in PASOS}, None, time.time()
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            # Un audio distinto por flujo: sin aciertos de caché entre flujos ni sesiones
+            audios = entorno.audios_wav(
+                Path(tmp),
+                parametros["flujos"] + 1,
+                parametros["segundos"],
+                1000 * (i + 1),
+            )
+            with entorno.sin_red(
+                gemini=entorno.GeminiFalso(
+                    latencia, fluctuacion=latencia / 4, semilla=i
+                ),
+                whisper=entorno.WhisperFalso(**whisper),
+                microfono=entorno.MicrofonoFalso(audios, parametros["velocidad"]),
+            ):
+                at = abrir()
+                at.text_input(key="login_usuario").input(usuario)
+                at.text_input(key="login_pass").input(CONTRASENA)
+                _boton(at, "Crear cuenta").click().run()
+                flujo(usuario)
+                barrera.wait()
+                inicio = time.time()
+                for _ in range(parametros["flujos"]):
+                    for paso, segundos in flujo(usuario).items():
+                        muestras[paso].append(segundos)
+    except Exception as e:  # noqa: BLE001 - el error viaja al proceso principal
+        error = f"{type(e).__name__}: {e}"
+        barrera.abort()
+    finally:
+        db.cerrar_conexiones()
+    resultados.put((muestras, error, inicio, time.time()))
+
+
+def _cuantiles(muestras: list[float]) -> dict[str, float]:
+    cuantiles = (
+        statistics.quantiles(muestras, n=100) if len(muestras) > 1 else muestras * 99
+    )
+    return {"p50_ms": cuantiles[49] * 1000, "p95_ms": cuantiles[94] * 1000}
+
+
+def ejecutar(
+    sesiones: int = 4,
+    flujos: int = 2,
+    historias: int = 10_000,
+    segundos: float = 6.0,
+    velocidad: float = 20.0,
+    latencia_gemini: float = 0.5,
+    latencia_whisper: float = 0.05,
+    procesos: int = 1,
+) -> dict[str, dict[str, float]]:
+    """Corre la carga y devuelve {paso: {p50_ms, p95_ms}} más {"flujo": {"flujos_por_s", "errores"}}."""
+    parametros = {
+        "flujos": flujos,
+        "segundos": segundos,
+        "velocidad": velocidad,
+        "latencia_gemini": latencia_gemini,
+        "latencia_whisper": latencia_whisper,
+        "procesos": procesos,
+    }
+    contexto = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta_db = str(Path(tmp) / "carga.db")
+        db.configurar_db(ruta_db)
+        db.init_db()
+        db.importar_historias(entorno.historias(historias))
+        db.cerrar_conexiones()
+
+        barrera, resultados = contexto.Barrier(sesiones), contexto.Queue()
+        hijos = [
+            contexto.Process(
+                target=_sesion,
+                args=(i, ruta_db, parametros, barrera, resultados),
+                name=f"sesion-{i}",
+            )
+            for i in range(sesiones)
+        ]
+        for hijo in hijos:
+            hijo.start()
+        informes = [resultados.get() for _ in hijos]
+        for hijo in hijos:
+            hijo.join()
+
+    errores = [error for _, error, _, _ in informes if error]
+    muestras = {
+        paso: [s for informe in informes for s in informe[0][paso]] for paso in PASOS
+    }
+    if not muestras["guardar"]:
+        raise FlujoFallido(
+            errores[0] if errores else "ninguna sesión completó un flujo"
+        )
+    duracion = max(fin for *_, fin in informes) - min(
+        inicio for *_, inicio, _ in informes
+    )
+    resultados = {paso: _cuantiles(valores) for paso, valores in muestras.items()}
+    resultados["flujo"] = {
+        "flujos_por_s": len(muestras["guardar"]) / duracion,
+        "errores": len(errores),
+    }
+    return resultados
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--sesiones", type=int, default=4, help="sesiones simultáneas")
+    parser.add_argument(
+        "--flujos", type=int, default=2, help="flujos medidos por sesión"
+    )
+    parser.add_argument(
+        "--historias", type=int, default=10_000, help="historias sintéticas en la base"
+    )
+    parser.add_argument(
+        "--segundos", type=float, default=6.0, help="duración de cada dictado"
+    )
+    parser.add_argument(
+        "--velocidad",
+        type=float,
+        default=20.0,
+        help="factor de aceleración del micrófono falso",
+    )
+    parser.add_argument(
+        "--latencia-gemini",
+        type=float,
+        default=0.5,
+        help="segundos por llamada a Gemini falso",
+    )
+    parser.add_argument(
+        "--latencia-whisper",
+        type=float,
+        default=0.05,
+        help="segundos base por bloque de Whisper falso",
+    )
+    parser.add_argument(
+        "--procesos", type=int, default=1, help="procesos de transcripción por sesión"
+    )
+    args = parser.parse_args()
+
+    resultados = ejecutar(
+        args.sesiones,
+        args.flujos,
+        args.historias,
+        args.segundos,
+        args.velocidad,
+        args.latencia_gemini,
+        args.latencia_whisper,
+        args.procesos,
+    )
+    flujo_total = resultados.pop("flujo")
+    print(
+        f"{args.sesiones} sesiones × {args.flujos} flujos: {flujo_total['flujos_por_s']:.2f} flujos/s, "
+        f"{flujo_total['errores']} sesiones con error"
+    )
+    for paso, tiempos in resultados.items():
+        print(
+            f"{paso:8} p50={tiempos['p50_ms']:8.0f} ms  p95={tiempos['p95_ms']:8.0f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
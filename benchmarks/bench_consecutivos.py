@@ -0,0 +1,84 @@
+"""
+Prueba de estrés del asignador de consecutivos.
+
+Varios procesos (y hilos dentro de cada uno) guardan historias a la vez con
+consecutivo=None; al final se comprueba que no hay duplicados y se informa de
+las asignaciones por segundo.
+
+    python -m benchmarks.bench_consecutivos --procesos 4 --hilos 4 --asignaciones 250
+"""
+
+import argparse
+import multiprocessing
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+import db
+
+
+def trabajador(ruta: str, hilos: int, asignaciones: int, inicio) -> None:
+    db.configurar_db(ruta)
+    inicio.wait()
+
+    def asignar() -> None:
+        for _ in range(asignaciones):
+            db.guardar_historia(None, "bench", "P", "40", "M", "D", "T")
+
+    grupo = [threading.Thread(target=asignar) for _ in range(hilos)]
+    for h in grupo:
+        h.start()
+    for h in grupo:
+        h.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--procesos", type=int, default=4)
+    parser.add_argument("--hilos", type=int, default=4, help="hilos por proceso")
+    parser.add_argument(
+        "--asignaciones", type=int, default=250, help="asignaciones por hilo"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = str(Path(tmp) / "bench.db")
+        db.configurar_db(ruta)
+        db.init_db()
+        db.cerrar_conexiones()
+
+        inicio = multiprocessing.Event()
+        procesos = [
+            multiprocessing.Process(
+                target=trabajador, args=(ruta, args.hilos, args.asignaciones, inicio)
+            )
+            for _ in range(args.procesos)
+        ]
+        for p in procesos:
+            p.start()
+        t0 = time.perf_counter()
+        inicio.set()
+        for p in procesos:
+            p.join()
+        duracion = time.perf_counter() - t0
+
+        with db.conexion() as conn:
+            total, distintos = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT consecutivo) FROM historias"
+            ).fetchone()
+        db.cerrar_conexiones()
+
+    esperado = args.procesos * args.hilos * args.asignaciones
+    print(
+        f"asignaciones: {total}/{esperado}  distintas: {distintos}  duplicados: {total - distintos}"
+    )
+    print(f"{total / duracion:.0f} asignaciones/s en {duracion:.2f} s")
+    if total != esperado or distintos != total:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
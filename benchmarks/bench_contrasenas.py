@@ -0,0 +1,69 @@
+"""
+Ajuste del coste de scrypt: mide el tiempo de un login (una verificación) para
+cada N y recomienda el mayor N que no supera la latencia objetivo en este
+servidor. Con --concurrencia se mide además con varios logins a la vez.
+
+    python -m benchmarks.bench_contrasenas --objetivo-ms 100
+    SCRYPT_N=<recomendado> streamlit run app.py
+"""
+
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import contrasenas
+
+
+def medir(n: int, repeticiones: int, concurrencia: int) -> float:
+    """Mediana en segundos de verificar una contraseña con coste n."""
+    almacenado = contrasenas.hashear("contraseña de prueba", n=n)
+
+    def uno(_):
+        t0 = time.perf_counter()
+        contrasenas.verificar("contraseña de prueba", almacenado)
+        return time.perf_counter() - t0
+
+    with ThreadPoolExecutor(max_workers=concurrencia) as ejecutor:
+        return statistics.median(ejecutor.map(uno, range(repeticiones * concurrencia)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--objetivo-ms", type=float, default=100.0)
+    parser.add_argument(
+        "--desde", type=int, default=12, help="exponente mínimo (N = 2^desde)"
+    )
+    parser.add_argument("--hasta", type=int, default=18, help="exponente máximo")
+    parser.add_argument("--repeticiones", type=int, default=5)
+    parser.add_argument(
+        "--concurrencia", type=int, default=1, help="logins simultáneos"
+    )
+    args = parser.parse_args()
+
+    recomendado = None
+    for exponente in range(args.desde, args.hasta + 1):
+        n = 2**exponente
+        latencia = medir(n, args.repeticiones, args.concurrencia) * 1000
+        memoria = 128 * n * contrasenas.SCRYPT_R / 2**20
+        marca = "✓" if latencia <= args.objetivo_ms else " "
+        print(
+            f"{marca} N=2^{exponente:<2} ({n:>7})  login p50={latencia:7.1f} ms  memoria={memoria:5.0f} MB"
+        )
+        if latencia <= args.objetivo_ms:
+            recomendado = n
+        else:
+            break
+
+    if recomendado is None:
+        print(
+            f"Ningún N cumple {args.objetivo_ms:.0f} ms; usa SCRYPT_N=2^{args.desde} o baja la concurrencia"
+        )
+    else:
+        print(f"Recomendado: SCRYPT_N={recomendado} (actual {contrasenas.SCRYPT_N})")
+
+
+if __name__ == "__main__":
+    main()
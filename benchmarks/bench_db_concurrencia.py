@@ -0,0 +1,100 @@
+"""
+Escrituras por segundo con N escritores en paralelo.
+
+Compara el acceso antiguo (abrir/cerrar una conexión por llamada, journal por
+defecto) con el pool de conexiones en WAL de db.py.
+
+    python -m benchmarks.bench_db_concurrencia --escritores 1 2 4 8 --escrituras 200
+"""
+
+import argparse
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import db
+
+SQL_INSERT = """
+    INSERT INTO historias (consecutivo, usuario_id, paciente, edad, motivo, diagnostico, tratamiento, fecha_creacion, estado)
+    VALUES (?, (SELECT id FROM usuarios WHERE usuario=?), ?, ?, ?, ?, ?, ?, ?)
+"""
+
+
+def guardar_por_conexion(ruta: str, consecutivo: str) -> None:
+    """Réplica del acceso original: una conexión nueva por escritura."""
+    conn = sqlite3.connect(ruta)
+    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    conn.execute(
+        SQL_INSERT, (consecutivo, "bench", "P", 40, "M", "D", "T", fecha, "incompleta")
+    )
+    conn.commit()
+    conn.close()
+
+
+def guardar_con_pool(ruta: str, consecutivo: str) -> None:
+    db.guardar_historia(consecutivo, "bench", "P", "40", "M", "D", "T")
+
+
+def medir(escribir, ruta: str, escritores: int, escrituras: int) -> tuple[float, int]:
+    errores = [0]
+    barrera = threading.Barrier(escritores)
+
+    def trabajador(n: int) -> None:
+        barrera.wait()
+        for i in range(escrituras):
+            try:
+                escribir(ruta, f"HC-B{n}-{i}")
+            except sqlite3.OperationalError:
+                errores[0] += 1
+
+    hilos = [threading.Thread(target=trabajador, args=(n,)) for n in range(escritores)]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - inicio
+    return escritores * escrituras / duracion, errores[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--escritores", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument(
+        "--escrituras", type=int, default=200, help="escrituras por escritor"
+    )
+    args = parser.parse_args()
+
+    print(f"{'escritores':>10} {'modo':>10} {'escr/s':>10} {'bloqueos':>9}")
+    for escritores in args.escritores:
+        for modo, escribir in (
+            ("conexion", guardar_por_conexion),
+            ("pool", guardar_con_pool),
+        ):
+            with tempfile.TemporaryDirectory() as tmp:
+                ruta = str(Path(tmp) / "bench.db")
+                db.configurar_db(ruta)
+                db.init_db()
+                with db.transaccion() as conn:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO usuarios (usuario) VALUES ('bench')"
+                    )
+                if modo == "conexion":
+                    # El acceso original usaba el journal por defecto
+                    with db.conexion() as conn:
+                        conn.execute("PRAGMA journal_mode=DELETE")
+                    db.cerrar_conexiones()
+                por_segundo, bloqueos = medir(
+                    escribir, ruta, escritores, args.escrituras
+                )
+                db.cerrar_conexiones()
+            print(f"{escritores:>10} {modo:>10} {por_segundo:>10.0f} {bloqueos:>9}")
+
+
+if __name__ == "__main__":
+    main()
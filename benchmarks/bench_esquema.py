@@ -0,0 +1,211 @@
+"""
+Consultas típicas sobre historias antes y después de la migración a columnas
+con tipos (versión 2): primera página de un listado, conteo por rango de edad,
+agregado mensual por estado, conteo en un rango de fechas y total por
+tripulación. También mide la migración por lotes con un escritor concurrente
+(la espera máxima de sus escrituras muestra que la base sigue disponible).
+
+    python -m benchmarks.bench_esquema --historias 200000 --lote 5000 --pausa 0.01
+"""
+
+import argparse
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import db
+
+DESDE, HASTA = "2026-03-01 00:00:00", "2026-03-08 00:00:00"
+
+CONSULTAS_TEXTO = {
+    "primera página": (
+        (
+            "SELECT consecutivo, usuario, paciente, edad, motivo, diagnostico, tratamiento, fecha_creacion FROM historias"
+            " WHERE usuario=? AND estado='incompleta' ORDER BY fecha_creacion DESC, id DESC LIMIT 50"
+        ),
+        ("tripulacion3",),
+    ),
+    "edad 60-80": (
+        # Comparar el texto ('9' > '80') da resultados falsos: hay que convertir fila a fila
+        "SELECT COUNT(*) FROM historias WHERE CAST(edad AS INTEGER) BETWEEN 60 AND 80 AND trim(edad) != ''",
+        (),
+    ),
+    "agregado mensual": (
+        (
+            "SELECT substr(fecha_creacion, 1, 7), estado, COUNT(*), AVG(CAST(edad AS INTEGER)) FROM historias"
+            " GROUP BY 1, 2"
+        ),
+        (),
+    ),
+    "rango de fechas": (
+        "SELECT COUNT(*) FROM historias WHERE fecha_creacion >= ? AND fecha_creacion < ?",
+        (DESDE, HASTA),
+    ),
+    "por tripulación": ("SELECT usuario, COUNT(*) FROM historias GROUP BY usuario", ()),
+}
+
+CONSULTAS_TIPADAS = {
+    "primera página": (
+        (
+            "SELECT h.consecutivo, u.usuario, h.paciente, h.edad, h.motivo, h.diagnostico, h.tratamiento, h.fecha_creacion"
+            " FROM historias h JOIN usuarios u ON u.id = h.usuario_id"
+            " WHERE u.usuario=? AND h.estado='incompleta' ORDER BY h.fecha_creacion DESC, h.id DESC LIMIT 50"
+        ),
+        ("tripulacion3",),
+    ),
+    "edad 60-80": ("SELECT COUNT(*) FROM historias WHERE edad BETWEEN 60 AND 80", ()),
+    "agregado mensual": (
+        "SELECT substr(fecha_creacion, 1, 7), estado, COUNT(*), AVG(edad) FROM historias GROUP BY 1, 2",
+        (),
+    ),
+    "rango de fechas": (
+        "SELECT COUNT(*) FROM historias WHERE fecha_creacion >= ? AND fecha_creacion < ?",
+        (DESDE, HASTA),
+    ),
+    "por tripulación": (
+        (
+            "SELECT u.usuario, c.total FROM (SELECT usuario_id, COUNT(*) AS total FROM historias GROUP BY usuario_id) c"
+            " JOIN usuarios u ON u.id = c.usuario_id"
+        ),
+        (),
+    ),
+}
+
+
+def sembrar(total: int, usuarios: int) -> None:
+    """Historias en el esquema de texto (versión 1), como en una base antigua."""
+    azar = random.Random(3)
+    inicio = datetime(2025, 1, 1)
+    filas = (
+        (
+            f"HC-2025-{i + 1:07d}",
+            f"tripulacion{i % usuarios}",
+            f"Paciente {i}",
+            azar.choice(
+                (
+                    str(azar.randint(0, 99)),
+                    f"{azar.randint(1, 99)} años",
+                    f"{azar.randint(1, 11)} meses",
+                    "",
+                )
+            ),
+            "Dolor torácico",
+            "Sospecha IAM",
+            "Aspirina",
+            (inicio + timedelta(seconds=azar.randint(0, 500 * 86400))).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            ),
+            azar.choice(("incompleta", "completa")),
+        )
+        for i in range(total)
+    )
+    with db.transaccion() as conn:
+        conn.executemany(
+            """
+            INSERT INTO historias (consecutivo, usuario, paciente, edad, motivo, diagnostico, tratamiento, fecha_creacion, estado)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            filas,
+        )
+        conn.execute("ANALYZE")
+
+
+def medir(consultas: dict, repeticiones: int) -> dict[str, float]:
+    """p50 en ms de cada consulta."""
+    resultado = {}
+    with db.conexion() as conn:
+        for nombre, (sql, parametros) in consultas.items():
+            muestras = []
+            for _ in range(repeticiones):
+                t0 = time.perf_counter()
+                conn.execute(sql, parametros).fetchall()
+                muestras.append(time.perf_counter() - t0)
+            resultado[nombre] = statistics.median(muestras) * 1000
+    return resultado
+
+
+def migrar_con_escritor(tamano_lote: int, pausa: float) -> tuple[float, int, float]:
+    """Migra mientras otro hilo guarda historias en el esquema de texto. Devuelve (s, escrituras, espera máxima en ms)."""
+    detener = threading.Event()
+    esperas = []
+
+    def escritor() -> None:
+        n = 0
+        while not detener.is_set():
+            t0 = time.perf_counter()
+            try:
+                with db.transaccion() as conn:
+                    conn.execute(
+                        "INSERT INTO historias (consecutivo, usuario, paciente, edad, fecha_creacion, estado)"
+                        " VALUES (?, 'tripulacion0', 'Durante', '50', ?, 'incompleta')",
+                        (f"HC-CONC-{n}", datetime.now().strftime("%Y-%m-%d %H:%M:%S")),
+                    )
+            except sqlite3.OperationalError:
+                # Tras el intercambio final la tabla ya no tiene la columna usuario
+                esperas.append(time.perf_counter() - t0)
+                return
+            esperas.append(time.perf_counter() - t0)
+            n += 1
+            time.sleep(0.005)
+
+    hilo = threading.Thread(target=escritor)
+    hilo.start()
+    inicio = time.perf_counter()
+    db.migrar(tamano_lote=tamano_lote, pausa=pausa)
+    duracion = time.perf_counter() - inicio
+    detener.set()
+    hilo.join()
+    return duracion, len(esperas), max(esperas, default=0.0) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--historias", type=int, default=200_000)
+    parser.add_argument(
+        "--usuarios",
+        type=int,
+        default=20,
+        help="tripulaciones entre las que se reparten",
+    )
+    parser.add_argument(
+        "--lote",
+        type=int,
+        default=db.TAMANO_LOTE_MIGRACION,
+        help="historias por lote de la migración",
+    )
+    parser.add_argument(
+        "--pausa", type=float, default=0.01, help="segundos entre lotes de la migración"
+    )
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configurar_db(Path(tmp) / "bench.db")
+        db.migrar(hasta=1)
+        sembrar(args.historias, args.usuarios)
+        antes = medir(CONSULTAS_TEXTO, args.repeticiones)
+
+        duracion, escrituras, espera_maxima = migrar_con_escritor(args.lote, args.pausa)
+        print(
+            f"migración: {args.historias / duracion:,.0f} historias/s ({duracion:.1f} s); "
+            f"{escrituras} escrituras concurrentes, espera máxima {espera_maxima:.0f} ms"
+        )
+        with db.conexion() as conn:
+            conn.execute("ANALYZE")
+        despues = medir(CONSULTAS_TIPADAS, args.repeticiones)
+
+        print(f"{'consulta (p50)':18} {'texto':>10} {'con tipos':>10}")
+        for nombre in CONSULTAS_TEXTO:
+            print(f"{nombre:18} {antes[nombre]:8.2f} ms {despues[nombre]:8.2f} ms")
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
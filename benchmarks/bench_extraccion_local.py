@@ -0,0 +1,114 @@
+"""
+Extractor local por reglas sobre un corpus de dictados: latencia, fracción de
+llamadas a la IA evitadas y exactitud de los campos en las que se evitan.
+
+    python -m benchmarks.bench_extraccion_local --dictados 5000 --latencia-ia 1.5
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+import extraccion_local
+from benchmarks.bench_busqueda import (
+    APELLIDOS,
+    DIAGNOSTICOS,
+    MOTIVOS,
+    NOMBRES,
+    TRATAMIENTOS,
+)
+
+# Plantillas con todos los campos; cada una usa sinónimos distintos de las etiquetas
+PLANTILLAS = [
+    "paciente {paciente}, {edad} años, motivo {motivo}, diagnóstico {diagnostico}, tratamiento {tratamiento}",
+    "Nombre del paciente: {paciente}. Edad: {edad}. Motivo de consulta: {motivo}. Dx: {diagnostico}. Manejo: {tratamiento}.",
+    "se trata de {paciente} de {edad} años que acude por {motivo}, impresión diagnóstica {diagnostico}, se le administró {tratamiento}",
+]
+# Plantillas incompletas o narración libre: deben ir a la IA
+OTROS = [
+    "paciente {paciente}, {edad} años, motivo {motivo}, tratamiento {tratamiento}",
+    "llegamos al sitio, el paciente de unos {edad} años refiere {motivo}; se sospecha {diagnostico} y se da {tratamiento}",
+    "{paciente} con {motivo}, le dimos {tratamiento} y lo trasladamos",
+]
+
+
+def generar_corpus(
+    total: int, fraccion_plantilla: float, semilla: int = 0
+) -> list[tuple[str, dict, bool]]:
+    """(dictado, valores esperados, sigue una plantilla completa)."""
+    rng = random.Random(semilla)
+    corpus = []
+    for _ in range(total):
+        esperado = {
+            "paciente": f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+            "edad": rng.randint(1, 99),
+            "motivo": rng.choice(MOTIVOS).lower(),
+            "diagnostico": rng.choice(DIAGNOSTICOS),
+            "tratamiento": rng.choice(TRATAMIENTOS).lower(),
+        }
+        plantilla = rng.random() < fraccion_plantilla
+        texto = rng.choice(PLANTILLAS if plantilla else OTROS).format(**esperado)
+        corpus.append((texto, esperado, plantilla))
+    return corpus
+
+
+def _igual(obtenido, esperado) -> bool:
+    if isinstance(esperado, str):
+        return str(obtenido).casefold() == esperado.casefold()
+    return obtenido == esperado
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--dictados", type=int, default=5000)
+    parser.add_argument(
+        "--plantilla",
+        type=float,
+        default=0.6,
+        help="fracción de dictados con plantilla completa",
+    )
+    parser.add_argument("--umbral", type=float, default=extraccion_local.UMBRAL)
+    parser.add_argument(
+        "--latencia-ia",
+        type=float,
+        default=1.5,
+        help="segundos por llamada a la IA, para estimar el ahorro",
+    )
+    args = parser.parse_args()
+
+    corpus = generar_corpus(args.dictados, args.plantilla)
+    muestras, evitadas, correctas, campos_bien, falsas = [], 0, 0, 0, 0
+    for texto, esperado, plantilla in corpus:
+        t0 = time.perf_counter()
+        datos, confianza = extraccion_local.extraer(texto)
+        muestras.append(time.perf_counter() - t0)
+        if not extraccion_local.es_confiable(confianza, args.umbral):
+            continue
+        evitadas += 1
+        falsas += not plantilla
+        aciertos = sum(_igual(datos[campo], valor) for campo, valor in esperado.items())
+        campos_bien += aciertos
+        correctas += aciertos == len(esperado)
+
+    cuantiles = statistics.quantiles(muestras, n=100)
+    print(
+        f"{len(corpus)} dictados ({args.plantilla:.0%} con plantilla completa), umbral {args.umbral}"
+    )
+    print(
+        f"latencia      p50={cuantiles[49] * 1e6:7.1f} µs  p95={cuantiles[94] * 1e6:7.1f} µs"
+    )
+    print(
+        f"IA evitada    {evitadas / len(corpus):.1%} de las llamadas (~{evitadas * args.latencia_ia / 60:.1f} min ahorrados)"
+    )
+    if evitadas:
+        print(
+            f"exactitud     {correctas / evitadas:.1%} de dictados y {campos_bien / (evitadas * 5):.1%} de campos correctos"
+        )
+        print(f"sin plantilla aceptados por error: {falsas}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Filas por segundo al exportar e importar historias en cada formato.
+
+    python -m benchmarks.bench_intercambio --historias 200000
+"""
+
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+import db
+import intercambio
+
+
+def sembrar(total: int) -> None:
+    filas = (
+        (
+            f"HC-2026-{i + 1:07d}",
+            f"tripulacion{i % 5}",
+            f"Paciente {i}",
+            str(i % 90),
+            "Dolor torácico",
+            "Sospecha IAM",
+            "Aspirina",
+            "2026-01-01 00:00:00",
+            "incompleta",
+        )
+        for i in range(total)
+    )
+    db.importar_historias(filas)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--historias", type=int, default=200_000)
+    parser.add_argument("--lote", type=int, default=5000)
+    parser.add_argument(
+        "--memoria",
+        action="store_true",
+        help="medir el pico de memoria (tracemalloc, más lento)",
+    )
+    parser.add_argument(
+        "--formatos",
+        nargs="+",
+        default=list(intercambio.FORMATOS),
+        choices=intercambio.FORMATOS,
+    )
+    args = parser.parse_args()
+
+    print(
+        f"{'formato':>8} {'exportar filas/s':>17} {'importar filas/s':>17} {'pico MB':>8}"
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        origen = Path(tmp) / "origen.db"
+        db.configurar_db(origen)
+        db.init_db()
+        sembrar(args.historias)
+
+        for formato in args.formatos:
+            archivo = Path(tmp) / f"historias.{formato}"
+            db.configurar_db(origen)
+            if args.memoria:
+                tracemalloc.start()
+            t0 = time.perf_counter()
+            intercambio.exportar(archivo, formato, args.lote)
+            exportar = args.historias / (time.perf_counter() - t0)
+
+            db.configurar_db(Path(tmp) / f"destino_{formato}.db")
+            db.init_db()
+            t0 = time.perf_counter()
+            intercambio.importar(archivo, formato, args.lote)
+            importar = args.historias / (time.perf_counter() - t0)
+            pico = (
+                f"{tracemalloc.get_traced_memory()[1] / 1e6:.1f}"
+                if args.memoria
+                else "-"
+            )
+            tracemalloc.stop()
+            print(f"{formato:>8} {exportar:>17.0f} {importar:>17.0f} {pico:>8}")
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Latencia de los listados de historias con 100k filas.
+
+"antes": obtener_historias_por_estado sin índice y con fetchall() de todo.
+"después": obtener_historias_pagina (keyset) sobre el índice compuesto,
+midiendo la primera página y páginas profundas.
+
+    python -m benchmarks.bench_listados --historias 100000 --tamano 50
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import db
+
+INDICE = "idx_historias_usuario_estado_fecha"
+
+
+def sembrar(total: int, usuarios: int) -> None:
+    inicio = datetime(2026, 1, 1)
+    filas = (
+        (
+            f"HC-2026-{i + 1:06d}",
+            f"tripulacion{i % usuarios}",
+            f"Paciente {i}",
+            str(random.randint(0, 99)),
+            "Dolor torácico",
+            "Sospecha IAM",
+            "Aspirina",
+            (inicio + timedelta(seconds=i * 37)).strftime("%Y-%m-%d %H:%M:%S"),
+            random.choice(("incompleta", "completa")),
+        )
+        for i in range(total)
+    )
+    db.importar_historias(filas)
+
+
+def percentiles(muestras: list[float]) -> str:
+    cuantiles = statistics.quantiles(muestras, n=100)
+    return f"p50={cuantiles[49] * 1000:7.2f} ms  p95={cuantiles[94] * 1000:7.2f} ms"
+
+
+def medir(consulta, repeticiones: int) -> list[float]:
+    muestras = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        consulta()
+        muestras.append(time.perf_counter() - t0)
+    return muestras
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--historias", type=int, default=100_000)
+    parser.add_argument(
+        "--usuarios",
+        type=int,
+        default=5,
+        help="tripulaciones entre las que se reparten",
+    )
+    parser.add_argument("--tamano", type=int, default=50, help="historias por página")
+    parser.add_argument("--repeticiones", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configurar_db(Path(tmp) / "bench.db")
+        db.init_db()
+        sembrar(args.historias, args.usuarios)
+
+        def listado_completo() -> None:
+            usuario = f"tripulacion{random.randrange(args.usuarios)}"
+            db.obtener_historias_por_estado(
+                usuario, random.choice(("incompleta", "completa"))
+            )
+
+        def pagina(profundidad: int):
+            def consulta() -> None:
+                usuario = f"tripulacion{random.randrange(args.usuarios)}"
+                estado = random.choice(("incompleta", "completa"))
+                cursor = None
+                for _ in range(profundidad):
+                    _, cursor = db.obtener_historias_pagina(
+                        usuario, estado, args.tamano, cursor
+                    )
+
+            return consulta
+
+        with db.conexion() as conn:
+            conn.execute(f"DROP INDEX {INDICE}")
+            conn.execute("ANALYZE")
+        print(
+            f"antes    listado completo sin índice   {percentiles(medir(listado_completo, args.repeticiones))}"
+        )
+
+        with db.conexion() as conn:
+            conn.execute(
+                f"CREATE INDEX {INDICE} ON historias(usuario_id, estado, fecha_creacion)"
+            )
+            conn.execute("ANALYZE")
+        print(
+            f"después  listado completo con índice   {percentiles(medir(listado_completo, args.repeticiones))}"
+        )
+        print(
+            f"después  primera página (keyset)       {percentiles(medir(pagina(1), args.repeticiones))}"
+        )
+        # Una página profunda cuesta lo mismo que la primera; aquí se mide el recorrido de 10 páginas
+        print(
+            f"después  10 páginas seguidas (keyset)  {percentiles(medir(pagina(10), args.repeticiones))}"
+        )
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,152 @@
+"""
+Micro-benchmarks de las funciones calientes, sin red ni micrófono: limpieza
+del dictado, extractor local, validación y análisis con Gemini falso (caché,
+una llamada, un lote), Whisper falso sobre el audio en memoria, detección de
+voz, escrituras y lecturas de la base y el panel, sobre una base temporal con
+--historias historias sintéticas. Cada caso da p50 y p95 en ms.
+
+    python -m benchmarks.bench_micro --historias 20000 --repeticiones 200
+    python -m benchmarks.bench_micro --solo limpiar_texto extraer
+"""
+
+import argparse
+import itertools
+import logging
+import statistics
+import tempfile
+import time
+from collections.abc import Callable
+from datetime import date, timedelta
+from pathlib import Path
+
+import analitica
+import db
+import extraccion_local
+import utils_audio
+import utils_ia
+from benchmarks import entorno
+from benchmarks.bench_extraccion_local import generar_corpus
+from benchmarks.bench_transcripcion_streaming import SR
+
+
+def cronometrar(
+    funcion: Callable[[], object], repeticiones: int, calentamiento: int = 3
+) -> dict[str, float]:
+    """p50 y p95 en ms de `repeticiones` llamadas, tras unas de calentamiento."""
+    for _ in range(calentamiento):
+        funcion()
+    muestras = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        muestras.append(time.perf_counter() - t0)
+    cuantiles = (
+        statistics.quantiles(muestras, n=100) if len(muestras) > 1 else muestras * 99
+    )
+    return {"p50_ms": cuantiles[49] * 1000, "p95_ms": cuantiles[94] * 1000}
+
+
+def casos(directorio: Path) -> dict[str, Callable[[], object]]:
+    """Nombre -> función sin argumentos que hace una operación. La base ya debe estar configurada."""
+    dictados = itertools.cycle(
+        texto for texto, _, _ in generar_corpus(200, 0.5, semilla=1)
+    )
+    plantilla = "paciente Juan Pérez, 45 años, motivo dolor torácico, diagnóstico sospecha IAM, tratamiento aspirina"
+    respuesta = utils_ia.analizar_texto(plantilla)
+    contador = itertools.count()
+    audio = entorno.audios_wav(directorio, 1, 10.0)[0]
+    lectura = audio[: int(0.2 * SR)].reshape(-1, 1)
+    detector = utils_audio.DetectorVoz(SR)
+    detector.es_voz(audio[: int(0.5 * SR)])  # ya calibrado
+    hoy = date.today()
+
+    def analizar_sin_cache() -> str:
+        # Un dictado nuevo en cada llamada: siempre va al modelo (falso, sin latencia)
+        return utils_ia.analizar_texto(
+            f"{next(dictados)} {next(contador)}", umbral_local=2.0
+        )
+
+    def analizar_lote() -> dict:
+        base = next(contador)
+        textos = {
+            str(i): f"{next(dictados)} {base}-{i}" for i in range(utils_ia.MAXIMO_LOTE)
+        }
+        return utils_ia.analizar_lote(textos, umbral_local=2.0)
+
+    def guardar() -> str:
+        return db.guardar_historia(
+            None, "tripulacion0", "Paciente", "40", "Dolor", "Neumonía", "Oxígeno"
+        )
+
+    return {
+        "limpiar_texto": lambda: utils_audio.limpiar_texto(next(dictados)),
+        "extraer": lambda: extraccion_local.extraer(next(dictados)),
+        "extraer_resultado": lambda: utils_ia._extraer_resultado(respuesta),
+        "analizar_texto_cache": lambda: utils_ia.analizar_texto(
+            plantilla, umbral_local=2.0
+        ),
+        "analizar_texto_gemini": analizar_sin_cache,
+        "analizar_lote_gemini": analizar_lote,
+        "transcribir_audio_10s": lambda: utils_audio.transcribir_audio(audio),
+        "recortar_silencio_10s": lambda: utils_audio.recortar_silencio(audio),
+        "es_voz_lectura": lambda: detector.es_voz(lectura),
+        "guardar_historia": guardar,
+        "borrador_guardar": lambda: db.borrador_guardar(
+            "tripulacion0", {"motivo": f"Dolor {next(contador)}"}
+        ),
+        "pagina_historias": lambda: db.obtener_historias_pagina(
+            "tripulacion1", "incompleta", 25
+        ),
+        "buscar_historias": lambda: db.buscar_historias(
+            "tripulacion1", "dolor toracico"
+        ),
+        "panel_30_dias": lambda: analitica.panel(
+            hoy - timedelta(days=analitica.DIAS_PANEL - 1), hoy
+        ),
+    }
+
+
+def ejecutar(
+    historias: int = 20_000, repeticiones: int = 100, solo: list[str] | None = None
+) -> dict[str, dict[str, float]]:
+    """Corre los casos (todos o los de `solo`) en una base temporal y devuelve sus tiempos."""
+    # Fuera de `streamlit run` cada llamada a st.* avisa por el log
+    logging.disable(logging.WARNING)
+    resultados = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configurar_db(Path(tmp) / "bench.db")
+        db.init_db()
+        db.importar_historias(entorno.historias(historias))
+        with db.conexion() as conn:
+            conn.execute("ANALYZE")
+        try:
+            with entorno.sin_red():
+                for nombre, funcion in casos(Path(tmp)).items():
+                    if not solo or nombre in solo:
+                        resultados[nombre] = cronometrar(funcion, repeticiones)
+        finally:
+            db.cerrar_conexiones()
+            logging.disable(logging.NOTSET)
+    return resultados
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--historias", type=int, default=20_000, help="historias sintéticas en la base"
+    )
+    parser.add_argument("--repeticiones", type=int, default=100)
+    parser.add_argument("--solo", nargs="*", help="nombres de los casos a correr")
+    args = parser.parse_args()
+
+    print(f"{'caso':24} {'p50':>10} {'p95':>10}")
+    for nombre, tiempos in ejecutar(
+        args.historias, args.repeticiones, args.solo
+    ).items():
+        print(f"{nombre:24} {tiempos['p50_ms']:7.3f} ms {tiempos['p95_ms']:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
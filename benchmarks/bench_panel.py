@@ -0,0 +1,169 @@
+"""
+Panel de supervisión: latencia de armar el panel desde los resúmenes que
+mantienen los triggers (versión 3 del esquema) frente a agrupar las historias
+en cada carga, para los últimos 30 días y para todo el histórico. También mide
+lo que los triggers añaden a cada historia guardada y a la importación masiva.
+
+    python -m benchmarks.bench_panel --historias 10000 100000 1000000
+"""
+
+import argparse
+import random
+import statistics
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+
+import analitica
+import db
+
+DIAS = 500
+FIN = date(2026, 5, 15)
+DIAGNOSTICOS = (
+    "Neumonía",
+    "Sospecha IAM",
+    "Fractura de cadera",
+    "ACV",
+    "Crisis asmática",
+    "Hipoglucemia",
+    "",
+)
+
+# Lo mismo que leen db.resumen_por_dia y db.resumen_por_diagnostico, calculado sobre las historias
+CONSULTAS_DIRECTAS = (
+    """
+    SELECT substr(h.fecha_creacion, 1, 10), u.usuario, h.estado, COUNT(*)
+    FROM historias h JOIN usuarios u ON u.id = h.usuario_id
+    WHERE h.fecha_creacion >= ? AND h.fecha_creacion < ?
+    GROUP BY 1, h.usuario_id, h.estado
+    """,
+    """
+    SELECT substr(fecha_creacion, 1, 10), lower(trim(COALESCE(diagnostico, ''))), COUNT(*)
+    FROM historias WHERE fecha_creacion >= ? AND fecha_creacion < ?
+    GROUP BY 1, 2
+    """,
+)
+
+
+def filas(total: int, usuarios: int):
+    azar = random.Random(7)
+    inicio = datetime.combine(FIN - timedelta(days=DIAS - 1), datetime.min.time())
+    for i in range(total):
+        yield (
+            f"HC-2025-{i + 1:07d}",
+            f"tripulacion{i % usuarios}",
+            f"Paciente {i}",
+            str(azar.randint(0, 99)),
+            "Dolor",
+            azar.choice(DIAGNOSTICOS),
+            "Tratamiento",
+            (inicio + timedelta(seconds=azar.randint(0, DIAS * 86400 - 1))).strftime(
+                "%Y-%m-%d %H:%M:%S"
+            ),
+            azar.choice(db.ESTADOS),
+        )
+
+
+def p50(funcion, repeticiones: int) -> float:
+    muestras = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion()
+        muestras.append(time.perf_counter() - t0)
+    return statistics.median(muestras) * 1000
+
+
+def directo(desde: date, hasta: date) -> None:
+    limites = (desde.isoformat(), (hasta + timedelta(days=1)).isoformat())
+    with db.conexion() as conn:
+        for sql in CONSULTAS_DIRECTAS:
+            conn.execute(sql, limites).fetchall()
+
+
+def sin_triggers() -> list[str]:
+    """Quita los triggers de los resúmenes y devuelve su SQL para restaurarlos."""
+    with db.transaccion() as conn:
+        triggers = conn.execute(
+            "SELECT name, sql FROM sqlite_master WHERE type='trigger' AND name LIKE 'resumen_%'"
+        ).fetchall()
+        for nombre, _ in triggers:
+            conn.execute(f"DROP TRIGGER {nombre}")
+    return [sql for _, sql in triggers]
+
+
+def guardar_por_segundo(n: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(n):
+        db.guardar_historia(
+            None, "tripulacion0", "P", "40", "Dolor", "Neumonía", "T", estado="completa"
+        )
+    return n / (time.perf_counter() - inicio)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--historias", type=int, nargs="+", default=[10_000, 100_000])
+    parser.add_argument(
+        "--usuarios",
+        type=int,
+        default=20,
+        help="tripulaciones entre las que se reparten",
+    )
+    parser.add_argument(
+        "--guardados",
+        type=int,
+        default=2000,
+        help="historias guardadas una a una para medir los triggers",
+    )
+    parser.add_argument("--repeticiones", type=int, default=10)
+    args = parser.parse_args()
+
+    periodos = {
+        "30 días": (FIN - timedelta(days=analitica.DIAS_PANEL - 1), FIN),
+        "histórico": (FIN - timedelta(days=DIAS - 1), FIN),
+    }
+    print(
+        f"{'historias':>10} {'periodo':10} {'resúmenes':>11} {'agrupando':>11} {'importar':>14}"
+    )
+    for total in args.historias:
+        with tempfile.TemporaryDirectory() as tmp:
+            db.configurar_db(Path(tmp) / "bench.db")
+            db.init_db()
+            inicio = time.perf_counter()
+            db.importar_historias(filas(total, args.usuarios))
+            importadas = total / (time.perf_counter() - inicio)
+            with db.conexion() as conn:
+                conn.execute("ANALYZE")
+            for nombre, (desde, hasta) in periodos.items():
+                resumen = p50(
+                    lambda d=desde, h=hasta: analitica.panel(d, h), args.repeticiones
+                )
+                agrupando = p50(
+                    lambda d=desde, h=hasta: directo(d, h), args.repeticiones
+                )
+                print(
+                    f"{total:>10,} {nombre:10} {resumen:8.1f} ms {agrupando:8.1f} ms {importadas:>9,.0f} h/s"
+                )
+            db.cerrar_conexiones()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configurar_db(Path(tmp) / "bench.db")
+        db.init_db()
+        con = guardar_por_segundo(args.guardados)
+        restaurar = sin_triggers()
+        sin = guardar_por_segundo(args.guardados)
+        with db.transaccion() as conn:
+            for sql in restaurar:
+                conn.execute(sql)
+        print(
+            f"guardar_historia: {con:,.0f}/s con triggers, {sin:,.0f}/s sin ellos "
+            f"({(1 / con - 1 / sin) * 1e6:+.0f} µs por historia)"
+        )
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""
+Prueba de carga del servicio de transcripción: N consolas envían a la vez sus
+WAV y se mide el rendimiento y la latencia en cola con distintos números de
+procesos.
+
+Con --falso cada transcripción es CPU pura en Python (--coste iteraciones por
+segundo de audio) y compite por el GIL como lo haría Whisper dentro del
+proceso de Streamlit; sin --falso se usa Whisper (WHISPER_MODELO).
+
+    python -m benchmarks.bench_servicio_transcripcion --falso --consolas 16 --procesos 1 2 4
+    python -m benchmarks.bench_servicio_transcripcion --consolas 4 --procesos 2
+"""
+
+import argparse
+import statistics
+import tempfile
+import threading
+import time
+from functools import partial
+from pathlib import Path
+
+import servicio_transcripcion
+from benchmarks.bench_transcripcion_streaming import SR, generar_wav, leer_wav
+
+
+def iniciar_falso(hilos: int) -> None:
+    pass
+
+
+def transcribir_cpu(audio, samplerate: int, coste: int) -> str:
+    total = 0
+    for i in range(int(audio.size / samplerate * coste)):
+        total += i & 7
+    return f"{audio.size / samplerate:.1f} s ({total})"
+
+
+def _cuantiles(muestras: list[float]) -> str:
+    if len(muestras) < 2:
+        return "sin datos"
+    c = statistics.quantiles(muestras, n=100)
+    return f"p50={c[49]:6.2f} s  p95={c[94]:6.2f} s"
+
+
+def carga(servicio, audios: list, bloquear: bool) -> dict:
+    """Una consola (hilo) por audio; todas envían a la vez y esperan su texto."""
+    totales, rechazados = [], []
+    barrera = threading.Barrier(len(audios))
+
+    def consola(audio):
+        barrera.wait()
+        inicio = time.perf_counter()
+        try:
+            id_trabajo = servicio.enviar(audio, SR, bloquear=bloquear)
+        except servicio_transcripcion.ColaLlena:
+            rechazados.append(1)
+            return
+        servicio.resultado(id_trabajo)
+        totales.append(time.perf_counter() - inicio)
+
+    hilos = [threading.Thread(target=consola, args=(audio,)) for audio in audios]
+    inicio = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return {
+        "duracion": time.perf_counter() - inicio,
+        "totales": totales,
+        "rechazados": len(rechazados),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--consolas", type=int, default=8, help="WAV enviados a la vez")
+    parser.add_argument(
+        "--segundos", type=float, default=10.0, help="duración de cada WAV"
+    )
+    parser.add_argument("--procesos", type=int, nargs="+", default=[1, 2])
+    parser.add_argument(
+        "--en-cola", type=int, default=servicio_transcripcion.MAXIMO_EN_COLA
+    )
+    parser.add_argument(
+        "--sin-bloqueo", action="store_true", help="rechazar en lugar de esperar hueco"
+    )
+    parser.add_argument(
+        "--falso",
+        action="store_true",
+        help="transcripción sintética en lugar de Whisper",
+    )
+    parser.add_argument(
+        "--coste",
+        type=int,
+        default=300_000,
+        help="iteraciones por segundo de audio con --falso",
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        audios = [
+            leer_wav(generar_wav(Path(tmp) / f"dictado{i}.wav", args.segundos, i))
+            for i in range(args.consolas)
+        ]
+
+    # Los procesos importan las funciones por nombre: hay que tomarlas del módulo
+    # importable y no de __main__
+    from benchmarks import bench_servicio_transcripcion as modulo  # noqa: PLW0406
+
+    extra = (
+        {
+            "iniciar": modulo.iniciar_falso,
+            "transcribir": partial(modulo.transcribir_cpu, coste=args.coste),
+        }
+        if args.falso
+        else {}
+    )
+    print(
+        f"{args.consolas} consolas × {args.segundos:.0f} s de audio ({'falso' if args.falso else 'Whisper'})"
+    )
+    for procesos in args.procesos:
+        servicio = servicio_transcripcion.ServicioTranscripcion(
+            procesos=procesos, maximo_en_cola=args.en_cola, **extra
+        )
+        try:
+            t0 = time.perf_counter()
+            servicio.esperar_listo()
+            arranque = time.perf_counter() - t0
+            resultado = carga(servicio, audios, bloquear=not args.sin_bloqueo)
+            estadisticas = servicio.estadisticas()
+        finally:
+            servicio.cerrar()
+        hechas = len(resultado["totales"])
+        print(
+            f"procesos={procesos}  arranque {arranque:5.1f} s  "
+            f"{hechas / resultado['duracion']:5.2f} dictados/s  "
+            f"{hechas * args.segundos / resultado['duracion']:6.1f} s de audio/s  "
+            f"rechazados={resultado['rechazados']}"
+        )
+        espera = (
+            f"p50={estadisticas['espera_p50_s']:6.2f} s  p95={estadisticas['espera_p95_s']:6.2f} s"
+            if "espera_p50_s" in estadisticas
+            else "sin datos"
+        )
+        print(f"    espera en cola  {espera}")
+        print(f"    total por envío {_cuantiles(resultado['totales'])}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""
+Coste de la telemetría del dictado: microsegundos por tramo cronometrado y por
+contador, activa y desactivada, incluidos los volcados por lotes a SQLite.
+Como referencia, el tramo más corto del flujo (limpiar_texto) tarda decenas de µs.
+
+    python -m benchmarks.bench_telemetria --repeticiones 200000
+"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import db
+import telemetria
+
+
+def medir(funcion, repeticiones: int) -> float:
+    """Microsegundos por llamada."""
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--repeticiones", type=int, default=200_000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db.configurar_db(os.path.join(tmp, "telemetria.db"))
+        db.init_db()
+        registro = telemetria.Telemetria()
+
+        def con_tramo():
+            with registro.tramo("limpiar_texto"):
+                pass
+
+        def contar():
+            registro.contar("json_reparaciones")
+
+        for activa in (True, False):
+            registro.activa = activa
+            print(
+                f"{'activa' if activa else 'desactivada':12} "
+                f"tramo {medir(con_tramo, args.repeticiones):5.2f} µs  "
+                f"contador {medir(contar, args.repeticiones):5.2f} µs"
+            )
+        registro.volcar()
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Coste de entregar el audio a Whisper: buffer en memoria frente a WAV temporal.
+
+El modelo falso solo hace la parte de entrada que hace whisper.transcribe: con
+una ruta decodifica el archivo con whisper.load_audio (FFmpeg) y con un array
+lo usa tal cual. Así se mide lo que ahorra transcribir_audio() sin incluir la
+inferencia. Sin FFmpeg instalado se lee el WAV con el módulo wave.
+
+    python -m benchmarks.bench_transcripcion_memoria --segundos 10 30 --repeticiones 20
+"""
+
+import argparse
+import shutil
+import statistics
+import time
+import tracemalloc
+import wave
+
+import numpy as np
+
+import utils_audio
+
+
+class ModeloSoloEntrada:
+    def __init__(self):
+        self.con_ffmpeg = shutil.which("ffmpeg") is not None
+
+    def transcribe(self, audio, **_):
+        if isinstance(audio, str):
+            if self.con_ffmpeg:
+                import whisper
+
+                audio = whisper.load_audio(audio)
+            else:
+                with wave.open(audio, "rb") as wf:
+                    datos = np.frombuffer(
+                        wf.readframes(wf.getnframes()), dtype=np.int16
+                    )
+                audio = datos.astype(np.float32) / 32768.0
+        return {"text": f"{audio.size}"}
+
+
+def medir(funcion, audio, repeticiones: int) -> tuple[float, float]:
+    latencias = []
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        funcion(audio)
+        latencias.append(time.perf_counter() - t0)
+    tracemalloc.start()
+    funcion(audio)
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return statistics.median(latencias), pico
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--segundos", type=float, nargs="+", default=[10, 30])
+    parser.add_argument("--repeticiones", type=int, default=20)
+    args = parser.parse_args()
+
+    modelo = ModeloSoloEntrada()
+    utils_audio.modelo = modelo
+    print(
+        f"decodificación por archivo: {'FFmpeg' if modelo.con_ffmpeg else 'módulo wave (sin FFmpeg)'}"
+    )
+    print(f"{'audio s':>8} {'ruta':>8} {'mediana ms':>11} {'pico MB':>8}")
+    for segundos in args.segundos:
+        rng = np.random.default_rng(0)
+        audio = (
+            0.1 * rng.standard_normal(int(segundos * utils_audio.SAMPLERATE_WHISPER))
+        ).astype(np.float32)
+        for ruta, funcion in (
+            ("wav", utils_audio._transcribir_wav),
+            ("memoria", utils_audio.transcribir_audio),
+        ):
+            mediana, pico = medir(funcion, audio, args.repeticiones)
+            print(
+                f"{segundos:>8.0f} {ruta:>8} {mediana * 1000:>11.2f} {pico / 1e6:>8.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Tiempo hasta el texto final: transcripción por bloques durante la grabación
+frente a la transcripción del audio completo al terminar.
+
+Una fuente de audio falsa entrega cada WAV al ritmo real (dividido por
+--velocidad) y después silencio, y un modelo falso tarda
+--latencia-base + --latencia-por-segundo × segundos de audio.
+
+    python -m benchmarks.bench_transcripcion_streaming --velocidad 4
+    python -m benchmarks.bench_transcripcion_streaming --wav dictado1.wav dictado2.wav
+"""
+
+import argparse
+import logging
+import tempfile
+import time
+import wave
+from pathlib import Path
+
+import numpy as np
+
+import db
+import utils_audio
+
+SR = 16000
+
+
+def generar_wav(ruta: Path, segundos: float, semilla: int) -> Path:
+    """Dictado sintético: ráfagas de 'voz' (tonos modulados) separadas por pausas cortas."""
+    rng = np.random.default_rng(semilla)
+    t = np.arange(int(segundos * SR)) / SR
+    voz = 0.3 * np.sin(2 * np.pi * 180 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t))
+    pausas = (np.sin(2 * np.pi * 0.25 * t) > -0.9).astype(np.float32)
+    audio = voz * pausas + 0.01 * rng.standard_normal(t.size)
+    with wave.open(str(ruta), "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)
+        wf.setframerate(SR)
+        wf.writeframes((np.clip(audio, -1, 1) * 32767).astype(np.int16).tobytes())
+    return ruta
+
+
+def leer_wav(ruta) -> np.ndarray:
+    with wave.open(str(ruta), "rb") as wf:
+        return (
+            np.frombuffer(wf.readframes(wf.getnframes()), dtype=np.int16).astype(
+                np.float32
+            )
+            / 32767
+        )
+
+
+class FuenteWav:
+    """Sustituto de sd.InputStream: entrega el WAV al ritmo real y luego silencio."""
+
+    def __init__(self, audio: np.ndarray, velocidad: float):
+        self.audio = audio
+        self.velocidad = velocidad
+        self.posicion = 0
+        self.fin_voz = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self, frames):
+        time.sleep(frames / SR / self.velocidad)
+        bloque = np.zeros((frames, 1), dtype=np.float32)
+        restante = self.audio[self.posicion : self.posicion + frames]
+        bloque[: restante.size, 0] = restante
+        self.posicion += frames
+        if self.fin_voz is None and self.posicion >= self.audio.size:
+            self.fin_voz = time.perf_counter()
+        return bloque, False
+
+
+class ModeloFalso:
+    def __init__(self, base: float, por_segundo: float, velocidad: float):
+        self.base = base
+        self.por_segundo = por_segundo
+        self.velocidad = velocidad
+
+    def transcribe(self, audio, **_):
+        muestras = leer_wav(audio) if isinstance(audio, str) else np.asarray(audio)
+        segundos = muestras.size / SR
+        time.sleep((self.base + self.por_segundo * segundos) / self.velocidad)
+        return {"text": " ".join(["palabra"] * int(segundos * 2))}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--wav",
+        nargs="*",
+        help="WAV mono de 16 kHz; por defecto se generan fixtures sintéticos",
+    )
+    parser.add_argument(
+        "--segundos",
+        type=float,
+        nargs="+",
+        default=[10, 20, 28],
+        help="duración de los sintéticos",
+    )
+    parser.add_argument(
+        "--velocidad",
+        type=float,
+        default=1.0,
+        help="factor de aceleración del reloj simulado",
+    )
+    parser.add_argument("--latencia-base", type=float, default=0.5)
+    parser.add_argument("--latencia-por-segundo", type=float, default=0.25)
+    args = parser.parse_args()
+
+    # Fuera de `streamlit run` cada llamada a st.* avisa por el log
+    logging.disable(logging.WARNING)
+    utils_audio.modelo = ModeloFalso(
+        args.latencia_base, args.latencia_por_segundo, args.velocidad
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # La telemetría de guardar_y_transcribir va a una base desechable, no a historias.db
+        db.configurar_db(Path(tmp) / "bench.db")
+        db.init_db()
+        rutas = args.wav or [
+            generar_wav(Path(tmp) / f"dictado_{i}.wav", segundos, i)
+            for i, segundos in enumerate(args.segundos)
+        ]
+        print(
+            f"{'fixture':>16} {'audio s':>8} {'modo':>10} {'hasta texto final s':>20}"
+        )
+        for ruta in rutas:
+            audio = leer_wav(ruta)
+            for modo, streaming in (("lote", False), ("streaming", True)):
+                fuente = FuenteWav(audio, args.velocidad)
+                utils_audio.guardar_y_transcribir(streaming=streaming, fuente=fuente)
+                # Tiempo desde el final de la voz (incluye los 3 s de silencio que cierran la grabación)
+                espera = (time.perf_counter() - fuente.fin_voz) * args.velocidad
+                print(
+                    f"{Path(ruta).name:>16} {audio.size / SR:>8.1f} {modo:>10} {espera:>20.2f}"
+                )
+        db.cerrar_conexiones()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,284 @@
+"""
+Entorno sin red ni micrófono para los benchmarks y la prueba de carga:
+historias sintéticas, fixtures WAV, un micrófono falso y backends falsos de
+Whisper y Gemini con latencia configurable.
+
+    with entorno.sin_red(gemini=GeminiFalso(latencia=0.8), whisper=WhisperFalso(), microfono=MicrofonoFalso(audios)):
+        ...
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+import types
+import zlib
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from pathlib import Path
+
+import google.generativeai as genai
+import numpy as np
+
+import db
+import extraccion_local
+import utils_audio
+import utils_ia
+from benchmarks.bench_busqueda import (
+    APELLIDOS,
+    DIAGNOSTICOS,
+    MOTIVOS,
+    NOMBRES,
+    TRATAMIENTOS,
+)
+from benchmarks.bench_transcripcion_streaming import (
+    SR,
+    FuenteWav,
+    generar_wav,
+    leer_wav,
+)
+
+# Palabras con las que WhisperFalso arma sus transcripciones
+VOCABULARIO = sorted(
+    {
+        p.lower()
+        for frase in MOTIVOS + DIAGNOSTICOS + TRATAMIENTOS
+        for p in frase.split()
+    }
+)
+
+
+# --- Datos sintéticos ---
+def historias(
+    total: int,
+    usuarios: int = 20,
+    dias: int = 365,
+    semilla: int = 0,
+    fin: datetime | None = None,
+):
+    """Tuplas de texto en el orden de db.COLUMNAS_HISTORIA, repartidas en `dias` hasta `fin`."""
+    rng = random.Random(semilla)
+    fin = fin or datetime.now().replace(microsecond=0)
+    inicio = fin - timedelta(days=dias)
+    for i in range(total):
+        fecha = inicio + timedelta(seconds=rng.randint(0, dias * 86400))
+        yield (
+            f"HC-{fecha.year}-{i + 1:07d}",
+            f"tripulacion{i % usuarios}",
+            f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+            str(rng.randint(0, 99)),
+            rng.choice(MOTIVOS),
+            rng.choice(DIAGNOSTICOS + [""]),
+            rng.choice(TRATAMIENTOS),
+            fecha.strftime("%Y-%m-%d %H:%M:%S"),
+            rng.choice(db.ESTADOS),
+        )
+
+
+def fixtures_wav(
+    directorio: Path, segundos: tuple[float, ...] = (5.0, 10.0, 20.0)
+) -> list[Path]:
+    """Un WAV sintético de 16 kHz por duración (ver bench_transcripcion_streaming.generar_wav)."""
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return [
+        generar_wav(directorio / f"dictado_{i}.wav", duracion, i)
+        for i, duracion in enumerate(segundos)
+    ]
+
+
+def audios_wav(
+    directorio: Path, cantidad: int, segundos: float, semilla: int = 100
+) -> list[np.ndarray]:
+    """`cantidad` audios distintos (misma duración, otra semilla de ruido) ya leídos."""
+    directorio = Path(directorio)
+    directorio.mkdir(parents=True, exist_ok=True)
+    return [
+        leer_wav(
+            generar_wav(directorio / f"audio_{semilla + i}.wav", segundos, semilla + i)
+        )
+        for i in range(cantidad)
+    ]
+
+
+# --- Micrófono falso ---
+class MicrofonoFalso(types.ModuleType):
+    """
+    Sustituto del módulo sounddevice: cada InputStream entrega el siguiente audio
+    de la lista al ritmo real dividido por `velocidad` y después silencio (que
+    es lo que cierra la grabación en utils_audio.grabar_audio).
+    """
+
+    def __init__(self, audios: list[np.ndarray], velocidad: float = 1.0):
+        super().__init__("sounddevice")
+        self.audios = audios
+        self.velocidad = velocidad
+        self._siguiente = 0
+        self._lock = threading.Lock()
+
+    def InputStream(
+        self, samplerate: int = SR, channels: int = 1, **_
+    ) -> FuenteWav:  # mismo nombre que en sounddevice
+        with self._lock:
+            audio = self.audios[self._siguiente % len(self.audios)]
+            self._siguiente += 1
+        return FuenteWav(audio, self.velocidad)
+
+
+# --- Whisper falso ---
+class WhisperFalso:
+    """
+    Modelo con la interfaz de whisper (transcribe). Tarda `base` +
+    `por_segundo` × segundos de audio y devuelve unas 2,5 palabras por segundo
+    que dependen del contenido del audio: dictados distintos dan textos
+    distintos (sin aciertos de caché falsos en la IA).
+    """
+
+    def __init__(self, base: float = 0.0, por_segundo: float = 0.0):
+        self.base = base
+        self.por_segundo = por_segundo
+        self.llamadas = 0
+
+    def transcribe(self, audio, **_) -> dict:
+        muestras = (
+            leer_wav(audio)
+            if isinstance(audio, str)
+            else np.asarray(audio, dtype=np.float32)
+        )
+        segundos = muestras.size / SR
+        time.sleep(self.base + self.por_segundo * segundos)
+        self.llamadas += 1
+        rng = random.Random(
+            zlib.crc32(muestras[:: max(1, muestras.size // 4096)].tobytes())
+        )
+        return {
+            "text": " ".join(rng.choices(VOCABULARIO, k=max(1, int(segundos * 2.5))))
+        }
+
+
+# Para los procesos de servicio_transcripcion (funciones de módulo para poder enviarlas)
+def iniciar_whisper_falso(hilos: int) -> None:
+    pass
+
+
+def transcribir_falso(
+    audio: np.ndarray, samplerate: int, base: float = 0.0, por_segundo: float = 0.0
+) -> str:
+    return WhisperFalso(base, por_segundo).transcribe(audio)["text"]
+
+
+# --- Gemini falso ---
+class _Uso:
+    def __init__(self, entrada: int, salida: int):
+        self.prompt_token_count = entrada
+        self.candidates_token_count = salida
+
+
+class _Respuesta:
+    def __init__(self, texto: str, prompt: str):
+        self.text = texto
+        # Unos 4 caracteres por token, como orden de magnitud
+        self.usage_metadata = _Uso(len(prompt) // 4, len(texto) // 4)
+
+
+class GeminiFalso:
+    """
+    Sustituto de genai.GenerativeModel: GeminiFalso(...)(modelo_id) devuelve un
+    modelo cuyo generate_content() tarda `latencia` ± `fluctuacion` segundos,
+    falla con probabilidad `fallos` (ConnectionError) y responde con el esquema
+    pedido (ESQUEMA_RESULTADO o ESQUEMA_LOTE). Los campos salen del extractor
+    local si reconoce el dictado y, si no, de valores deterministas por texto.
+    """
+
+    def __init__(
+        self,
+        latencia: float = 0.0,
+        fluctuacion: float = 0.0,
+        fallos: float = 0.0,
+        semilla: int = 0,
+    ):
+        self.latencia = latencia
+        self.fluctuacion = fluctuacion
+        self.fallos = fallos
+        self._rng = random.Random(semilla)
+        self._lock = threading.Lock()
+        self.llamadas = 0
+
+    def __call__(self, modelo_id: str) -> "GeminiFalso":
+        return self
+
+    def generate_content(
+        self, prompt: str, generation_config: dict | None = None
+    ) -> _Respuesta:
+        with self._lock:
+            self.llamadas += 1
+            espera = max(
+                0.0,
+                self.latencia + self._rng.uniform(-self.fluctuacion, self.fluctuacion),
+            )
+            falla = self._rng.random() < self.fallos
+        time.sleep(espera)
+        if falla:
+            raise ConnectionError("fallo simulado de Gemini")
+        # Los prompts terminan con el dictado (o la lista JSON de dictados) tras el primer salto de línea
+        contenido = prompt.split("\n", 1)[1]
+        if (generation_config or {}).get("response_schema") is utils_ia.ESQUEMA_LOTE:
+            salida = [
+                {"id": d["id"], **self.resultado(d["texto"])}
+                for d in json.loads(contenido)
+            ]
+        else:
+            salida = self.resultado(contenido)
+        return _Respuesta(json.dumps(salida, ensure_ascii=False), prompt)
+
+    @staticmethod
+    def resultado(texto: str) -> dict:
+        datos, confianza = extraccion_local.extraer(texto)
+        rng = random.Random(zlib.crc32(texto.encode()))
+        inventados = {
+            "paciente": f"{rng.choice(NOMBRES)} {rng.choice(APELLIDOS)}",
+            "edad": rng.randint(1, 99),
+            "motivo": rng.choice(MOTIVOS),
+            "diagnostico": rng.choice(DIAGNOSTICOS),
+            "tratamiento": rng.choice(TRATAMIENTOS),
+        }
+        return {"texto_corregido": datos["texto_corregido"]} | {
+            campo: datos[campo] if confianza[campo] else inventados[campo]
+            for campo in extraccion_local.CAMPOS
+        }
+
+
+# --- Entorno ---
+@contextmanager
+def sin_red(
+    gemini: GeminiFalso | None = None,
+    whisper: WhisperFalso | None = None,
+    microfono: MicrofonoFalso | None = None,
+):
+    """
+    Sustituye Gemini (genai.GenerativeModel), el modelo Whisper del proceso y el
+    micrófono (sounddevice) mientras dura el bloque; al salir deja lo que había.
+    La caché de análisis, el interruptor y las métricas de modelos se vacían al
+    entrar para que cada medición empiece igual.
+    """
+    anteriores = (
+        genai.GenerativeModel,
+        utils_audio.modelo,
+        sys.modules.get("sounddevice"),
+    )
+    genai.GenerativeModel = gemini or GeminiFalso()
+    utils_audio.modelo = whisper or WhisperFalso()
+    if microfono is not None:
+        sys.modules["sounddevice"] = microfono
+    utils_ia.cache.limpiar()
+    utils_ia.interruptor.reiniciar()
+    utils_ia.metricas.reiniciar()
+    try:
+        yield
+    finally:
+        genai.GenerativeModel, utils_audio.modelo = anteriores[0], anteriores[1]
+        if anteriores[2] is not None:
+            sys.modules["sounddevice"] = anteriores[2]
+        else:
+            sys.modules.pop("sounddevice", None)
@@ -0,0 +1,190 @@
+"""
+Línea base de rendimiento sin red ni micrófono: corre los micro-benchmarks
+(bench_micro) y la prueba de carga de la app (bench_carga_app), guarda las
+métricas en un JSON y compara dos ejecuciones marcando las regresiones que
+superan el umbral. `comparar` termina con código 1 si hay alguna.
+
+    python -m benchmarks.linea_base medir --salida linea_base.json
+    python -m benchmarks.linea_base medir --salida actual.json --rapido
+    python -m benchmarks.linea_base comparar linea_base.json actual.json --umbral 0.25
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+from datetime import datetime
+from pathlib import Path
+
+from benchmarks import bench_carga_app, bench_micro
+
+VERSION = 1
+# Cambio relativo a partir del cual una métrica cuenta como regresión
+UMBRAL = 0.25
+# Diferencias menores que esto (en ms) son ruido aunque superen el umbral relativo
+MINIMO_MS = 0.05
+
+PARAMETROS = {"historias": 20_000, "repeticiones": 100, "sesiones": 4, "flujos": 2}
+PARAMETROS_RAPIDOS = {
+    "historias": 5_000,
+    "repeticiones": 30,
+    "sesiones": 2,
+    "flujos": 1,
+}
+
+
+# --- Medición ---
+def medir(
+    historias: int, repeticiones: int, sesiones: int, flujos: int, carga: bool = True
+) -> dict:
+    """Corre todo y devuelve el documento de la línea base (métricas planas: grupo.caso.métrica)."""
+    metricas = {}
+    for caso, tiempos in bench_micro.ejecutar(historias, repeticiones).items():
+        for nombre, valor in tiempos.items():
+            metricas[f"micro.{caso}.{nombre}"] = valor
+    if carga:
+        resultados = bench_carga_app.ejecutar(sesiones, flujos, historias)
+        flujo = resultados.pop("flujo")
+        for paso, tiempos in resultados.items():
+            for nombre, valor in tiempos.items():
+                metricas[f"carga.{paso}.{nombre}"] = valor
+        metricas["carga.flujos_por_s"] = flujo["flujos_por_s"]
+        metricas["carga.errores"] = flujo["errores"]
+    return {
+        "version": VERSION,
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "entorno": {
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "parametros": {
+            "historias": historias,
+            "repeticiones": repeticiones,
+            "sesiones": sesiones,
+            "flujos": flujos,
+        },
+        "metricas": metricas,
+    }
+
+
+# --- Comparación ---
+def mayor_es_mejor(nombre: str) -> bool:
+    return nombre.endswith("_por_s")
+
+
+def comparar(
+    base: dict, actual: dict, umbral: float = UMBRAL, minimo_ms: float = MINIMO_MS
+) -> list[tuple]:
+    """
+    (métrica, antes, después, cambio relativo, estado) por métrica, con estado
+    "regresión", "mejora", "igual", "nueva" o "eliminada". El cambio es positivo
+    cuando la métrica empeora (más ms o errores, menos por segundo).
+    """
+    antes, despues = base["metricas"], actual["metricas"]
+    filas = []
+    for nombre in sorted(antes.keys() | despues.keys()):
+        if nombre not in despues:
+            filas.append((nombre, antes[nombre], None, None, "eliminada"))
+            continue
+        if nombre not in antes:
+            filas.append((nombre, None, despues[nombre], None, "nueva"))
+            continue
+        a, d = antes[nombre], despues[nombre]
+        if a == d:
+            filas.append((nombre, a, d, 0.0, "igual"))
+            continue
+        cambio = (
+            ((a - d) if mayor_es_mejor(nombre) else (d - a)) / a if a else float("inf")
+        )
+        ruido = nombre.endswith("_ms") and abs(d - a) < minimo_ms
+        if ruido or abs(cambio) <= umbral:
+            estado = "igual"
+        else:
+            estado = "regresión" if cambio > 0 else "mejora"
+        filas.append((nombre, a, d, cambio, estado))
+    return filas
+
+
+def _valor(valor) -> str:
+    return "—" if valor is None else f"{valor:.3f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    comandos = parser.add_subparsers(dest="comando", required=True)
+    medicion = comandos.add_parser(
+        "medir", help="corre los benchmarks y guarda el JSON"
+    )
+    medicion.add_argument("--salida", type=Path, default=Path("linea_base.json"))
+    medicion.add_argument(
+        "--rapido", action="store_true", help="menos historias, repeticiones y sesiones"
+    )
+    medicion.add_argument(
+        "--sin-carga", action="store_true", help="solo los micro-benchmarks"
+    )
+    for nombre, valor in PARAMETROS.items():
+        medicion.add_argument(
+            f"--{nombre}",
+            type=int,
+            help=f"por defecto {valor} ({PARAMETROS_RAPIDOS[nombre]} con --rapido)",
+        )
+    comparacion = comandos.add_parser(
+        "comparar", help="compara dos JSON y marca las regresiones"
+    )
+    comparacion.add_argument("base", type=Path)
+    comparacion.add_argument("actual", type=Path)
+    comparacion.add_argument(
+        "--umbral",
+        type=float,
+        default=UMBRAL,
+        help="cambio relativo tolerado (0.25 = 25 %%)",
+    )
+    comparacion.add_argument(
+        "--minimo-ms",
+        type=float,
+        default=MINIMO_MS,
+        help="diferencia en ms que se considera ruido",
+    )
+    args = parser.parse_args()
+
+    if args.comando == "medir":
+        parametros = PARAMETROS_RAPIDOS if args.rapido else PARAMETROS
+        parametros = {
+            nombre: getattr(args, nombre) or valor
+            for nombre, valor in parametros.items()
+        }
+        documento = medir(**parametros, carga=not args.sin_carga)
+        args.salida.write_text(
+            json.dumps(documento, indent=2, ensure_ascii=False) + "\n", encoding="utf-8"
+        )
+        print(f"{len(documento['metricas'])} métricas en {args.salida}")
+        return
+
+    base = json.loads(args.base.read_text(encoding="utf-8"))
+    actual = json.loads(args.actual.read_text(encoding="utf-8"))
+    if base["parametros"] != actual["parametros"]:
+        print(
+            f"⚠️ Parámetros distintos: {base['parametros']} frente a {actual['parametros']}"
+        )
+    filas = comparar(base, actual, args.umbral, args.minimo_ms)
+    print(f"{'métrica':40} {'base':>10} {'actual':>10} {'cambio':>8}  estado")
+    for nombre, antes, despues, cambio, estado in filas:
+        porcentaje = "" if cambio is None else f"{cambio:+.0%}"
+        print(
+            f"{nombre:40} {_valor(antes):>10} {_valor(despues):>10} {porcentaje:>8}  {estado}"
+        )
+    regresiones = [fila[0] for fila in filas if fila[4] == "regresión"]
+    if regresiones:
+        print(
+            f"{len(regresiones)} regresiones por encima del {args.umbral:.0%}: {', '.join(regresiones)}"
+        )
+        sys.exit(1)
+    print("Sin regresiones.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+limpiar_texto: implementación original (recompila el patrón y hace cuatro
+pasadas con re.sub) frente al normalizador precompilado de una sola pasada.
+
+    python -m pytest benchmarks/test_bench_limpiar_texto.py --benchmark-group-by=param:tamano
+"""
+
+import random
+import re
+
+import pytest
+
+import normalizacion
+
+pytest.importorskip("pytest_benchmark")
+
+PALABRAS = [
+    "paciente",
+    "con",
+    "dolor",
+    "torácico",
+    "de",
+    "dos",
+    "horas",
+    "TA",
+    "120/80",
+    "FC",
+    "95",
+    "refiere",
+    "disnea",
+]
+MULETILLAS = ["eh", "este", "pues", "o sea", "mmm"]
+
+
+def limpiar_texto_original(texto):
+    muletillas = ["eh", "este", "pues", "o sea", "mmm", "ajá", "em", "ah"]
+    pattern = r"\b(?:" + "|".join(re.escape(m) for m in muletillas) + r")\b"
+    limpio = re.sub(pattern, "", texto, flags=re.IGNORECASE)
+    limpio = re.sub(r"\s+", " ", limpio)
+    limpio = re.sub(r"\s+,", ",", limpio)
+    limpio = re.sub(r",+", ",", limpio)
+    return limpio.strip()
+
+
+def dictados(cantidad: int, palabras: int, semilla: int = 0) -> list[str]:
+    rng = random.Random(semilla)
+    textos = []
+    for _ in range(cantidad):
+        tokens = [
+            rng.choice(MULETILLAS) if rng.random() < 0.15 else rng.choice(PALABRAS)
+            for _ in range(palabras)
+        ]
+        textos.append(" ".join(t + ("," if rng.random() < 0.1 else "") for t in tokens))
+    return textos
+
+
+# (dictados, palabras por dictado): fragmentos cortos del streaming y dictados completos
+CASOS = {"fragmentos": (2000, 12), "dictados": (200, 250)}
+
+
+@pytest.mark.parametrize("tamano", CASOS)
+def test_original(benchmark, tamano):
+    textos = dictados(*CASOS[tamano])
+    benchmark(lambda: [limpiar_texto_original(t) for t in textos])
+
+
+@pytest.mark.parametrize("tamano", CASOS)
+def test_normalizador(benchmark, tamano):
+    textos = dictados(*CASOS[tamano])
+    normalizador = normalizacion.Normalizador(abreviaturas={})
+    resultado = benchmark(normalizador.limpiar_lote, textos)
+    assert resultado == [limpiar_texto_original(t) for t in textos]
+
+
+@pytest.mark.parametrize("tamano", CASOS)
+def test_normalizador_con_abreviaturas(benchmark, tamano):
+    textos = dictados(*CASOS[tamano])
+    benchmark(normalizacion.limpiar_textos, textos)
@@ -0,0 +1,143 @@
+import logging
+import threading
+import time
+from collections.abc import Callable
+
+import db
+
+log = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Segundos sin cambios antes de escribir y tope desde el primer cambio sin escribir:
+# como mucho una escritura cada ESPERA_MAXIMA segundos mientras se edita sin pausa
+ESPERA = 2.0
+ESPERA_MAXIMA = 10.0
+
+
+class AutoguardadoBorrador:
+    """
+    Autoguardado con rebote (debounce) del borrador de un usuario. actualizar()
+    recibe el estado del formulario en cada ejecución; los campos que cambiaron
+    desde la última escritura se acumulan y se escriben juntos cuando pasan
+    `espera` segundos sin cambios nuevos, o `espera_maxima` desde el primero.
+
+    Con `temporizador=True` un threading.Timer escribe solo (uso en la app); sin
+    él quien llama invoca procesar(ahora) con su propio reloj (pruebas, benchmarks).
+    """
+
+    def __init__(
+        self,
+        usuario: str,
+        guardado: dict[str, str] | None = None,
+        espera: float = ESPERA,
+        espera_maxima: float = ESPERA_MAXIMA,
+        guardar: Callable[[str, dict[str, str]], object] = db.borrador_guardar,
+        temporizador: bool = True,
+    ):
+        self.usuario = usuario
+        self.espera = espera
+        self.espera_maxima = espera_maxima
+        self._guardar = guardar
+        self._usar_temporizador = temporizador
+        # Último estado escrito y cambios aún sin escribir
+        self._guardado = {
+            campo: valor
+            for campo, valor in (guardado or {}).items()
+            if campo in db.CAMPOS_BORRADOR
+        }
+        self._pendiente: dict[str, str] = {}
+        self._primer_cambio: float | None = None
+        self._ultimo_cambio: float | None = None
+        self._temporizador: threading.Timer | None = None
+        # Reentrante: la escritura se hace con el lock tomado para que descartar() no la cruce
+        self._lock = threading.RLock()
+        self.escrituras = 0
+        self.campos_escritos = 0
+
+    def actualizar(self, campos: dict[str, str], ahora: float | None = None) -> None:
+        """Registra el estado actual del formulario; cada cambio nuevo aplaza la escritura."""
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            hubo_cambio = False
+            for campo, valor in campos.items():
+                if campo not in db.CAMPOS_BORRADOR:
+                    continue
+                valor = "" if valor is None else str(valor)
+                if self._guardado.get(campo, "") == valor:
+                    hubo_cambio |= self._pendiente.pop(campo, None) is not None
+                elif self._pendiente.get(campo) != valor:
+                    self._pendiente[campo] = valor
+                    hubo_cambio = True
+            if not self._pendiente:
+                self._cancelar()
+                return
+            if hubo_cambio:
+                if self._primer_cambio is None:
+                    self._primer_cambio = ahora
+                self._ultimo_cambio = ahora
+                self._programar(ahora)
+
+    def _vence(self) -> float:
+        if self._primer_cambio is None:
+            # Pendiente de una escritura fallida: se reintenta en cuanto se pueda
+            return float("-inf")
+        return min(
+            self._ultimo_cambio + self.espera, self._primer_cambio + self.espera_maxima
+        )
+
+    def _programar(self, ahora: float) -> None:
+        if not self._usar_temporizador:
+            return
+        self._cancelar()
+        self._temporizador = threading.Timer(
+            max(0.0, self._vence() - ahora), self.vaciar
+        )
+        self._temporizador.daemon = True
+        self._temporizador.start()
+
+    def _cancelar(self) -> None:
+        if self._temporizador is not None:
+            self._temporizador.cancel()
+            self._temporizador = None
+        if not self._pendiente:
+            self._primer_cambio = self._ultimo_cambio = None
+
+    def procesar(self, ahora: float | None = None) -> bool:
+        """Escribe si ya venció la espera. Devuelve True si escribió."""
+        ahora = time.monotonic() if ahora is None else ahora
+        with self._lock:
+            if not self._pendiente or ahora < self._vence():
+                return False
+            return self.vaciar()
+
+    def vaciar(self) -> bool:
+        """Escribe ya los cambios pendientes (p. ej. tras el análisis con IA). Devuelve True si escribió."""
+        with self._lock:
+            pendiente = self._pendiente
+            self._pendiente = {}
+            self._cancelar()
+            if not pendiente:
+                return False
+            try:
+                self._guardar(self.usuario, pendiente)
+            except Exception:
+                log.exception("No se pudo guardar el borrador de %s", self.usuario)
+                # Se reintenta con el próximo cambio o procesar()
+                self._pendiente = {**pendiente, **self._pendiente}
+                return False
+            self._guardado.update(pendiente)
+            self.escrituras += 1
+            self.campos_escritos += len(pendiente)
+            return True
+
+    def descartar(self) -> None:
+        """Olvida lo pendiente y lo guardado (tras guardar la historia o descartar el borrador)."""
+        with self._lock:
+            self._pendiente = {}
+            self._guardado = {}
+            self._cancelar()
+
+    @property
+    def pendiente(self) -> dict[str, str]:
+        with self._lock:
+            return dict(self._pendiente)
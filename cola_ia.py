@@ -0,0 +1,141 @@
+import json
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+
+import db
+import utils_ia
+
+log = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Dictados por llamada al modelo
+TAMANO_LOTE = 5
+# Segundos entre revisiones de la cola cuando no hay trabajo
+INTERVALO = 5.0
+# Espera exponencial tras un fallo: RETARDO_BASE * 2^intentos, hasta RETARDO_MAXIMO
+RETARDO_BASE = 30.0
+RETARDO_MAXIMO = 30 * 60.0
+
+
+class TrabajadorCola:
+    """
+    Vacía la tabla cola_ia en segundo plano: agrupa los dictados pendientes,
+    los analiza en una sola llamada y completa las historias correspondientes.
+    Si la llamada falla (sin conexión, modelos caídos) los trabajos se
+    reprograman con espera exponencial y el trabajador también se pausa, para
+    no insistir mientras la ambulancia está sin señal.
+    """
+
+    def __init__(
+        self,
+        analizar: Callable[[dict[str, str]], dict[str, str]] = utils_ia.analizar_lote,
+        tamano_lote: int = TAMANO_LOTE,
+        intervalo: float = INTERVALO,
+        retardo_base: float = RETARDO_BASE,
+        retardo_maximo: float = RETARDO_MAXIMO,
+    ):
+        self.analizar = analizar
+        self.tamano_lote = tamano_lote
+        self.intervalo = intervalo
+        self.retardo_base = retardo_base
+        self.retardo_maximo = retardo_maximo
+        self.ultimo_error: str | None = None
+        self._fallos_seguidos = 0
+        self._pausa_hasta = 0.0
+        self._latencias: deque[float] = deque(maxlen=100)
+        self._detener = threading.Event()
+        self._hilo: threading.Thread | None = None
+
+    def procesar_una_vez(self, ahora: float | None = None) -> int:
+        """Procesa un lote de trabajos vencidos. Devuelve cuántos se completaron."""
+        ahora = time.time() if ahora is None else ahora
+        if ahora < self._pausa_hasta:
+            return 0
+        trabajos = db.cola_ia_pendientes(ahora, self.tamano_lote)
+        if not trabajos:
+            return 0
+
+        try:
+            resultados = self.analizar(
+                {str(id_trabajo): texto for id_trabajo, _, texto, _, _ in trabajos}
+            )
+        except Exception as e:  # noqa: BLE001
+            # Sin conexión o modelos caídos: se reprograma
+            self.ultimo_error = str(e)[:200]
+            log.warning(
+                "Análisis en cola fallido (%d trabajos): %s",
+                len(trabajos),
+                self.ultimo_error,
+            )
+            db.cola_ia_reprogramar(
+                (t[0] for t in trabajos),
+                ahora,
+                self.retardo_base,
+                self.retardo_maximo,
+                self.ultimo_error,
+            )
+            self._pausa_hasta = ahora + min(
+                self.retardo_maximo, self.retardo_base * 2**self._fallos_seguidos
+            )
+            self._fallos_seguidos += 1
+            return 0
+
+        self._fallos_seguidos = 0
+        self.ultimo_error = None
+        completados, faltantes = 0, []
+        for id_trabajo, consecutivo, _, _, creado in trabajos:
+            salida = resultados.get(str(id_trabajo))
+            if salida is None:
+                faltantes.append(id_trabajo)
+                continue
+            db.cola_ia_completar(id_trabajo, consecutivo, json.loads(salida))
+            self._latencias.append(time.time() - creado)
+            completados += 1
+        if faltantes:
+            db.cola_ia_reprogramar(
+                faltantes,
+                ahora,
+                self.retardo_base,
+                self.retardo_maximo,
+                "Sin respuesta del modelo",
+            )
+        return completados
+
+    def _ciclo(self) -> None:
+        while not self._detener.is_set():
+            try:
+                procesados = self.procesar_una_vez()
+            except Exception:
+                log.exception("Error inesperado en el trabajador de la cola")
+                procesados = 0
+            if not procesados:
+                self._detener.wait(self.intervalo)
+
+    def iniciar(self) -> None:
+        if self._hilo is not None and self._hilo.is_alive():
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._ciclo, name="cola-ia", daemon=True)
+        self._hilo.start()
+
+    def detener(self, espera: float | None = 5.0) -> None:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(espera)
+            self._hilo = None
+
+    def estadisticas(self) -> dict:
+        """Profundidad de la cola, antigüedad del trabajo más viejo y latencia de proceso."""
+        pendientes, mas_antiguo = db.cola_ia_estado()
+        latencias = sorted(self._latencias)
+        return {
+            "pendientes": pendientes,
+            "antiguedad_s": (
+                time.time() - mas_antiguo if mas_antiguo is not None else 0.0
+            ),
+            "latencia_p50_s": latencias[len(latencias) // 2] if latencias else None,
+            "ultimo_error": self.ultimo_error,
+        }
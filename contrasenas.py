@@ -0,0 +1,70 @@
+import base64
+import hashlib
+import hmac
+import os
+from functools import lru_cache
+
+# --- Hash de contraseñas (scrypt) ---
+# Formato guardado: scrypt$<n>$<r>$<p>$<sal>$<hash> (sal y hash en base64).
+# N es el coste: cada duplicación dobla el tiempo y la memoria de un login.
+# Ajustarlo en el servidor con `python -m benchmarks.bench_contrasenas`.
+SCRYPT_N = int(os.environ.get("SCRYPT_N", str(2**15)))
+SCRYPT_R = 8
+SCRYPT_P = 1
+LARGO_SAL = 16
+LARGO_HASH = 32
+PREFIJO = "scrypt$"
+
+
+def _b64(datos: bytes) -> str:
+    return base64.b64encode(datos).decode("ascii")
+
+
+def _derivar(contrasena: str, sal: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(
+        contrasena.encode("utf-8"),
+        salt=sal,
+        n=n,
+        r=r,
+        p=p,
+        maxmem=2 * 128 * n * r + 2**20,
+        dklen=LARGO_HASH,
+    )
+
+
+def hashear(
+    contrasena: str, n: int | None = None, r: int = SCRYPT_R, p: int = SCRYPT_P
+) -> str:
+    n = n or SCRYPT_N
+    sal = os.urandom(LARGO_SAL)
+    return (
+        f"{PREFIJO}{n}${r}${p}${_b64(sal)}${_b64(_derivar(contrasena, sal, n, r, p))}"
+    )
+
+
+def verificar(contrasena: str, almacenado: str) -> bool:
+    """Compara en tiempo constante; un valor guardado mal formado nunca valida."""
+    try:
+        _, n, r, p, sal, esperado = almacenado.split("$")
+        calculado = _derivar(contrasena, base64.b64decode(sal), int(n), int(r), int(p))
+        return hmac.compare_digest(calculado, base64.b64decode(esperado))
+    except (ValueError, TypeError):
+        return False
+
+
+def necesita_rehash(almacenado: str, n: int | None = None) -> bool:
+    """True si el hash se creó con otro coste (p. ej. tras subir SCRYPT_N)."""
+    try:
+        _, coste, r, p, _, _ = almacenado.split("$")
+        return (int(coste), int(r), int(p)) != (n or SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    except ValueError:
+        return True
+
+
+@lru_cache(maxsize=1)
+def hash_senuelo() -> str:
+    """
+    Hash de una contraseña que nadie tiene: se verifica contra él cuando el usuario
+    no existe, para que la respuesta tarde lo mismo y no revele qué usuarios hay.
+    """
+    return hashear(_b64(os.urandom(LARGO_SAL)))
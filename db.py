@@ -1,13 +1,238 @@
+import math
+import os
+import re
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Iterator
+from contextlib import contextmanager, nullcontext
 from datetime import datetime
-from typing import Any
+from itertools import islice
+from typing import Any, NamedTuple
+
+import contrasenas
+
+# --- Configuración de la conexión ---
+# La ruta se puede cambiar con la variable de entorno HISTORIAS_DB o con configurar_db()
+DB_PATH = os.environ.get("HISTORIAS_DB", "historias.db")
+
+# WAL permite lectores concurrentes con un escritor; busy_timeout hace que los
+# escritores esperen el bloqueo en lugar de fallar con "database is locked".
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+
+
+# Sentencias ejecutadas por cada hilo (ver instrumentacion.py); el callback de
+# SQLite corre en el hilo que ejecuta la sentencia
+_consultas = threading.local()
+
+
+def _contar_consulta(_sql: str) -> None:
+    _consultas.total = getattr(_consultas, "total", 0) + 1
+
+
+def consultas_del_hilo() -> int:
+    return getattr(_consultas, "total", 0)
+
+
+class PoolConexiones:
+    """
+    Pool de conexiones SQLite reutilizables.
+    Streamlit ejecuta cada rerun en un hilo nuevo, así que las conexiones se
+    prestan y devuelven al pool en lugar de quedar atadas a un hilo concreto.
+    """
+
+    def __init__(self, ruta: str, maximo: int = 8):
+        self.ruta = ruta
+        self.maximo = maximo
+        self._libres: list[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        self._generacion = 0
+
+    def _abrir(self) -> sqlite3.Connection:
+        # isolation_level=None: las transacciones se abren explícitamente en transaccion()
+        # cached_statements: la conexión reutiliza las sentencias preparadas por texto SQL
+        conn = sqlite3.connect(
+            self.ruta,
+            timeout=5.0,
+            isolation_level=None,
+            check_same_thread=False,
+            cached_statements=256,
+        )
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        conn.set_trace_callback(_contar_consulta)
+        return conn
+
+    def tomar(self) -> tuple[sqlite3.Connection, int]:
+        with self._lock:
+            generacion = self._generacion
+            if self._libres:
+                return self._libres.pop(), generacion
+        return self._abrir(), generacion
+
+    def devolver(self, conn: sqlite3.Connection, generacion: int) -> None:
+        if conn.in_transaction:
+            conn.rollback()
+        with self._lock:
+            if generacion == self._generacion and len(self._libres) < self.maximo:
+                self._libres.append(conn)
+                return
+        conn.close()
+
+    def cerrar(self) -> None:
+        """Cierra las conexiones libres; las prestadas se cierran al devolverse."""
+        with self._lock:
+            self._generacion += 1
+            libres, self._libres = self._libres, []
+        for conn in libres:
+            conn.close()
+
+
+_pool = PoolConexiones(DB_PATH)
+_local = threading.local()
+# Si este proceso ya llevó la base configurada a la última versión del esquema
+_esquema_al_dia = False
+
+
+def configurar_db(ruta: str, maximo: int = 8) -> None:
+    """Apunta la capa de datos a otra base de datos (p. ej. en pruebas)."""
+    global DB_PATH, _pool, _esquema_al_dia
+    DB_PATH = str(ruta)
+    _pool.cerrar()
+    _pool = PoolConexiones(DB_PATH, maximo)
+    _esquema_al_dia = False
+    _olvidar_usuarios()
+
+
+def cerrar_conexiones() -> None:
+    _pool.cerrar()
+
+
+@contextmanager
+def conexion() -> Iterator[sqlite3.Connection]:
+    """
+    Presta una conexión del pool. Si el hilo ya tiene una prestada (llamadas
+    anidadas) se reutiliza la misma para no abrir otra ni romper la transacción.
+    """
+    actual = getattr(_local, "conn", None)
+    if actual is not None:
+        yield actual
+        return
+
+    pool = _pool
+    conn, generacion = pool.tomar()
+    _local.conn = conn
+    try:
+        yield conn
+    finally:
+        _local.conn = None
+        pool.devolver(conn, generacion)
+
+
+@contextmanager
+def transaccion(modo: str = "IMMEDIATE") -> Iterator[sqlite3.Connection]:
+    """Abre una transacción (BEGIN IMMEDIATE por defecto) y hace commit o rollback."""
+    with conexion() as conn:
+        if conn.in_transaction:
+            # Transacción anidada: la gestiona quien la abrió
+            yield conn
+            return
+        conn.execute(f"BEGIN {modo}")
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+
+# --- Esquema y migraciones ---
+# La versión del esquema se guarda en PRAGMA user_version. Cada migración lleva
+# la base de la versión anterior a la suya, una sola vez y en orden.
+EDAD_MAXIMA = 130
+ESTADOS = ("incompleta", "completa")
+# Fecha de las historias antiguas sin fecha reconocible
+FECHA_DESCONOCIDA = "1970-01-01 00:00:00"
+TAMANO_LOTE_MIGRACION = 5000
+
+
+class Migracion(NamedTuple):
+    version: int
+    descripcion: str
+    # Se ejecuta dentro de la transacción que sube user_version
+    aplicar: Callable[[sqlite3.Connection], None]
+    # Trabajo previo opcional en lotes cortos (tamano_lote, pausa, progreso), para
+    # que en bases grandes la transacción final sea breve y la app siga escribiendo
+    preparar: (
+        Callable[[int, float, Callable[[int, int], object] | None], None] | None
+    ) = None
 
 
 def init_db():
-    conn = sqlite3.connect("historias.db")
-    c = conn.cursor()
+    migrar()
+    # Reparaciones idempotentes: índice de búsqueda borrado y contraseñas en
+    # texto plano insertadas a mano
+    with transaccion() as conn:
+        _crear_indice_busqueda(conn)
+        _migrar_contrasenas(conn)
+
+
+def version_esquema() -> int:
+    with conexion() as conn:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrar(
+    hasta: int | None = None,
+    tamano_lote: int = TAMANO_LOTE_MIGRACION,
+    pausa: float = 0.0,
+    progreso: Callable[[int, int], object] | None = None,
+) -> list[int]:
+    """
+    Aplica en orden las migraciones pendientes (hasta la versión `hasta`, o
+    todas). Devuelve las versiones aplicadas. Si dos procesos migran a la vez,
+    el segundo ve la versión ya subida y no repite nada.
+    """
+    global _esquema_al_dia
+    aplicadas = []
+    for migracion in MIGRACIONES:
+        if hasta is not None and migracion.version > hasta:
+            break
+        if migracion.version <= version_esquema():
+            continue
+        if migracion.preparar is not None:
+            migracion.preparar(tamano_lote, pausa, progreso)
+        with transaccion() as conn:
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= migracion.version:
+                continue
+            migracion.aplicar(conn)
+            conn.execute(f"PRAGMA user_version={migracion.version:d}")
+        aplicadas.append(migracion.version)
+    if version_esquema() >= MIGRACIONES[-1].version:
+        _esquema_al_dia = True
+    return aplicadas
+
 
-    c.execute("""
+def esquema_al_dia() -> bool:
+    """
+    True si este proceso ya migró la base configurada (init_db o migrar). No abre
+    la base: quien escribe de fondo, como la telemetría, no la crea ni la cambia.
+    """
+    return _esquema_al_dia
+
+
+def _esquema_inicial(conn: sqlite3.Connection) -> None:
+    """Versión 1: el esquema de texto que creaba init_db() antes de las migraciones."""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS usuarios (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             usuario TEXT UNIQUE,
@@ -15,7 +240,7 @@ def init_db():
         )
     """)
 
-    c.execute("""
+    conn.execute("""
         CREATE TABLE IF NOT EXISTS historias (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             consecutivo TEXT,
@@ -29,65 +254,1188 @@ def init_db():
             estado TEXT
         )
     """)
-    conn.commit()
-    conn.close()
+
+    # Contador por año para los consecutivos (HC-<año>-<n>)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS secuencias (
+            anio INTEGER PRIMARY KEY,
+            ultimo INTEGER NOT NULL
+        )
+    """)
+    # Listados por tripulación y estado, del más reciente al más antiguo
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_historias_usuario_estado_fecha ON historias(usuario, estado, fecha_creacion)"
+    )
+
+    # Caché persistente de resultados de la IA (ver utils_ia.CacheAnalisis)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cache_ia (
+            clave TEXT PRIMARY KEY,
+            valor TEXT NOT NULL,
+            creado REAL NOT NULL,
+            usado REAL NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_ia_usado ON cache_ia(usado)")
+
+    # Cola local de dictados pendientes de análisis (ver cola_ia.TrabajadorCola)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS cola_ia (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            consecutivo TEXT NOT NULL,
+            texto TEXT NOT NULL,
+            intentos INTEGER NOT NULL DEFAULT 0,
+            proximo REAL NOT NULL,
+            creado REAL NOT NULL,
+            error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_cola_ia_proximo ON cola_ia(proximo)")
+
+    # Muletillas propias de cada usuario (ver normalizacion.obtener_normalizador)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS muletillas_usuario (
+            usuario TEXT NOT NULL,
+            muletilla TEXT NOT NULL,
+            PRIMARY KEY (usuario, muletilla)
+        )
+    """)
+
+    # Puntos de control del reanálisis masivo (ver reanalisis.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reanalisis_puntos (
+            nombre TEXT PRIMARY KEY,
+            ultimo_id INTEGER NOT NULL,
+            procesadas INTEGER NOT NULL,
+            errores INTEGER NOT NULL,
+            actualizado REAL NOT NULL
+        )
+    """)
+
+    # Un borrador por usuario del formulario de nueva historia (ver borradores.py)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS borradores (
+            usuario TEXT PRIMARY KEY,
+            paciente TEXT NOT NULL DEFAULT '',
+            edad TEXT NOT NULL DEFAULT '',
+            motivo TEXT NOT NULL DEFAULT '',
+            diagnostico TEXT NOT NULL DEFAULT '',
+            tratamiento TEXT NOT NULL DEFAULT '',
+            texto_libre TEXT NOT NULL DEFAULT '',
+            texto_corregido TEXT NOT NULL DEFAULT '',
+            actualizado REAL NOT NULL
+        )
+    """)
+
+    # Histogramas de duración por tramo del dictado y contadores (ver telemetria.py);
+    # `limite` es el límite superior del cubo en segundos
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metricas_tramos (
+            nombre TEXT NOT NULL,
+            limite REAL NOT NULL,
+            veces INTEGER NOT NULL,
+            suma REAL NOT NULL,
+            PRIMARY KEY (nombre, limite)
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS metricas_contadores (
+            nombre TEXT PRIMARY KEY,
+            valor INTEGER NOT NULL
+        )
+    """)
+
+    # Bases creadas antes del contador y del índice UNIQUE
+    existe_indice = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_historias_consecutivo'"
+    ).fetchone()
+    if not existe_indice:
+        _sincronizar_secuencias(conn)
+        _crear_indice_consecutivo(conn)
+
+    _crear_indice_busqueda(conn)
+
+
+def _crear_indice_busqueda(conn: sqlite3.Connection) -> None:
+    """
+    Índice FTS5 sobre los campos clínicos, sincronizado con historias por
+    triggers. unicode61 con remove_diacritics ignora mayúsculas y tildes
+    ("toracico" encuentra "torácico"). En bases existentes se indexa una vez.
+    """
+    existe = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE name='historias_fts'"
+    ).fetchone()
+    conn.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS historias_fts USING fts5(
+            paciente, motivo, diagnostico, tratamiento,
+            content='historias', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS historias_fts_insertar AFTER INSERT ON historias BEGIN
+            INSERT INTO historias_fts (rowid, paciente, motivo, diagnostico, tratamiento)
+            VALUES (new.id, new.paciente, new.motivo, new.diagnostico, new.tratamiento);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS historias_fts_borrar AFTER DELETE ON historias BEGIN
+            INSERT INTO historias_fts (historias_fts, rowid, paciente, motivo, diagnostico, tratamiento)
+            VALUES ('delete', old.id, old.paciente, old.motivo, old.diagnostico, old.tratamiento);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS historias_fts_actualizar
+        AFTER UPDATE OF paciente, motivo, diagnostico, tratamiento ON historias BEGIN
+            INSERT INTO historias_fts (historias_fts, rowid, paciente, motivo, diagnostico, tratamiento)
+            VALUES ('delete', old.id, old.paciente, old.motivo, old.diagnostico, old.tratamiento);
+            INSERT INTO historias_fts (rowid, paciente, motivo, diagnostico, tratamiento)
+            VALUES (new.id, new.paciente, new.motivo, new.diagnostico, new.tratamiento);
+        END
+    """)
+    if not existe:
+        conn.execute("INSERT INTO historias_fts (historias_fts) VALUES ('rebuild')")
+
+
+def edad_entera(valor: Any) -> int | None:
+    """
+    Edad en años, o None si falta o no es válida ("45 años" -> 45, "8 meses" -> 0,
+    inf o nan -> None).
+    Es la misma regla que aplica en SQL la migración a historias con tipos.
+    """
+    if valor is None or isinstance(valor, bool):
+        return None
+    if isinstance(valor, (int, float)):
+        return (
+            int(valor)
+            if math.isfinite(valor) and 0 <= valor and int(valor) <= EDAD_MAXIMA
+            else None
+        )
+    texto = str(valor)
+    numero = re.match(r" *(\d+)", texto)
+    if numero is None or int(numero.group(1)) > EDAD_MAXIMA:
+        return None
+    return 0 if "mes" in texto.lower() else int(numero.group(1))
+
+
+# Versión 2: historias con tipos. Edad entera, fecha ISO normalizada e indexada,
+# estado acotado y el usuario como clave foránea en lugar de su nombre repetido.
+_COLUMNAS_TIPADAS = (
+    "consecutivo",
+    "usuario_id",
+    "paciente",
+    "edad",
+    "motivo",
+    "diagnostico",
+    "tratamiento",
+    "fecha_creacion",
+    "estado",
+)
+
+_HISTORIAS_TIPADAS = f"""
+    CREATE TABLE IF NOT EXISTS historias_tipadas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        consecutivo TEXT,
+        usuario_id INTEGER NOT NULL REFERENCES usuarios(id),
+        paciente TEXT,
+        edad INTEGER CHECK (edad IS NULL OR (typeof(edad) = 'integer' AND edad BETWEEN 0 AND {EDAD_MAXIMA})),
+        motivo TEXT,
+        diagnostico TEXT,
+        tratamiento TEXT,
+        fecha_creacion TEXT NOT NULL CHECK (fecha_creacion = datetime(fecha_creacion)),
+        estado TEXT NOT NULL DEFAULT 'incompleta' CHECK (estado IN ('incompleta', 'completa'))
+    )
+"""
+
+
+def _columnas_tipadas(p: str) -> str:
+    """
+    Expresiones SQL que pasan una fila del esquema de texto (columnas con el
+    prefijo `p`, p. ej. "h." o "new.") al tipado, en el orden de _COLUMNAS_TIPADAS.
+    La edad sigue la regla de edad_entera(); el usuario ya debe existir.
+    """
+    edad, fecha = f"CAST({p}edad AS TEXT)", f"{p}fecha_creacion"
+    return f"""
+        {p}consecutivo,
+        (SELECT id FROM usuarios WHERE usuario = COALESCE({p}usuario, '')),
+        {p}paciente,
+        CASE WHEN ltrim({edad}) GLOB '[0-9]*' AND CAST({edad} AS INTEGER) BETWEEN 0 AND {EDAD_MAXIMA}
+             THEN CASE WHEN {edad} LIKE '%mes%' THEN 0 ELSE CAST({edad} AS INTEGER) END END,
+        {p}motivo, {p}diagnostico, {p}tratamiento,
+        COALESCE(
+            datetime({fecha}),
+            datetime(substr({fecha}, 7, 4) || '-' || substr({fecha}, 4, 2) || '-' || substr({fecha}, 1, 2) || substr({fecha}, 11)),
+            '{FECHA_DESCONOCIDA}'
+        ),
+        CASE WHEN lower(trim({p}estado)) LIKE 'complet%' THEN 'completa' ELSE 'incompleta' END
+    """
+
+
+def _copiar_historias_tipadas(
+    conn: sqlite3.Connection, desde_id: int, tope: int, limite: int = -1
+) -> tuple[int | None, int]:
+    """
+    Copia a historias_tipadas hasta `limite` historias con desde_id < id <= tope
+    que aún no estén. Devuelve (último id recorrido o None si no quedaba ninguno, copiadas).
+    """
+    hasta = conn.execute(
+        "SELECT MAX(id) FROM (SELECT id FROM historias WHERE id > ? AND id <= ? ORDER BY id LIMIT ?)",
+        (desde_id, tope, limite),
+    ).fetchone()[0]
+    if hasta is None:
+        return None, 0
+    conn.execute(
+        """
+        INSERT OR IGNORE INTO usuarios (usuario)
+        SELECT DISTINCT COALESCE(usuario, '') FROM historias WHERE id > ? AND id <= ?
+    """,
+        (desde_id, hasta),
+    )
+    cursor = conn.execute(
+        f"""
+        INSERT INTO historias_tipadas (id, {", ".join(_COLUMNAS_TIPADAS)})
+        SELECT h.id, {_columnas_tipadas("h.")}
+        FROM historias h
+        WHERE h.id > ? AND h.id <= ? AND NOT EXISTS (SELECT 1 FROM historias_tipadas t WHERE t.id = h.id)
+    """,
+        (desde_id, hasta),
+    )
+    return hasta, cursor.rowcount
+
+
+def _primera_sin_copiar(conn: sqlite3.Connection) -> int | None:
+    return conn.execute("""
+        SELECT MIN(id) FROM historias h WHERE NOT EXISTS (SELECT 1 FROM historias_tipadas t WHERE t.id = h.id)
+    """).fetchone()[0]
+
+
+def _preparar_historias_tipadas(
+    tamano_lote: int, pausa: float, progreso: Callable[[int, int], object] | None
+) -> None:
+    """
+    Crea historias_tipadas y la llena por lotes, cada uno en su transacción.
+    Mientras tanto los triggers replican en ella lo que la app inserte, edite o
+    borre. Si se interrumpe, retoma desde la primera historia sin copiar.
+    """
+    columnas = ", ".join(_COLUMNAS_TIPADAS)
+    with transaccion() as conn:
+        conn.execute(_HISTORIAS_TIPADAS)
+        for evento in ("INSERT", "UPDATE"):
+            conn.execute(f"""
+                CREATE TRIGGER IF NOT EXISTS historias_tipadas_{evento.lower()} AFTER {evento} ON historias BEGIN
+                    INSERT OR IGNORE INTO usuarios (usuario) VALUES (COALESCE(new.usuario, ''));
+                    INSERT OR REPLACE INTO historias_tipadas (id, {columnas}) VALUES (new.id, {_columnas_tipadas("new.")});
+                END
+            """)
+        conn.execute("""
+            CREATE TRIGGER IF NOT EXISTS historias_tipadas_delete AFTER DELETE ON historias BEGIN
+                DELETE FROM historias_tipadas WHERE id = old.id;
+            END
+        """)
+        primera = _primera_sin_copiar(conn)
+        if primera is None:
+            return
+        # Las historias nuevas ya las copian los triggers: basta llegar a la última de ahora
+        tope, total = conn.execute(
+            "SELECT MAX(id), COUNT(*) FROM historias WHERE id >= ?", (primera,)
+        ).fetchone()
+
+    ultimo_id, copiadas = primera - 1, 0
+    while True:
+        with transaccion() as conn:
+            ultimo_id, n = _copiar_historias_tipadas(conn, ultimo_id, tope, tamano_lote)
+        if ultimo_id is None:
+            return
+        copiadas += n
+        if progreso is not None:
+            progreso(copiadas, total)
+        if pausa:
+            # Deja pasar a los escritores de la app entre lote y lote
+            time.sleep(pausa)
+
+
+def _historias_tipadas(conn: sqlite3.Connection) -> None:
+    """Copia lo que falte, comprueba y reemplaza historias por historias_tipadas."""
+    conn.execute(_HISTORIAS_TIPADAS)
+    primera = _primera_sin_copiar(conn)
+    if primera is not None:
+        _copiar_historias_tipadas(
+            conn,
+            primera - 1,
+            conn.execute("SELECT MAX(id) FROM historias").fetchone()[0],
+        )
+    origen, copia = conn.execute(
+        "SELECT (SELECT COUNT(*) FROM historias), (SELECT COUNT(*) FROM historias_tipadas)"
+    ).fetchone()
+    if origen != copia:
+        raise RuntimeError(
+            f"La copia tipada tiene {copia} historias y el original {origen}"
+        )
+    # Con la tabla se van su índice FTS (los triggers) y los de la copia
+    conn.execute("DROP TABLE historias")
+    conn.execute("ALTER TABLE historias_tipadas RENAME TO historias")
+    conn.execute(
+        "CREATE UNIQUE INDEX idx_historias_consecutivo ON historias(consecutivo)"
+    )
+    # Listados por tripulación y estado, del más reciente al más antiguo
+    conn.execute(
+        "CREATE INDEX idx_historias_usuario_estado_fecha ON historias(usuario_id, estado, fecha_creacion)"
+    )
+    # Rangos de fechas y agregados por periodo
+    conn.execute("CREATE INDEX idx_historias_fecha ON historias(fecha_creacion)")
+    _crear_indice_busqueda(conn)
+
+
+# Versión 3: resúmenes del panel de supervisión. Atenciones por día,
+# tripulación y estado, y por día y diagnóstico, mantenidas por triggers en la
+# misma transacción que cada escritura sobre historias: el panel lee unas
+# pocas filas por día sin importar cuántas historias haya.
+_DIAGNOSTICO_RESUMEN = "lower(trim(COALESCE({p}.diagnostico, '')))"
+
+
+def _sumar_resumen(p: str, signo: str) -> str:
+    """Sentencias de trigger que suman (o restan) la historia `p` (new u old) a los resúmenes."""
+    return f"""
+        INSERT INTO resumen_diario (dia, usuario_id, estado, total)
+        VALUES (date({p}.fecha_creacion), {p}.usuario_id, {p}.estado, {signo}1)
+        ON CONFLICT(dia, usuario_id, estado) DO UPDATE SET total = total {signo} 1;
+        INSERT INTO resumen_diagnosticos (dia, diagnostico, total)
+        VALUES (date({p}.fecha_creacion), {_DIAGNOSTICO_RESUMEN.format(p=p)}, {signo}1)
+        ON CONFLICT(dia, diagnostico) DO UPDATE SET total = total {signo} 1;
+    """
+
+
+def _resumenes(conn: sqlite3.Connection) -> None:
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_diario (
+            dia TEXT NOT NULL,
+            usuario_id INTEGER NOT NULL REFERENCES usuarios(id),
+            estado TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (dia, usuario_id, estado)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS resumen_diagnosticos (
+            dia TEXT NOT NULL,
+            diagnostico TEXT NOT NULL,
+            total INTEGER NOT NULL,
+            PRIMARY KEY (dia, diagnostico)
+        ) WITHOUT ROWID
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS resumen_insertar AFTER INSERT ON historias BEGIN
+            {_sumar_resumen("new", "+")}
+        END
+    """)
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS resumen_borrar AFTER DELETE ON historias BEGIN
+            {_sumar_resumen("old", "-")}
+        END
+    """)
+    # Solo si cambia algo que cuenta: completar campos vacíos con la IA no toca los resúmenes
+    conn.execute(f"""
+        CREATE TRIGGER IF NOT EXISTS resumen_actualizar
+        AFTER UPDATE OF fecha_creacion, usuario_id, estado, diagnostico ON historias
+        WHEN date(old.fecha_creacion) IS NOT date(new.fecha_creacion)
+          OR old.usuario_id IS NOT new.usuario_id
+          OR old.estado IS NOT new.estado
+          OR {_DIAGNOSTICO_RESUMEN.format(p="old")} IS NOT {_DIAGNOSTICO_RESUMEN.format(p="new")}
+        BEGIN
+            {_sumar_resumen("old", "-")}
+            {_sumar_resumen("new", "+")}
+        END
+    """)
+    resumen_reconstruir(conn)
+
+
+def resumen_reconstruir(conn: sqlite3.Connection | None = None) -> None:
+    """
+    Recalcula los resúmenes recorriendo historias (al crearlos, o para
+    comprobarlos). Los triggers los mantienen al día sin necesidad de llamarla.
+    """
+    with transaccion() if conn is None else nullcontext(conn) as c:
+        c.execute("DELETE FROM resumen_diario")
+        c.execute("DELETE FROM resumen_diagnosticos")
+        c.execute("""
+            INSERT INTO resumen_diario (dia, usuario_id, estado, total)
+            SELECT date(fecha_creacion), usuario_id, estado, COUNT(*) FROM historias GROUP BY 1, 2, 3
+        """)
+        c.execute(f"""
+            INSERT INTO resumen_diagnosticos (dia, diagnostico, total)
+            SELECT date(fecha_creacion), {_DIAGNOSTICO_RESUMEN.format(p="historias")}, COUNT(*) FROM historias GROUP BY 1, 2
+        """)
+
+
+MIGRACIONES = (
+    Migracion(1, "esquema inicial", _esquema_inicial),
+    Migracion(
+        2, "historias con tipos", _historias_tipadas, _preparar_historias_tipadas
+    ),
+    Migracion(3, "resúmenes del panel de supervisión", _resumenes),
+)
+
+
+# --- Usuarios ---
+# Hash guardado por usuario (None si no existe), para no consultar la base en cada login
+_usuarios: OrderedDict[str, str | None] = OrderedDict()
+_lock_usuarios = threading.Lock()
+MAXIMO_USUARIOS_CACHE = 256
+
+
+def _olvidar_usuarios(usuario: str | None = None) -> None:
+    with _lock_usuarios:
+        if usuario is None:
+            _usuarios.clear()
+        else:
+            _usuarios.pop(usuario, None)
+
+
+def _hash_guardado(usuario: str) -> str | None:
+    with _lock_usuarios:
+        if usuario in _usuarios:
+            _usuarios.move_to_end(usuario)
+            return _usuarios[usuario]
+    with conexion() as conn:
+        fila = conn.execute(
+            "SELECT contrasena FROM usuarios WHERE usuario=?", (usuario,)
+        ).fetchone()
+    with _lock_usuarios:
+        _usuarios[usuario] = fila[0] if fila else None
+        if len(_usuarios) > MAXIMO_USUARIOS_CACHE:
+            _usuarios.popitem(last=False)
+    return fila[0] if fila else None
+
+
+def _migrar_contrasenas(conn: sqlite3.Connection) -> None:
+    """Migración única: las contraseñas guardadas en texto plano pasan a scrypt."""
+    filas = conn.execute(
+        "SELECT id, contrasena FROM usuarios WHERE contrasena IS NOT NULL AND contrasena NOT LIKE ?",
+        (contrasenas.PREFIJO + "%",),
+    ).fetchall()
+    conn.executemany(
+        "UPDATE usuarios SET contrasena=? WHERE id=?",
+        [
+            (contrasenas.hashear(contrasena), id_usuario)
+            for id_usuario, contrasena in filas
+        ],
+    )
+
+
+def _id_usuario(conn: sqlite3.Connection, usuario: str) -> int:
+    """id del usuario; si no existe se crea sin contraseña (no puede iniciar sesión)."""
+    conn.execute("INSERT OR IGNORE INTO usuarios (usuario) VALUES (?)", (usuario,))
+    return conn.execute(
+        "SELECT id FROM usuarios WHERE usuario=?", (usuario,)
+    ).fetchone()[0]
+
 
 def crear_usuario(usuario: str, contrasena: str):
-    conn = sqlite3.connect("historias.db")
-    c = conn.cursor()
-    try:
-        c.execute("INSERT INTO usuarios (usuario, contrasena) VALUES (?, ?)", (usuario, contrasena))
-        conn.commit()
-    except sqlite3.IntegrityError:
-        pass
-    conn.close()
+    # El hash (lo costoso) se calcula antes de tomar el bloqueo de escritura
+    almacenado = contrasenas.hashear(contrasena)
+    # Si ya existe sin contraseña (creado al guardar o importar sus historias), la recibe
+    with transaccion() as conn:
+        conn.execute(
+            """
+            INSERT INTO usuarios (usuario, contrasena) VALUES (?, ?)
+            ON CONFLICT(usuario) DO UPDATE SET contrasena=excluded.contrasena WHERE contrasena IS NULL
+        """,
+            (usuario, almacenado),
+        )
+    _olvidar_usuarios(usuario)
+
 
 def validar_usuario(usuario: str, contrasena: str) -> bool:
-    conn = sqlite3.connect("historias.db")
-    c = conn.cursor()
-    c.execute("SELECT * FROM usuarios WHERE usuario=? AND contrasena=?", (usuario, contrasena))
-    valido = c.fetchone() is not None
-    conn.close()
-    return valido
-
-def obtener_consecutivo():
-    conn = sqlite3.connect("historias.db")
-    c = conn.cursor()
-    c.execute("SELECT COUNT(*) FROM historias")
-    total = c.fetchone()[0] + 1
-    conn.close()
-    return f"HC-2026-{total:04d}"
+    """
+    Verifica la contraseña contra el hash guardado en tiempo constante. Si el
+    usuario no existe se verifica contra un señuelo para que tarde lo mismo; si
+    el hash tiene otro coste (SCRYPT_N cambió) se rehace con el actual.
+    """
+    almacenado = _hash_guardado(usuario)
+    if almacenado is None:
+        contrasenas.verificar(contrasena, contrasenas.hash_senuelo())
+        return False
+    if not contrasenas.verificar(contrasena, almacenado):
+        return False
+    if contrasenas.necesita_rehash(almacenado):
+        nuevo = contrasenas.hashear(contrasena)
+        with transaccion() as conn:
+            conn.execute(
+                "UPDATE usuarios SET contrasena=? WHERE usuario=?", (nuevo, usuario)
+            )
+        _olvidar_usuarios(usuario)
+    return True
+
+
+def obtener_muletillas(usuario: str) -> list[str]:
+    with conexion() as conn:
+        return [
+            f[0]
+            for f in conn.execute(
+                "SELECT muletilla FROM muletillas_usuario WHERE usuario=? ORDER BY muletilla",
+                (usuario,),
+            )
+        ]
+
+
+def guardar_muletillas(usuario: str, muletillas: Iterable[str]) -> None:
+    """Reemplaza la lista de muletillas propias del usuario."""
+    with transaccion() as conn:
+        conn.execute("DELETE FROM muletillas_usuario WHERE usuario=?", (usuario,))
+        conn.executemany(
+            "INSERT OR IGNORE INTO muletillas_usuario (usuario, muletilla) VALUES (?, ?)",
+            [(usuario, m.strip().lower()) for m in muletillas if m.strip()],
+        )
+
+
+# --- Historias ---
+_PATRON_CONSECUTIVO = re.compile(r"^HC-(\d{4})-(\d+)$")
+
+
+def _formatear_consecutivo(anio: int, numero: int) -> str:
+    return f"HC-{anio}-{numero:04d}"
+
+
+def _sincronizar_secuencias(conn: sqlite3.Connection) -> None:
+    """Lleva cada contador anual al máximo consecutivo ya presente en historias."""
+    conn.execute("""
+        INSERT INTO secuencias (anio, ultimo)
+        SELECT CAST(substr(consecutivo, 4, 4) AS INTEGER), MAX(CAST(substr(consecutivo, 9) AS INTEGER))
+        FROM historias
+        WHERE consecutivo GLOB 'HC-[0-9][0-9][0-9][0-9]-[0-9]*'
+        GROUP BY 1
+        ON CONFLICT(anio) DO UPDATE SET ultimo = MAX(ultimo, excluded.ultimo)
+    """)
+
+
+def _crear_indice_consecutivo(conn: sqlite3.Connection) -> None:
+    """
+    Crea el índice UNIQUE sobre consecutivo. Las bases antiguas pueden tener
+    duplicados (dos tripulaciones con el mismo número); se conserva la fila más
+    antigua y las demás reciben un consecutivo nuevo antes de crear el índice.
+    """
+    duplicadas = conn.execute("""
+        SELECT id FROM historias h
+        WHERE consecutivo IS NOT NULL
+          AND EXISTS (SELECT 1 FROM historias o WHERE o.consecutivo = h.consecutivo AND o.id < h.id)
+    """).fetchall()
+    anio = datetime.now().year
+    for (historia_id,) in duplicadas:
+        conn.execute(
+            "UPDATE historias SET consecutivo=? WHERE id=?",
+            (_asignar_consecutivo(conn, anio), historia_id),
+        )
+    conn.execute(
+        "CREATE UNIQUE INDEX idx_historias_consecutivo ON historias(consecutivo)"
+    )
+
+
+def _asignar_consecutivo(conn: sqlite3.Connection, anio: int) -> str:
+    """Consume el siguiente número del año. Debe llamarse dentro de una transacción."""
+    numero = conn.execute(
+        """
+        INSERT INTO secuencias (anio, ultimo) VALUES (?, 1)
+        ON CONFLICT(anio) DO UPDATE SET ultimo = ultimo + 1
+        RETURNING ultimo
+    """,
+        (anio,),
+    ).fetchone()[0]
+    return _formatear_consecutivo(anio, numero)
+
+
+def _avanzar_secuencia(conn: sqlite3.Connection, anio: int, numero: int) -> None:
+    conn.execute(
+        """
+        INSERT INTO secuencias (anio, ultimo) VALUES (?, ?)
+        ON CONFLICT(anio) DO UPDATE SET ultimo = MAX(ultimo, excluded.ultimo)
+    """,
+        (anio, numero),
+    )
+
+
+def _reservar_consecutivo(conn: sqlite3.Connection, consecutivo: str) -> None:
+    """Avanza el contador si se guarda un consecutivo explícito (importaciones, pruebas)."""
+    coincidencia = _PATRON_CONSECUTIVO.match(consecutivo)
+    if coincidencia:
+        _avanzar_secuencia(conn, int(coincidencia.group(1)), int(coincidencia.group(2)))
+
+
+def obtener_consecutivo() -> str:
+    """
+    Vista previa del próximo consecutivo del año en curso. No consume el número:
+    el definitivo se asigna al guardar y puede diferir si otra tripulación guarda antes.
+    """
+    anio = datetime.now().year
+    with conexion() as conn:
+        fila = conn.execute(
+            "SELECT ultimo FROM secuencias WHERE anio=?", (anio,)
+        ).fetchone()
+    return _formatear_consecutivo(anio, (fila[0] if fila else 0) + 1)
+
 
 def guardar_historia(
-    consecutivo: str,
+    consecutivo: str | None,
     usuario: str,
     paciente: str,
-    edad: str,
+    edad: str | int | None,
     motivo: str,
     diagnostico: str,
     tratamiento: str,
-    estado: str = "incompleta"
-) -> None:
-    conn = sqlite3.connect("historias.db")
-    c = conn.cursor()
-    fecha = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    c.execute("""
-        INSERT INTO historias (consecutivo, usuario, paciente, edad, motivo, diagnostico, tratamiento, fecha_creacion, estado)
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-    """, (consecutivo, usuario, paciente, edad, motivo, diagnostico, tratamiento, fecha, estado))
-    conn.commit()
-    conn.close()
+    estado: str = "incompleta",
+) -> str:
+    """
+    Guarda la historia y devuelve su consecutivo. Con consecutivo=None el número
+    se asigna de forma atómica en la misma transacción (BEGIN IMMEDIATE). La edad
+    se guarda como entero (ver edad_entera).
+    """
+    ahora = datetime.now()
+    fecha = ahora.strftime("%Y-%m-%d %H:%M:%S")
+    with transaccion() as conn:
+        if consecutivo is None:
+            consecutivo = _asignar_consecutivo(conn, ahora.year)
+        else:
+            _reservar_consecutivo(conn, consecutivo)
+        conn.execute(
+            """
+            INSERT INTO historias (consecutivo, usuario_id, paciente, edad, motivo, diagnostico, tratamiento, fecha_creacion, estado)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            (
+                consecutivo,
+                _id_usuario(conn, usuario),
+                paciente,
+                edad_entera(edad),
+                motivo,
+                diagnostico,
+                tratamiento,
+                fecha,
+                estado,
+            ),
+        )
+    return consecutivo
+
 
 def obtener_historias_por_estado(usuario: str, estado: str) -> list[Any]:
-    conn = sqlite3.connect("historias.db")
-    c = conn.cursor()
-    # Devolver las columnas en el orden que usa la interfaz para mostrar (consecutivo, usuario, paciente, edad, motivo, diagnóstico, tratamiento)
-    c.execute("""
-        SELECT consecutivo, usuario, paciente, edad, motivo, diagnostico, tratamiento
-        FROM historias
-        WHERE usuario=? AND estado=?
-        ORDER BY fecha_creacion DESC
-    """, (usuario, estado))
-    data = c.fetchall()
-    conn.close()
-    return data
+    with conexion() as conn:
+        # Devolver las columnas en el orden que usa la interfaz para mostrar (consecutivo, usuario, paciente, edad, motivo, diagnóstico, tratamiento)
+        return conn.execute(
+            """
+            SELECT h.consecutivo, u.usuario, h.paciente, h.edad, h.motivo, h.diagnostico, h.tratamiento
+            FROM historias h JOIN usuarios u ON u.id = h.usuario_id
+            WHERE u.usuario=? AND h.estado=?
+            ORDER BY h.fecha_creacion DESC, h.id DESC
+        """,
+            (usuario, estado),
+        ).fetchall()
+
+
+def obtener_historias_pagina(
+    usuario: str,
+    estado: str,
+    tamano: int = 50,
+    cursor: tuple[str, int] | None = None,
+) -> tuple[list[Any], tuple[str, int] | None]:
+    """
+    Página de historias paginada por cursor (keyset) sobre el índice
+    (usuario_id, estado, fecha_creacion). Devuelve las filas (mismas columnas que
+    obtener_historias_por_estado más fecha_creacion) y el cursor de la página
+    siguiente, o None si no hay más.
+    """
+    parametros: tuple[Any, ...] = (usuario, estado)
+    filtro_cursor = ""
+    if cursor is not None:
+        filtro_cursor = "AND (h.fecha_creacion, h.id) < (?, ?)"
+        parametros += tuple(cursor)
+    with conexion() as conn:
+        filas = conn.execute(
+            f"""
+            SELECT h.consecutivo, u.usuario, h.paciente, h.edad, h.motivo, h.diagnostico, h.tratamiento,
+                   h.fecha_creacion, h.id
+            FROM historias h JOIN usuarios u ON u.id = h.usuario_id
+            WHERE u.usuario=? AND h.estado=? {filtro_cursor}
+            ORDER BY h.fecha_creacion DESC, h.id DESC
+            LIMIT ?
+        """,
+            parametros + (tamano + 1,),
+        ).fetchall()
+
+    siguiente = None
+    if len(filas) > tamano:
+        filas = filas[:tamano]
+        siguiente = (filas[-1][7], filas[-1][8])
+    return [fila[:8] for fila in filas], siguiente
+
+
+_PATRON_TERMINO = re.compile(r"\w+")
+
+
+def _consulta_fts(texto: str) -> str:
+    """Convierte lo que escribe el usuario en una consulta FTS5 segura: todos los términos, por prefijo."""
+    return " ".join(f'"{termino}"*' for termino in _PATRON_TERMINO.findall(texto))
+
+
+def buscar_historias(
+    usuario: str,
+    texto: str,
+    estado: str | None = None,
+    tamano: int = 20,
+    pagina: int = 0,
+) -> tuple[list[Any], bool]:
+    """
+    Búsqueda de texto completo en paciente, motivo, diagnóstico y tratamiento,
+    ordenada por relevancia (bm25, con más peso para el paciente). Devuelve las
+    filas (columnas de obtener_historias_pagina más estado) y si hay más páginas.
+    """
+    consulta = _consulta_fts(texto)
+    if not consulta:
+        return [], False
+    parametros: tuple[Any, ...] = (consulta, usuario)
+    filtro_estado = ""
+    if estado is not None:
+        filtro_estado = "AND h.estado=?"
+        parametros += (estado,)
+    with conexion() as conn:
+        filas = conn.execute(
+            f"""
+            SELECT h.consecutivo, u.usuario, h.paciente, h.edad, h.motivo, h.diagnostico, h.tratamiento,
+                   h.fecha_creacion, h.estado
+            FROM historias_fts
+            JOIN historias h ON h.id = historias_fts.rowid
+            JOIN usuarios u ON u.id = h.usuario_id
+            WHERE historias_fts MATCH ? AND u.usuario=? {filtro_estado}
+            ORDER BY bm25(historias_fts, 4.0, 1.0, 1.0, 1.0), h.fecha_creacion DESC
+            LIMIT ? OFFSET ?
+        """,
+            parametros + (tamano + 1, pagina * tamano),
+        ).fetchall()
+    return filas[:tamano], len(filas) > tamano
+
+
+# --- Caché de la IA ---
+def cache_ia_obtener(clave: str, creado_desde: float) -> str | None:
+    """Devuelve el valor guardado si es posterior a creado_desde y marca su uso."""
+    with conexion() as conn:
+        fila = conn.execute(
+            "SELECT valor FROM cache_ia WHERE clave=? AND creado>=?",
+            (clave, creado_desde),
+        ).fetchone()
+        if fila is not None:
+            conn.execute(
+                "UPDATE cache_ia SET usado=? WHERE clave=?", (time.time(), clave)
+            )
+    return fila[0] if fila else None
+
+
+def cache_ia_guardar(clave: str, valor: str, maximo: int, creado_desde: float) -> None:
+    """Guarda un resultado y expulsa los vencidos y los menos usados por encima de maximo."""
+    ahora = time.time()
+    with transaccion() as conn:
+        conn.execute(
+            """
+            INSERT INTO cache_ia (clave, valor, creado, usado) VALUES (?, ?, ?, ?)
+            ON CONFLICT(clave) DO UPDATE SET valor=excluded.valor, creado=excluded.creado, usado=excluded.usado
+        """,
+            (clave, valor, ahora, ahora),
+        )
+        conn.execute("DELETE FROM cache_ia WHERE creado<?", (creado_desde,))
+        conn.execute(
+            """
+            DELETE FROM cache_ia WHERE clave IN (
+                SELECT clave FROM cache_ia ORDER BY usado DESC LIMIT -1 OFFSET ?
+            )
+        """,
+            (maximo,),
+        )
+
+
+def cache_ia_vaciar() -> None:
+    with transaccion() as conn:
+        conn.execute("DELETE FROM cache_ia")
+
+
+# --- Borradores del formulario ---
+CAMPOS_BORRADOR = (
+    "paciente",
+    "edad",
+    "motivo",
+    "diagnostico",
+    "tratamiento",
+    "texto_libre",
+    "texto_corregido",
+)
+
+
+def borrador_guardar(usuario: str, cambios: dict[str, str]) -> None:
+    """Crea o actualiza el borrador escribiendo solo los campos de `cambios`."""
+    campos = [campo for campo in CAMPOS_BORRADOR if campo in cambios]
+    asignaciones = "".join(f"{campo}=excluded.{campo}, " for campo in campos)
+    with transaccion() as conn:
+        conn.execute(
+            f"""
+            INSERT INTO borradores (usuario, {"".join(f"{campo}, " for campo in campos)}actualizado)
+            VALUES (?, {"?, " * len(campos)}?)
+            ON CONFLICT(usuario) DO UPDATE SET {asignaciones}actualizado=excluded.actualizado
+        """,
+            (usuario, *(str(cambios[campo] or "") for campo in campos), time.time()),
+        )
+
+
+def borrador_obtener(usuario: str) -> dict[str, Any] | None:
+    """Campos del borrador más `actualizado` (marca de tiempo), o None si no hay."""
+    with conexion() as conn:
+        fila = conn.execute(
+            f"SELECT {', '.join(CAMPOS_BORRADOR)}, actualizado FROM borradores WHERE usuario=?",
+            (usuario,),
+        ).fetchone()
+    return None if fila is None else dict(zip((*CAMPOS_BORRADOR, "actualizado"), fila))
+
+
+def borrador_descartar(usuario: str) -> None:
+    with transaccion() as conn:
+        conn.execute("DELETE FROM borradores WHERE usuario=?", (usuario,))
+
+
+def borrador_promover(
+    usuario: str, campos: dict[str, str], texto_pendiente: str | None = None
+) -> str:
+    """
+    Convierte el borrador en historia en una sola transacción: guarda la historia
+    con el borrador y los `campos` finales por encima, encola `texto_pendiente`
+    para la IA si lo hay y borra el borrador. Devuelve el consecutivo.
+    """
+    with transaccion():
+        datos = {**(borrador_obtener(usuario) or {}), **campos}
+        consecutivo = guardar_historia(
+            None,
+            usuario,
+            *(
+                datos.get(campo, "")
+                for campo in (
+                    "paciente",
+                    "edad",
+                    "motivo",
+                    "diagnostico",
+                    "tratamiento",
+                )
+            ),
+        )
+        if texto_pendiente:
+            cola_ia_encolar(consecutivo, texto_pendiente)
+        borrador_descartar(usuario)
+    return consecutivo
+
+
+# --- Cola de análisis pendientes ---
+# Campos de la historia que se pueden completar con el resultado de la IA
+CAMPOS_ANALISIS = ("paciente", "edad", "motivo", "diagnostico", "tratamiento")
+
+
+def cola_ia_encolar(consecutivo: str, texto: str) -> int:
+    """Encola un dictado para analizarlo en segundo plano. Devuelve el id del trabajo."""
+    ahora = time.time()
+    with transaccion() as conn:
+        cursor = conn.execute(
+            "INSERT INTO cola_ia (consecutivo, texto, proximo, creado) VALUES (?, ?, ?, ?)",
+            (consecutivo, texto, ahora, ahora),
+        )
+    return cursor.lastrowid
+
+
+def cola_ia_pendientes(ahora: float, limite: int = 10) -> list[tuple]:
+    """Trabajos listos para procesar: (id, consecutivo, texto, intentos, creado)."""
+    with conexion() as conn:
+        return conn.execute(
+            """
+            SELECT id, consecutivo, texto, intentos, creado FROM cola_ia
+            WHERE proximo<=? ORDER BY proximo, id LIMIT ?
+        """,
+            (ahora, limite),
+        ).fetchall()
+
+
+def _completar_campos(
+    conn: sqlite3.Connection, columna: str, filas: Iterable[tuple[Any, dict[str, Any]]]
+) -> None:
+    """
+    Escribe resultados de la IA en las historias cuya `columna` coincide. Solo se
+    llenan los campos vacíos: lo que la tripulación escribió a mano no se sobrescribe.
+    """
+    asignaciones = ", ".join(
+        f"{campo}=COALESCE(NULLIF({campo}, ''), ?, {campo})"
+        for campo in CAMPOS_ANALISIS
+    )
+    conn.executemany(
+        f"UPDATE historias SET {asignaciones} WHERE {columna}=?",
+        [
+            (
+                *(
+                    _valor_analisis(campo, datos.get(campo))
+                    for campo in CAMPOS_ANALISIS
+                ),
+                valor,
+            )
+            for valor, datos in filas
+        ],
+    )
+
+
+def _valor_analisis(campo: str, valor: Any) -> Any:
+    if not valor:
+        return None
+    return edad_entera(valor) if campo == "edad" else str(valor)
+
+
+def cola_ia_completar(id_trabajo: int, consecutivo: str, datos: dict[str, Any]) -> None:
+    """Escribe el análisis en la historia y saca el trabajo de la cola en la misma transacción."""
+    with transaccion() as conn:
+        _completar_campos(conn, "consecutivo", [(consecutivo, datos)])
+        conn.execute("DELETE FROM cola_ia WHERE id=?", (id_trabajo,))
+
+
+def cola_ia_reprogramar(
+    ids: Iterable[int], ahora: float, base: float, maximo: float, error: str
+) -> None:
+    """Reintento con espera exponencial: base * 2^intentos, acotada a maximo."""
+    with transaccion() as conn:
+        conn.executemany(
+            """
+            UPDATE cola_ia SET intentos=intentos + 1, proximo=? + MIN(?, ? * (1 << MIN(intentos, 30))), error=?
+            WHERE id=?
+        """,
+            [(ahora, maximo, base, error, id_trabajo) for id_trabajo in ids],
+        )
+
+
+def cola_ia_estado() -> tuple[int, float | None]:
+    """Devuelve (trabajos en cola, fecha de creación del más antiguo o None)."""
+    with conexion() as conn:
+        return conn.execute("SELECT COUNT(*), MIN(creado) FROM cola_ia").fetchone()
+
+
+# --- Panel de supervisión ---
+# Lecturas de los resúmenes (ver _resumenes); `desde` y `hasta` son días YYYY-MM-DD, inclusive
+def resumen_por_dia(desde: str, hasta: str) -> list[tuple[str, str, str, int]]:
+    """Atenciones (dia, tripulación, estado, total) del periodo."""
+    with conexion() as conn:
+        return conn.execute(
+            """
+            SELECT r.dia, u.usuario, r.estado, r.total
+            FROM resumen_diario r JOIN usuarios u ON u.id = r.usuario_id
+            WHERE r.dia BETWEEN ? AND ? AND r.total > 0
+            ORDER BY r.dia
+        """,
+            (desde, hasta),
+        ).fetchall()
+
+
+def resumen_por_diagnostico(desde: str, hasta: str) -> list[tuple[str, str, int]]:
+    """Atenciones (dia, diagnóstico en minúsculas, total) del periodo; '' es sin diagnóstico."""
+    with conexion() as conn:
+        return conn.execute(
+            """
+            SELECT dia, diagnostico, total FROM resumen_diagnosticos
+            WHERE dia BETWEEN ? AND ? AND total > 0
+            ORDER BY dia
+        """,
+            (desde, hasta),
+        ).fetchall()
+
+
+# --- Reanálisis masivo de historias incompletas ---
+# Incompletas a las que les falta diagnóstico o tratamiento
+_FILTRO_REANALISIS = """
+    estado='incompleta' AND id > ?
+    AND (COALESCE(diagnostico, '')='' OR COALESCE(tratamiento, '')='')
+"""
+
+
+def contar_incompletas(desde_id: int = 0) -> int:
+    with conexion() as conn:
+        return conn.execute(
+            f"SELECT COUNT(*) FROM historias WHERE {_FILTRO_REANALISIS}", (desde_id,)
+        ).fetchone()[0]
+
+
+def iterar_incompletas(
+    desde_id: int = 0, tamano_lote: int = 100
+) -> Iterator[list[tuple]]:
+    """
+    Recorre por id, en lotes, las historias pendientes de reanálisis:
+    (id, paciente, edad, motivo, diagnostico, tratamiento). Igual que
+    iterar_historias, la conexión se devuelve antes de entregar cada lote.
+    """
+    ultimo_id = desde_id
+    while True:
+        with conexion() as conn:
+            filas = conn.execute(
+                f"""
+                SELECT id, paciente, edad, motivo, diagnostico, tratamiento
+                FROM historias
+                WHERE {_FILTRO_REANALISIS}
+                ORDER BY id
+                LIMIT ?
+            """,
+                (ultimo_id, tamano_lote),
+            ).fetchall()
+        if not filas:
+            return
+        ultimo_id = filas[-1][0]
+        yield filas
+
+
+def reanalisis_obtener_punto(nombre: str) -> tuple[int, int, int] | None:
+    """Devuelve (ultimo_id, procesadas, errores) del último punto de control o None."""
+    with conexion() as conn:
+        return conn.execute(
+            "SELECT ultimo_id, procesadas, errores FROM reanalisis_puntos WHERE nombre=?",
+            (nombre,),
+        ).fetchone()
+
+
+def reanalisis_guardar_lote(
+    nombre: str,
+    resultados: list[tuple[int, dict[str, Any]]],
+    ultimo_id: int,
+    procesadas: int,
+    errores: int,
+) -> None:
+    """Escribe los resultados de un lote y avanza el punto de control en la misma transacción."""
+    with transaccion() as conn:
+        _completar_campos(conn, "id", resultados)
+        conn.execute(
+            """
+            INSERT INTO reanalisis_puntos (nombre, ultimo_id, procesadas, errores, actualizado) VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT(nombre) DO UPDATE SET
+                ultimo_id=excluded.ultimo_id, procesadas=excluded.procesadas,
+                errores=excluded.errores, actualizado=excluded.actualizado
+        """,
+            (nombre, ultimo_id, procesadas, errores, time.time()),
+        )
+
+
+def reanalisis_reiniciar(nombre: str) -> None:
+    with transaccion() as conn:
+        conn.execute("DELETE FROM reanalisis_puntos WHERE nombre=?", (nombre,))
+
+
+# --- Métricas del dictado ---
+def metricas_sumar(
+    tramos: Iterable[tuple[str, float, int, float]],
+    contadores: Iterable[tuple[str, int]],
+) -> None:
+    """Suma a lo guardado los cubos (nombre, limite, veces, suma) y los contadores (nombre, incremento)."""
+    with transaccion() as conn:
+        conn.executemany(
+            """
+            INSERT INTO metricas_tramos (nombre, limite, veces, suma) VALUES (?, ?, ?, ?)
+            ON CONFLICT(nombre, limite) DO UPDATE SET veces=veces + excluded.veces, suma=suma + excluded.suma
+        """,
+            tramos,
+        )
+        conn.executemany(
+            """
+            INSERT INTO metricas_contadores (nombre, valor) VALUES (?, ?)
+            ON CONFLICT(nombre) DO UPDATE SET valor=valor + excluded.valor
+        """,
+            contadores,
+        )
+
+
+def metricas_leer() -> tuple[list[tuple], list[tuple]]:
+    """Devuelve los cubos (nombre, limite, veces, suma) ordenados y los contadores (nombre, valor)."""
+    with conexion() as conn:
+        tramos = conn.execute(
+            "SELECT nombre, limite, veces, suma FROM metricas_tramos ORDER BY nombre, limite"
+        ).fetchall()
+        contadores = conn.execute(
+            "SELECT nombre, valor FROM metricas_contadores ORDER BY nombre"
+        ).fetchall()
+    return tramos, contadores
+
+
+def metricas_vaciar() -> None:
+    with transaccion() as conn:
+        conn.execute("DELETE FROM metricas_tramos")
+        conn.execute("DELETE FROM metricas_contadores")
+
+
+# --- Importación y exportación masiva ---
+COLUMNAS_HISTORIA = (
+    "consecutivo",
+    "usuario",
+    "paciente",
+    "edad",
+    "motivo",
+    "diagnostico",
+    "tratamiento",
+    "fecha_creacion",
+    "estado",
+)
+
+
+def iterar_historias(tamano_lote: int = 5000) -> Iterator[list[tuple]]:
+    """
+    Recorre todas las historias en lotes (columnas de COLUMNAS_HISTORIA) paginando
+    por id. Cada lote usa una conexión prestada y la devuelve antes de entregarse,
+    así la memoria queda acotada y el generador no retiene conexiones.
+    """
+    ultimo_id = 0
+    while True:
+        with conexion() as conn:
+            filas = conn.execute(
+                f"""
+                SELECT h.id, {", ".join("u.usuario" if columna == "usuario" else f"h.{columna}" for columna in COLUMNAS_HISTORIA)}
+                FROM historias h JOIN usuarios u ON u.id = h.usuario_id
+                WHERE h.id > ?
+                ORDER BY h.id
+                LIMIT ?
+            """,
+                (ultimo_id, tamano_lote),
+            ).fetchall()
+        if not filas:
+            return
+        ultimo_id = filas[-1][0]
+        yield [fila[1:] for fila in filas]
+
+
+def importar_historias(
+    filas: Iterable[tuple], tamano_lote: int = 5000
+) -> tuple[int, int]:
+    """
+    Inserta historias (tuplas de texto en el orden de COLUMNAS_HISTORIA) en una
+    sola transacción con executemany por lotes. Los valores se convierten a los
+    tipos de la tabla con las mismas reglas que la migración y los usuarios que
+    no existan se crean sin contraseña. Las filas cuyo consecutivo ya existe se
+    omiten. Devuelve (insertadas, omitidas).
+    """
+    leidas = insertadas = 0
+    maximos: dict[int, int] = {}
+    filas = iter(filas)
+    with transaccion() as conn:
+        while lote := list(islice(filas, tamano_lote)):
+            leidas += len(lote)
+            conn.executemany(
+                "INSERT OR IGNORE INTO usuarios (usuario) VALUES (?)",
+                {(fila[1] or "",) for fila in lote},
+            )
+            cursor = conn.executemany(
+                f"""
+                INSERT OR IGNORE INTO historias ({", ".join(_COLUMNAS_TIPADAS)})
+                SELECT {_columnas_tipadas("f.")}
+                FROM (SELECT {", ".join(f"? AS {columna}" for columna in COLUMNAS_HISTORIA)}) AS f
+            """,
+                lote,
+            )
+            insertadas += cursor.rowcount
+            for fila in lote:
+                coincidencia = _PATRON_CONSECUTIVO.match(fila[0] or "")
+                if coincidencia:
+                    anio, numero = int(coincidencia.group(1)), int(
+                        coincidencia.group(2)
+                    )
+                    if numero > maximos.get(anio, 0):
+                        maximos[anio] = numero
+        # Que las historias nuevas no reciban un consecutivo importado
+        for anio, numero in maximos.items():
+            _avanzar_secuencia(conn, anio, numero)
+    return insertadas, leidas - insertadas
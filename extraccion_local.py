@@ -0,0 +1,140 @@
+import re
+
+# --- Extracción local por reglas ---
+# Muchos dictados siguen la plantilla "paciente Juan Pérez, 45 años, motivo dolor
+# torácico, diagnóstico ..., tratamiento ...". Para esos no hace falta la IA: una
+# sola alternancia compilada localiza etiquetas y edades en una pasada y el texto
+# entre una coincidencia y la siguiente es el valor del campo.
+
+CAMPOS = ("paciente", "edad", "motivo", "diagnostico", "tratamiento")
+
+# Confianza mínima (en todos los campos) para no llamar a la IA
+UMBRAL = 0.8
+
+# Sinónimos de cada etiqueta; las variantes largas van primero
+ETIQUETAS = {
+    "paciente": [r"nombre del paciente", r"paciente", r"nombre", r"se trata de"],
+    "edad": [r"edad de", r"edad"],
+    "motivo": [
+        r"motivo de (?:consulta|atenci[oó]n|llamad[oa])",
+        r"motivo",
+        r"consulta por",
+        r"acude por",
+    ],
+    "diagnostico": [
+        r"impresi[oó]n diagn[oó]stica",
+        r"diagn[oó]stico (?:probable|presuntivo)",
+        r"diagn[oó]stico",
+        r"dx",
+    ],
+    "tratamiento": [
+        r"tratamiento realizado",
+        r"tratamiento",
+        r"manejo",
+        r"se le administr[aó]",
+        r"se administr[aó]",
+    ],
+}
+
+_PATRON = re.compile(
+    r"\b(?:"
+    + "|".join(
+        f"(?P<{campo}>{'|'.join(sinonimos)})" for campo, sinonimos in ETIQUETAS.items()
+    )
+    + r"|(?P<anios>\d{1,3})\s*(?:años|anos)"
+    + r"|(?P<meses>\d{1,2})\s*mes(?:es)?"
+    + r")\b\s*[:\-]?",
+    re.IGNORECASE,
+)
+_PATRON_FINAL = re.compile(r"(?:[\s,;:.\-]+(?:y|e|con|de)?)+$", re.IGNORECASE)
+_PATRON_NOMBRE = re.compile(r"^[^\W\d_]+(?:[\s'\-][^\W\d_]+){0,4}$")
+_PATRON_ESPACIOS = re.compile(r"\s+")
+
+# Texto libre de más de esta longitud en un campo suele ser narración, no plantilla
+LARGO_MAXIMO = 160
+
+
+def _limpiar_valor(valor: str) -> str:
+    return _PATRON_FINAL.sub("", valor.strip(" \t\n,;:.-"))
+
+
+def _confianza_texto(valor: str) -> float:
+    if not valor:
+        return 0.0
+    return 0.9 if len(valor) <= LARGO_MAXIMO else 0.5
+
+
+def extraer(texto: str) -> tuple[dict, dict[str, float]]:
+    """
+    Extrae los campos de la historia sin llamar a la IA. Devuelve (datos, confianza):
+    `datos` sigue el mismo esquema JSON que la respuesta de Gemini y `confianza`
+    va de 0 a 1 por campo (0 si el campo no se encontró).
+    """
+    texto = _PATRON_ESPACIOS.sub(" ", texto).strip()
+    valores: dict[str, str] = {}
+    confianza = dict.fromkeys(CAMPOS, 0.0)
+    repetidos: set[str] = set()
+    edad = 0
+
+    abierto, inicio_valor = None, 0
+    for coincidencia in _PATRON.finditer(texto):
+        if abierto is not None:
+            valores[abierto] = _limpiar_valor(
+                texto[inicio_valor : coincidencia.start()]
+            )
+            abierto = None
+        campo = coincidencia.lastgroup
+        if campo in ("anios", "meses"):
+            if confianza["edad"]:
+                confianza["edad"] = min(
+                    confianza["edad"], 0.6
+                )  # varias edades: ambiguo
+                continue
+            numero = int(coincidencia.group(campo))
+            if campo == "meses":
+                # El esquema pide años enteros; un lactante se deja a la IA
+                edad, confianza["edad"] = 0, 0.5
+            else:
+                edad, confianza["edad"] = numero, 0.95 if numero <= 120 else 0.2
+        elif campo in valores:
+            repetidos.add(campo)
+        else:
+            abierto, inicio_valor = campo, coincidencia.end()
+    if abierto is not None:
+        valores[abierto] = _limpiar_valor(texto[inicio_valor:])
+
+    # "edad 45" sin la palabra "años"
+    if not confianza["edad"] and valores.get("edad", "").isdigit():
+        edad = int(valores["edad"])
+        confianza["edad"] = 0.9 if edad <= 120 else 0.2
+
+    paciente = valores.get("paciente", "")
+    if paciente:
+        confianza["paciente"] = 0.9 if _PATRON_NOMBRE.match(paciente) else 0.4
+        if paciente.islower():
+            paciente = paciente.title()
+    for campo in ("motivo", "diagnostico", "tratamiento"):
+        valor = valores.get(campo, "")
+        confianza[campo] = _confianza_texto(valor)
+        if valor:
+            valores[campo] = valor[0].upper() + valor[1:]
+    # Una etiqueta repetida deja dudas sobre cuál es el valor bueno
+    for campo in repetidos:
+        confianza[campo] = min(confianza[campo], 0.6)
+
+    corregido = texto[:1].upper() + texto[1:]
+    if corregido and corregido[-1] not in ".!?":
+        corregido += "."
+    datos = {
+        "texto_corregido": corregido,
+        "paciente": paciente or "No especificado",
+        "edad": edad,
+        "motivo": valores.get("motivo", ""),
+        "diagnostico": valores.get("diagnostico", ""),
+        "tratamiento": valores.get("tratamiento", ""),
+    }
+    return datos, confianza
+
+
+def es_confiable(confianza: dict[str, float], umbral: float = UMBRAL) -> bool:
+    return min(confianza.values()) >= umbral
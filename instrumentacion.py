@@ -0,0 +1,65 @@
+import logging
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+
+import db
+
+log = logging.getLogger("ambulancias.rendimiento")
+
+# Últimas mediciones: (nombre, milisegundos, consultas a la base)
+registros: deque[tuple[str, float, int]] = deque(maxlen=500)
+
+_abierta = threading.local()
+
+
+def _registrar(nombre: str, inicio: float, consultas: int) -> None:
+    milisegundos = (time.perf_counter() - inicio) * 1000
+    consultas = db.consultas_del_hilo() - consultas
+    registros.append((nombre, milisegundos, consultas))
+    log.info("%s: %.1f ms, %d consultas", nombre, milisegundos, consultas)
+
+
+def iniciar_rerun(nombre: str = "rerun") -> None:
+    """
+    Marca el inicio de una ejecución del script. Una medición anterior del mismo
+    hilo que no llegó a terminar_rerun() (el script terminó con una excepción) se
+    descarta: su duración incluiría el tiempo de espera hasta esta ejecución.
+    """
+    _abierta.medicion = (nombre, time.perf_counter(), db.consultas_del_hilo())
+
+
+def terminar_rerun() -> None:
+    pendiente = getattr(_abierta, "medicion", None)
+    if pendiente is not None:
+        _abierta.medicion = None
+        _registrar(*pendiente)
+
+
+@contextmanager
+def medir(nombre: str) -> Iterator[None]:
+    """Mide un bloque (p. ej. el rerun de un fragmento), también si sale con excepción."""
+    inicio, consultas = time.perf_counter(), db.consultas_del_hilo()
+    try:
+        yield
+    finally:
+        _registrar(nombre, inicio, consultas)
+
+
+def resumen() -> dict[str, dict]:
+    """Mediana y máximo de tiempo y consultas por nombre."""
+    por_nombre: dict[str, list[tuple[float, int]]] = {}
+    for nombre, milisegundos, consultas in list(registros):
+        por_nombre.setdefault(nombre, []).append((milisegundos, consultas))
+    resultado = {}
+    for nombre, muestras in por_nombre.items():
+        tiempos = sorted(m for m, _ in muestras)
+        resultado[nombre] = {
+            "veces": len(muestras),
+            "p50_ms": tiempos[len(tiempos) // 2],
+            "max_ms": tiempos[-1],
+            "consultas_p50": sorted(c for _, c in muestras)[len(muestras) // 2],
+        }
+    return resultado
@@ -0,0 +1,135 @@
+import csv
+import json
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+from db import COLUMNAS_HISTORIA, importar_historias, iterar_historias
+
+FORMATOS = ("csv", "jsonl", "parquet")
+
+
+def detectar_formato(ruta: str | Path) -> str:
+    """Deduce el formato por la extensión del archivo."""
+    extension = Path(ruta).suffix.lower().lstrip(".")
+    if extension == "json":
+        extension = "jsonl"
+    if extension not in FORMATOS:
+        raise ValueError(
+            f"Formato no soportado: '{extension}' (usa {', '.join(FORMATOS)})"
+        )
+    return extension
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise RuntimeError(
+            "El formato parquet requiere pyarrow (pip install pyarrow)"
+        ) from e
+    return pa, pq
+
+
+def _normalizar(registro: dict) -> tuple:
+    """Ordena un registro según COLUMNAS_HISTORIA; los vacíos pasan a None."""
+    return tuple(
+        None if registro.get(columna) in (None, "") else str(registro[columna])
+        for columna in COLUMNAS_HISTORIA
+    )
+
+
+# --- Lectura (generadores: una fila a la vez) ---
+def leer_csv(ruta: str | Path) -> Iterator[tuple]:
+    with open(ruta, newline="", encoding="utf-8") as f:
+        for registro in csv.DictReader(f):
+            yield _normalizar(registro)
+
+
+def leer_jsonl(ruta: str | Path) -> Iterator[tuple]:
+    with open(ruta, encoding="utf-8") as f:
+        for linea in f:
+            if linea.strip():
+                yield _normalizar(json.loads(linea))
+
+
+def leer_parquet(ruta: str | Path, tamano_lote: int = 5000) -> Iterator[tuple]:
+    _, pq = _pyarrow()
+    archivo = pq.ParquetFile(ruta)
+    for lote in archivo.iter_batches(batch_size=tamano_lote):
+        for registro in lote.to_pylist():
+            yield _normalizar(registro)
+
+
+# --- Escritura (consume lotes de iterar_historias) ---
+def escribir_csv(ruta: str | Path, lotes: Iterable[list[tuple]]) -> int:
+    total = 0
+    with open(ruta, "w", newline="", encoding="utf-8") as f:
+        escritor = csv.writer(f)
+        escritor.writerow(COLUMNAS_HISTORIA)
+        for lote in lotes:
+            escritor.writerows(lote)
+            total += len(lote)
+    return total
+
+
+def escribir_jsonl(ruta: str | Path, lotes: Iterable[list[tuple]]) -> int:
+    total = 0
+    with open(ruta, "w", encoding="utf-8") as f:
+        for lote in lotes:
+            f.writelines(
+                json.dumps(dict(zip(COLUMNAS_HISTORIA, fila)), ensure_ascii=False)
+                + "\n"
+                for fila in lote
+            )
+            total += len(lote)
+    return total
+
+
+def escribir_parquet(ruta: str | Path, lotes: Iterable[list[tuple]]) -> int:
+    pa, pq = _pyarrow()
+    # La edad es entera en la base; el resto, texto
+    esquema = pa.schema(
+        [
+            (columna, pa.int64() if columna == "edad" else pa.string())
+            for columna in COLUMNAS_HISTORIA
+        ]
+    )
+    total = 0
+    with pq.ParquetWriter(ruta, esquema) as escritor:
+        for lote in lotes:
+            columnas = list(zip(*lote))
+            escritor.write_batch(
+                pa.record_batch(
+                    [
+                        pa.array(valores, campo.type)
+                        for valores, campo in zip(columnas, esquema)
+                    ],
+                    schema=esquema,
+                )
+            )
+            total += len(lote)
+    return total
+
+
+LECTORES = {"csv": leer_csv, "jsonl": leer_jsonl, "parquet": leer_parquet}
+ESCRITORES = {"csv": escribir_csv, "jsonl": escribir_jsonl, "parquet": escribir_parquet}
+
+
+def exportar(
+    ruta: str | Path, formato: str | None = None, tamano_lote: int = 5000
+) -> int:
+    """Exporta todas las historias a un archivo. Devuelve el número de filas escritas."""
+    formato = formato or detectar_formato(ruta)
+    return ESCRITORES[formato](ruta, iterar_historias(tamano_lote))
+
+
+def importar(
+    ruta: str | Path, formato: str | None = None, tamano_lote: int = 5000
+) -> tuple[int, int]:
+    """
+    Importa historias desde un archivo en una sola transacción. Los consecutivos
+    que ya existen se omiten. Devuelve (insertadas, omitidas).
+    """
+    formato = formato or detectar_formato(ruta)
+    return importar_historias(LECTORES[formato](ruta), tamano_lote)
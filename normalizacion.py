@@ -0,0 +1,106 @@
+import re
+from collections.abc import Iterable
+from functools import lru_cache
+
+# --- Normalización de transcripciones ---
+# Una sola expresión compilada recorre el texto una vez: los separadores (espacios,
+# comas y muletillas entre ellos) se reducen juntos y las abreviaturas médicas se
+# expanden en la misma pasada.
+
+MULETILLAS = ("eh", "este", "pues", "o sea", "mmm", "ajá", "em", "ah")
+
+# Sensibles a mayúsculas: "TA" es tensión arterial, "ta" no
+ABREVIATURAS = {
+    "TA": "tensión arterial",
+    "PA": "presión arterial",
+    "FC": "frecuencia cardiaca",
+    "FR": "frecuencia respiratoria",
+    "SatO2": "saturación de oxígeno",
+    "SpO2": "saturación de oxígeno",
+    "HTA": "hipertensión arterial",
+    "DM": "diabetes mellitus",
+}
+
+# Tope de tramos distintos recordados por normalizador
+MAXIMO_REEMPLAZOS = 4096
+
+
+def _alternativa(palabras: Iterable[str]) -> str:
+    # Las más largas primero para que "o sea" gane a "o"
+    return "|".join(re.escape(p) for p in sorted(set(palabras), key=len, reverse=True))
+
+
+class Normalizador:
+    """Quita muletillas, normaliza espacios y comas y expande abreviaturas en una pasada."""
+
+    def __init__(
+        self,
+        muletillas: Iterable[str] = MULETILLAS,
+        abreviaturas: dict[str, str] | None = None,
+    ):
+        self.muletillas = tuple(muletillas)
+        self.abreviaturas = dict(ABREVIATURAS if abreviaturas is None else abreviaturas)
+        separador, iniciales = r"[\s,]", set()
+        if self.muletillas:
+            iniciales |= {
+                c for m in self.muletillas for c in (m[:1].lower(), m[:1].upper())
+            }
+            muletilla = rf"(?i:\b(?:{_alternativa(self.muletillas)})\b)"
+            separador = rf"(?:[\s,]|{muletilla})"
+            # Solo para tramos con muletillas: sus espacios internos ("o sea") no cuentan
+            self._muletilla = re.compile(muletilla)
+        # Un espacio simple entre dos palabras ya está bien: no se reemplaza (es lo más común)
+        patron = rf"(?! (?!{separador})){separador}+"
+        if self.abreviaturas:
+            iniciales |= {a[:1] for a in self.abreviaturas}
+            patron += rf"|\b(?:{_alternativa(self.abreviaturas)})\b"
+        # El prefiltro por primera letra descarta rápido casi todas las posiciones
+        self._patron = re.compile(
+            rf"(?=[\s,{re.escape(''.join(sorted(iniciales)))}])(?:{patron})"
+        )
+        # Reemplazo ya calculado por tramo; las abreviaturas vienen dadas
+        self._reemplazos = dict(self.abreviaturas)
+
+    def _reemplazo_separador(self, tramo: str) -> str:
+        if self.muletillas and tramo.strip(" \t\n\r\f\v,"):
+            tramo = self._muletilla.sub("", tramo)
+        # Quedan solo espacios y comas
+        coma = tramo.rfind(",")
+        if coma < 0:
+            return " " if tramo else ""
+        # Una sola coma, pegada a la palabra anterior; el espacio de después se conserva
+        return ", " if tramo[coma + 1 :] else ","
+
+    def _reemplazar(self, coincidencia: re.Match) -> str:
+        tramo = coincidencia.group()
+        reemplazo = self._reemplazos.get(tramo)
+        if reemplazo is None:
+            reemplazo = self._reemplazo_separador(tramo)
+            if len(self._reemplazos) < MAXIMO_REEMPLAZOS:
+                self._reemplazos[tramo] = reemplazo
+        return reemplazo
+
+    def limpiar(self, texto: str) -> str:
+        return self._patron.sub(self._reemplazar, texto).strip()
+
+    def limpiar_lote(self, textos: Iterable[str]) -> list[str]:
+        limpiar = self.limpiar
+        return [limpiar(texto) for texto in textos]
+
+
+@lru_cache(maxsize=64)
+def obtener_normalizador(muletillas_extra: tuple[str, ...] = ()) -> Normalizador:
+    """Normalizador compilado una vez por diccionario de muletillas (p. ej. uno por usuario)."""
+    return Normalizador(
+        MULETILLAS + tuple(m.strip() for m in muletillas_extra if m.strip())
+    )
+
+
+def limpiar_texto(texto: str, muletillas_extra: Iterable[str] = ()) -> str:
+    return obtener_normalizador(tuple(muletillas_extra)).limpiar(texto)
+
+
+def limpiar_textos(
+    textos: Iterable[str], muletillas_extra: Iterable[str] = ()
+) -> list[str]:
+    return obtener_normalizador(tuple(muletillas_extra)).limpiar_lote(textos)
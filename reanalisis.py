@@ -0,0 +1,212 @@
+import json
+import logging
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor
+
+import db
+import utils_ia
+
+log = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Solicitudes por segundo a la IA (la cuota gratuita de Gemini ronda las 60 por minuto)
+TASA = 1.0
+# Llamadas simultáneas como máximo
+TRABAJADORES = 4
+# Historias por lote: cada lote se escribe en una transacción junto con el punto de control
+TAMANO_LOTE = 20
+NOMBRE = "incompletas"
+
+
+class LimitadorTasa:
+    """
+    Cubeta de fichas compartida por todos los hilos: admite ráfagas de hasta
+    `rafaga` solicitudes y, en promedio, `tasa` solicitudes por segundo.
+    """
+
+    def __init__(self, tasa: float, rafaga: int = 1):
+        self.tasa = tasa
+        self.rafaga = rafaga
+        self._fichas = float(rafaga)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def adquirir(self) -> None:
+        """Bloquea hasta que haya una ficha disponible."""
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._fichas = min(
+                    self.rafaga, self._fichas + (ahora - self._ultimo) * self.tasa
+                )
+                self._ultimo = ahora
+                if self._fichas >= 1:
+                    self._fichas -= 1
+                    return
+                espera = (1 - self._fichas) / self.tasa
+            time.sleep(espera)
+
+
+class Progreso:
+    """Rendimiento, tasa de error y tiempo restante estimado del reanálisis."""
+
+    def __init__(self, total: int, procesadas: int = 0, errores: int = 0):
+        # `total` cuenta también lo ya procesado en ejecuciones anteriores
+        self.total = total
+        self.procesadas = procesadas
+        self.errores = errores
+        self._previas = procesadas
+        self._inicio = time.monotonic()
+
+    def registrar(self, procesadas: int, errores: int) -> None:
+        self.procesadas += procesadas
+        self.errores += errores
+
+    def resumen(self) -> dict:
+        transcurrido = time.monotonic() - self._inicio
+        en_esta_ejecucion = self.procesadas - self._previas
+        por_segundo = en_esta_ejecucion / transcurrido if transcurrido > 0 else 0.0
+        restantes = max(0, self.total - self.procesadas)
+        return {
+            "total": self.total,
+            "procesadas": self.procesadas,
+            "errores": self.errores,
+            "tasa_error": self.errores / self.procesadas if self.procesadas else 0.0,
+            "por_segundo": por_segundo,
+            "restante_s": restantes / por_segundo if por_segundo else None,
+        }
+
+
+def texto_historia(fila: tuple) -> str:
+    """Arma el texto que se envía a la IA con los campos que sí tiene la historia."""
+    _, paciente, edad, motivo, diagnostico, tratamiento = fila
+    partes = [
+        ("Paciente", paciente),
+        ("Edad", edad),
+        ("Motivo", motivo),
+        ("Diagnóstico", diagnostico),
+        ("Tratamiento", tratamiento),
+    ]
+    return ". ".join(f"{etiqueta}: {valor}" for etiqueta, valor in partes if valor)
+
+
+def reanalizar_incompletas(
+    analizar: Callable[[str], str] = utils_ia.analizar_texto,
+    trabajadores: int = TRABAJADORES,
+    tasa: float = TASA,
+    tamano_lote: int = TAMANO_LOTE,
+    nombre: str = NOMBRE,
+    reiniciar: bool = False,
+    al_progresar: Callable[[dict], object] | None = None,
+    detener: threading.Event | None = None,
+) -> dict:
+    """
+    Reanaliza las historias incompletas sin diagnóstico o tratamiento y llena
+    solo los campos vacíos. Retoma desde el último punto de control salvo con
+    reiniciar=True; las historias que fallan se cuentan como error y se saltan
+    hasta la siguiente ejecución desde cero. Devuelve el resumen final.
+    """
+    if reiniciar:
+        db.reanalisis_reiniciar(nombre)
+    ultimo_id, procesadas, errores = db.reanalisis_obtener_punto(nombre) or (0, 0, 0)
+    progreso = Progreso(
+        procesadas + db.contar_incompletas(ultimo_id), procesadas, errores
+    )
+    limitador = LimitadorTasa(tasa)
+
+    def analizar_fila(fila: tuple) -> dict | None:
+        limitador.adquirir()
+        try:
+            return json.loads(analizar(texto_historia(fila)))
+        except Exception:  # noqa: BLE001 - la historia se cuenta como error y se salta
+            return None
+
+    with ThreadPoolExecutor(
+        max_workers=trabajadores, thread_name_prefix="reanalisis"
+    ) as ejecutor:
+        for lote in db.iterar_incompletas(ultimo_id, tamano_lote):
+            if detener is not None and detener.is_set():
+                break
+            resultados = [
+                (fila[0], datos)
+                for fila, datos in zip(lote, ejecutor.map(analizar_fila, lote))
+                if datos is not None
+            ]
+            progreso.registrar(len(lote), len(lote) - len(resultados))
+            db.reanalisis_guardar_lote(
+                nombre, resultados, lote[-1][0], progreso.procesadas, progreso.errores
+            )
+            if al_progresar is not None:
+                al_progresar(progreso.resumen())
+    return progreso.resumen()
+
+
+class ReanalisisEnFondo:
+    """
+    Un reanálisis a la vez en un hilo de fondo, compartido por todas las
+    sesiones: la página que lo lanza no queda bloqueada durante el lote de
+    Gemini y cualquiera puede ver su progreso con estado(). detener() lo corta
+    al terminar el lote en curso; el punto de control queda guardado.
+    """
+
+    def __init__(self, reanalizar: Callable[..., dict] = reanalizar_incompletas):
+        self.reanalizar = reanalizar
+        self.resumen: dict | None = None
+        self.error: str | None = None
+        self._lock = threading.Lock()
+        self._detener = threading.Event()
+        self._hilo: threading.Thread | None = None
+
+    def en_marcha(self) -> bool:
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(
+        self, reiniciar: bool = False, al_terminar: Callable[[], object] | None = None
+    ) -> bool:
+        """Lanza el reanálisis; devuelve False si ya había uno en marcha."""
+        with self._lock:
+            if self.en_marcha():
+                return False
+            self.resumen, self.error = None, None
+            self._detener.clear()
+            self._hilo = threading.Thread(
+                target=self._ejecutar,
+                args=(reiniciar, al_terminar),
+                name="reanalisis-fondo",
+                daemon=True,
+            )
+            self._hilo.start()
+        return True
+
+    def _ejecutar(
+        self, reiniciar: bool, al_terminar: Callable[[], object] | None
+    ) -> None:
+        try:
+            self.resumen = self.reanalizar(
+                reiniciar=reiniciar, al_progresar=self._progresar, detener=self._detener
+            )
+        except Exception as e:
+            log.exception("Error en el reanálisis de historias incompletas")
+            self.error = str(e)[:200]
+        finally:
+            if al_terminar is not None:
+                al_terminar()
+
+    def _progresar(self, resumen: dict) -> None:
+        self.resumen = resumen
+
+    def detener(self, espera: float | None = 5.0) -> None:
+        self._detener.set()
+        if self._hilo is not None:
+            self._hilo.join(espera)
+
+    def estado(self) -> dict:
+        """En marcha o no, si se detuvo antes de acabar, último resumen de progreso (o None) y error."""
+        return {
+            "en_marcha": self.en_marcha(),
+            "detenido": self._detener.is_set(),
+            "resumen": self.resumen,
+            "error": self.error,
+        }
@@ -0,0 +1,53 @@
+"""
+Vuelca las métricas del dictado (histogramas por tramo y contadores) en texto
+de Prometheus o JSON. Con --salida el archivo se reemplaza de forma atómica,
+apto para el textfile collector de node_exporter (p. ej. desde cron).
+
+    python scripts/exportar_metricas.py
+    python scripts/exportar_metricas.py --formato prometheus --salida /var/lib/node_exporter/ambulancias.prom
+    python scripts/exportar_metricas.py --formato json --salida metricas.json
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+import telemetria
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--formato", choices=["prometheus", "json"], default="prometheus"
+    )
+    parser.add_argument(
+        "--salida", help="archivo de destino (por defecto la salida estándar)"
+    )
+    parser.add_argument(
+        "--db",
+        help="ruta de la base de datos (por defecto HISTORIAS_DB o historias.db)",
+    )
+    args = parser.parse_args()
+
+    if args.db:
+        db.configurar_db(args.db)
+    db.init_db()
+
+    if args.salida:
+        telemetria.exportar(args.salida, args.formato)
+    else:
+        contenido = (
+            telemetria.a_prometheus()
+            if args.formato == "prometheus"
+            else telemetria.a_json()
+        )
+        print(contenido.rstrip("\n"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""
+Importa o exporta historias en CSV, JSONL o Parquet.
+
+    python scripts/intercambio_historias.py exportar turno.parquet
+    python scripts/intercambio_historias.py importar turno.csv --db /ruta/historias.db
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+import intercambio
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("accion", choices=["importar", "exportar"])
+    parser.add_argument("archivo")
+    parser.add_argument(
+        "--formato",
+        choices=intercambio.FORMATOS,
+        help="por defecto se deduce de la extensión",
+    )
+    parser.add_argument(
+        "--db",
+        help="ruta de la base de datos (por defecto HISTORIAS_DB o historias.db)",
+    )
+    parser.add_argument("--lote", type=int, default=5000, help="filas por lote")
+    args = parser.parse_args()
+
+    if args.db:
+        db.configurar_db(args.db)
+    db.init_db()
+
+    inicio = time.perf_counter()
+    if args.accion == "exportar":
+        total = intercambio.exportar(args.archivo, args.formato, args.lote)
+        print(
+            f"{total} historias exportadas a {args.archivo} en {time.perf_counter() - inicio:.2f} s"
+        )
+    else:
+        insertadas, omitidas = intercambio.importar(
+            args.archivo, args.formato, args.lote
+        )
+        print(
+            f"{insertadas} historias importadas, {omitidas} omitidas por consecutivo duplicado "
+            f"en {time.perf_counter() - inicio:.2f} s"
+        )
+
+
+if __name__ == "__main__":
+    main()
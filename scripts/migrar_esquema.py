@@ -0,0 +1,75 @@
+"""
+Aplica las migraciones pendientes del esquema (PRAGMA user_version). La copia
+de historias a columnas con tipos va por lotes, cada uno en su transacción, así
+que la app puede seguir en marcha; --pausa deja más hueco a sus escrituras.
+
+    python scripts/migrar_esquema.py
+    python scripts/migrar_esquema.py --db /datos/historias.db --lote 10000 --pausa 0.05
+    python scripts/migrar_esquema.py --estado
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import db
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--db",
+        help="ruta de la base de datos (por defecto HISTORIAS_DB o historias.db)",
+    )
+    parser.add_argument(
+        "--lote",
+        type=int,
+        default=db.TAMANO_LOTE_MIGRACION,
+        help="historias por transacción",
+    )
+    parser.add_argument(
+        "--pausa", type=float, default=0.0, help="segundos de espera entre lotes"
+    )
+    parser.add_argument(
+        "--hasta", type=int, help="versión objetivo (por defecto la última)"
+    )
+    parser.add_argument(
+        "--estado",
+        action="store_true",
+        help="solo muestra la versión actual y las pendientes",
+    )
+    args = parser.parse_args()
+
+    if args.db:
+        db.configurar_db(args.db)
+
+    version = db.version_esquema()
+    pendientes = [
+        m
+        for m in db.MIGRACIONES
+        if m.version > version and (args.hasta is None or m.version <= args.hasta)
+    ]
+    print(f"Versión del esquema: {version}")
+    for migracion in pendientes:
+        print(f"  pendiente {migracion.version}: {migracion.descripcion}")
+    if args.estado or not pendientes:
+        return
+
+    inicio = time.perf_counter()
+
+    def mostrar(copiadas: int, total: int) -> None:
+        print(f"\r  {copiadas}/{total} historias copiadas", end="", flush=True)
+
+    aplicadas = db.migrar(args.hasta, args.lote, args.pausa, mostrar)
+    print(
+        f"\nAplicadas {aplicadas} en {time.perf_counter() - inicio:.1f} s; versión {db.version_esquema()}"
+    )
+
+
+if __name__ == "__main__":
+    main()
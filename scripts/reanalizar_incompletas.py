@@ -0,0 +1,85 @@
+"""
+Reanaliza con IA las historias incompletas sin diagnóstico o tratamiento.
+Retoma desde el último punto de control; usa --reiniciar para empezar de cero.
+
+    GEMINI_API_KEY=... python scripts/reanalizar_incompletas.py --tasa 1 --trabajadores 4
+"""
+
+import argparse
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import google.generativeai as genai
+
+import db
+import reanalisis
+
+
+def mostrar(resumen: dict) -> None:
+    restante = (
+        "?"
+        if resumen["restante_s"] is None
+        else f"{resumen['restante_s'] / 60:.1f} min"
+    )
+    print(
+        f"{resumen['procesadas']}/{resumen['total']} historias · {resumen['por_segundo']:.2f}/s · "
+        f"errores {resumen['tasa_error']:.1%} · restante {restante}",
+        flush=True,
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--db",
+        help="ruta de la base de datos (por defecto HISTORIAS_DB o historias.db)",
+    )
+    parser.add_argument(
+        "--trabajadores",
+        type=int,
+        default=reanalisis.TRABAJADORES,
+        help="llamadas simultáneas",
+    )
+    parser.add_argument(
+        "--tasa", type=float, default=reanalisis.TASA, help="solicitudes por segundo"
+    )
+    parser.add_argument(
+        "--lote",
+        type=int,
+        default=reanalisis.TAMANO_LOTE,
+        help="historias por transacción",
+    )
+    parser.add_argument(
+        "--reiniciar", action="store_true", help="ignora el punto de control guardado"
+    )
+    args = parser.parse_args()
+
+    if "GEMINI_API_KEY" not in os.environ:
+        parser.error("define la variable de entorno GEMINI_API_KEY")
+    genai.configure(api_key=os.environ["GEMINI_API_KEY"])
+
+    if args.db:
+        db.configurar_db(args.db)
+    db.init_db()
+
+    try:
+        resumen = reanalisis.reanalizar_incompletas(
+            trabajadores=args.trabajadores,
+            tasa=args.tasa,
+            tamano_lote=args.lote,
+            reiniciar=args.reiniciar,
+            al_progresar=mostrar,
+        )
+    except KeyboardInterrupt:
+        print("Interrumpido; el progreso quedó guardado hasta el último lote completo.")
+        return
+    mostrar(resumen)
+
+
+if __name__ == "__main__":
+    main()
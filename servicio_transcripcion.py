@@ -0,0 +1,427 @@
+import logging
+import os
+import pickle
+import queue
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from contextlib import suppress
+
+import numpy as np
+
+import telemetria
+
+log = logging.getLogger(__name__)
+
+# --- Configuración ---
+# Procesos con un Whisper cargado cada uno; por defecto uno por cada dos núcleos
+PROCESOS = int(os.environ.get("TRANSCRIPCION_PROCESOS", "0")) or max(
+    1, (os.cpu_count() or 2) // 2
+)
+# Hilos de PyTorch por proceso: procesos × hilos no debería superar los núcleos
+HILOS_POR_PROCESO = int(os.environ.get("TRANSCRIPCION_HILOS", "1"))
+# Trabajos esperando (sin contar los que ya se procesan) antes de rechazar nuevos
+MAXIMO_EN_COLA = 16
+# Trabajos terminados que se recuerdan para consultar su estado
+MAXIMO_TERMINADOS = 1000
+# Segundos entre comprobaciones de que los procesos siguen vivos
+VIGILANCIA = 1.0
+# Script que ejecuta cada proceso (ver trabajador_transcripcion.py)
+SCRIPT_TRABAJADOR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "trabajador_transcripcion.py"
+)
+
+
+class ColaLlena(RuntimeError):
+    """El servicio ya tiene MAXIMO_EN_COLA trabajos esperando."""
+
+
+class ServicioCaido(RuntimeError):
+    """El proceso que tenía el trabajo murió, o no queda ningún proceso vivo."""
+
+
+# --- Funciones de los procesos trabajadores (nivel de módulo para poder enviarlas) ---
+def iniciar_whisper(hilos: int) -> None:
+    """Deja el modelo cargado antes del primer trabajo."""
+    import utils_audio
+
+    try:
+        import torch
+
+        torch.set_num_threads(hilos)
+    except ImportError:
+        pass
+    utils_audio.obtener_modelo()
+
+
+def transcribir_con_whisper(audio: np.ndarray, samplerate: int) -> str:
+    import utils_audio
+
+    return utils_audio.transcribir_audio(audio, samplerate)
+
+
+def _trabajador(
+    trabajos,
+    resultados,
+    iniciar: Callable[[int], object],
+    hilos: int,
+    transcribir: Callable,
+) -> None:
+    try:
+        iniciar(hilos)
+    except Exception as e:  # noqa: BLE001 - el error viaja al proceso de la app
+        resultados.put(("caido", None, repr(e), time.time()))
+        return
+    resultados.put(("listo_proceso", None, None, time.time()))
+    while True:
+        trabajo = trabajos.get()
+        if trabajo is None:
+            return
+        id_trabajo, audio, samplerate = trabajo
+        resultados.put(("procesando", id_trabajo, None, time.time()))
+        with telemetria.registro.capturar() as tramos:
+            try:
+                tipo, valor = "listo", transcribir(audio, samplerate)
+            except Exception as e:  # noqa: BLE001 - el error viaja al proceso de la app
+                tipo, valor = "error", f"{type(e).__name__}: {e}"
+        # Los tramos medidos aquí (whisper, escribir_wav) se guardan en el proceso de la app
+        if tramos:
+            resultados.put(("tramos", id_trabajo, tramos, time.time()))
+        resultados.put((tipo, id_trabajo, valor, time.time()))
+
+
+class ServicioTranscripcion:
+    """
+    Pool de procesos con Whisper ya cargado, fuera del hilo del script de
+    Streamlit y del GIL del servidor. Cada trabajo recibe un id: se consulta con
+    estado() (sondeo), se espera con resultado() o se recibe con el callback
+    `al_terminar` de enviar(). La cola es acotada: con MAXIMO_EN_COLA trabajos
+    esperando, enviar() rechaza (ColaLlena) o bloquea según `bloquear`. Si un
+    proceso muere, sus trabajos fallan con ServicioCaido; si mueren todos,
+    también los que esperaban y los que se envíen después. `iniciar` y
+    `transcribir` llegan a los procesos por nombre: deben poder importarse, no
+    estar definidas en el script que se ejecuta como __main__.
+    """
+
+    def __init__(
+        self,
+        procesos: int = PROCESOS,
+        maximo_en_cola: int = MAXIMO_EN_COLA,
+        hilos_por_proceso: int = HILOS_POR_PROCESO,
+        iniciar: Callable[[int], object] = iniciar_whisper,
+        transcribir: Callable[[np.ndarray, int], str] = transcribir_con_whisper,
+    ):
+        self.procesos = procesos
+        self.maximo_en_cola = maximo_en_cola
+        # Trabajos para los hilos que alimentan los procesos y mensajes de estos
+        self._cola: queue.Queue = queue.Queue()
+        self._resultados: queue.Queue = queue.Queue()
+        # Un hueco por proceso más los que pueden esperar: al agotarse hay contrapresión
+        self._huecos = threading.BoundedSemaphore(procesos + maximo_en_cola)
+        self._trabajos: OrderedDict[str, dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._esperas: deque[float] = deque(maxlen=500)
+        self._duraciones: deque[float] = deque(maxlen=500)
+        self._contadores = {"completados": 0, "errores": 0, "rechazados": 0}
+        self._procesos_listos = 0
+        self._listo = threading.Event()
+        self._error_inicio: str | None = None
+        self._caido: str | None = None
+        self._cerrado = False
+        # Id del último trabajo que tomó cada proceso
+        self._en_curso = [""] * procesos
+        self._nombres = [f"whisper-{i}" for i in range(procesos)]
+        configuracion = pickle.dumps((iniciar, hilos_por_proceso, transcribir))
+        # Un intérprete nuevo por proceso (fork no es seguro con PyTorch cargado) que
+        # arranca en su propio script y no en el __main__ de la app
+        self._procesos = [
+            subprocess.Popen(
+                [sys.executable, SCRIPT_TRABAJADOR],
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+            )
+            for _ in range(procesos)
+        ]
+        for proceso in self._procesos:
+            # Si muere al arrancar, _vigilar() lo detecta
+            with suppress(OSError):
+                pickle.dump(list(sys.path), proceso.stdin)
+                proceso.stdin.write(configuracion)
+                proceso.stdin.flush()
+        self._alimentadores = [
+            threading.Thread(
+                target=self._alimentar, args=(i,), name=nombre, daemon=True
+            )
+            for i, nombre in enumerate(self._nombres)
+        ]
+        for hilo in self._alimentadores:
+            hilo.start()
+        self._recolector = threading.Thread(
+            target=self._recolectar, name="transcripcion-resultados", daemon=True
+        )
+        self._recolector.start()
+
+    @property
+    def caido(self) -> bool:
+        """No queda ningún proceso vivo: hay que crear otro servicio."""
+        return self._caido is not None
+
+    def esperar_listo(self, timeout: float | None = None) -> bool:
+        """Espera a que todos los procesos tengan el modelo cargado."""
+        listo = self._listo.wait(timeout)
+        if self._caido is not None:
+            raise ServicioCaido(self._caido)
+        if self._error_inicio is not None:
+            raise RuntimeError(
+                f"No se pudo iniciar un proceso de transcripción: {self._error_inicio}"
+            )
+        return listo
+
+    def enviar(
+        self,
+        audio: np.ndarray,
+        samplerate: int = 16000,
+        bloquear: bool = False,
+        timeout: float | None = None,
+        al_terminar: Callable[[str, dict], object] | None = None,
+    ) -> str:
+        """Encola el audio y devuelve el id del trabajo. Lanza ColaLlena si no hay hueco."""
+        if self._caido is not None:
+            raise ServicioCaido(self._caido)
+        if not self._huecos.acquire(
+            blocking=bloquear, timeout=timeout if bloquear else None
+        ):
+            with self._lock:
+                self._contadores["rechazados"] += 1
+            raise ColaLlena(
+                f"Hay {self.maximo_en_cola} transcripciones esperando; intenta de nuevo en unos segundos"
+            )
+        id_trabajo = uuid.uuid4().hex
+        with self._lock:
+            self._trabajos[id_trabajo] = {
+                "estado": "en_cola",
+                "enviado": time.time(),
+                "evento": threading.Event(),
+                "al_terminar": al_terminar,
+            }
+        self._cola.put((id_trabajo, np.asarray(audio, dtype=np.float32), samplerate))
+        return id_trabajo
+
+    def _alimentar(self, indice: int) -> None:
+        """
+        Hilo de cada proceso: le pasa los trabajos de la cola de uno en uno y
+        reenvía sus mensajes al recolector. Termina cuando el proceso sale.
+        """
+        proceso = self._procesos[indice]
+        try:
+            while True:
+                mensaje = pickle.load(proceso.stdout)
+                self._resultados.put(mensaje)
+                if mensaje[0] == "caido":
+                    return
+                if mensaje[0] not in ("listo_proceso", "listo", "error"):
+                    continue
+                trabajo = self._cola.get()
+                if trabajo is not None:
+                    self._en_curso[indice] = trabajo[0]
+                pickle.dump(trabajo, proceso.stdin)
+                proceso.stdin.flush()
+                if trabajo is None:
+                    return
+        except (EOFError, OSError, ValueError, pickle.UnpicklingError):
+            # El proceso murió: _vigilar() falla el trabajo que tenía
+            return
+
+    def _recolectar(self) -> None:
+        vigilado = time.monotonic()
+        while True:
+            if time.monotonic() - vigilado >= VIGILANCIA:
+                self._vigilar()
+                vigilado = time.monotonic()
+            try:
+                tipo, id_trabajo, valor, instante = self._resultados.get(
+                    timeout=VIGILANCIA
+                )
+            except queue.Empty:
+                continue
+            if tipo == "fin":
+                return
+            if tipo == "tramos":
+                for nombre, segundos in valor:
+                    telemetria.observar(nombre, segundos)
+                continue
+            if tipo in ("listo_proceso", "caido"):
+                self._procesos_listos += 1
+                if tipo == "caido":
+                    self._error_inicio = valor
+                if self._procesos_listos == self.procesos or tipo == "caido":
+                    self._listo.set()
+                continue
+            with self._lock:
+                trabajo = self._trabajos.get(id_trabajo)
+                # Ya terminado: _vigilar() lo dio por perdido justo antes de que llegara
+                if trabajo is None or trabajo["estado"] in ("listo", "error"):
+                    continue
+                if tipo == "procesando":
+                    trabajo["estado"], trabajo["inicio"] = "procesando", instante
+                    self._esperas.append(instante - trabajo["enviado"])
+                    continue
+                trabajo["estado"], trabajo["fin"] = tipo, instante
+                trabajo["texto" if tipo == "listo" else "error"] = valor
+                self._duraciones.append(instante - trabajo.get("inicio", instante))
+                self._contadores["completados" if tipo == "listo" else "errores"] += 1
+                self._olvidar_terminados()
+            self._avisar(id_trabajo, trabajo)
+
+    def _avisar(self, id_trabajo: str, trabajo: dict) -> None:
+        self._huecos.release()
+        trabajo["evento"].set()
+        if trabajo["al_terminar"] is not None:
+            try:
+                trabajo["al_terminar"](id_trabajo, self._resumen(trabajo))
+            except Exception:
+                log.exception("Error en el aviso de la transcripción %s", id_trabajo)
+
+    def _vigilar(self) -> None:
+        """Falla los trabajos de los procesos muertos y, si no queda ninguno, todos los pendientes."""
+        muertos = [
+            i for i, proceso in enumerate(self._procesos) if proceso.poll() is not None
+        ]
+        if not muertos or self._cerrado:
+            return
+        todos = len(muertos) == len(self._procesos)
+        # Trabajo que tenía cada proceso muerto -> nombre del proceso
+        sin_proceso = {self._en_curso[i]: self._nombres[i] for i in muertos}
+        if todos:
+            if self._caido is None:
+                self._caido = f"Los procesos de transcripción terminaron ({self._error_inicio or 'sin aviso'})"
+                log.error(self._caido)
+                self._listo.set()
+            self._vaciar_cola()
+        with self._lock:
+            perdidos = [
+                (id_trabajo, trabajo)
+                for id_trabajo, trabajo in self._trabajos.items()
+                if trabajo["estado"] in ("en_cola", "procesando")
+                and (todos or id_trabajo in sin_proceso)
+            ]
+            for id_trabajo, trabajo in perdidos:
+                trabajo["estado"], trabajo["fin"], trabajo["caido"] = (
+                    "error",
+                    time.time(),
+                    True,
+                )
+                trabajo["error"] = (
+                    self._caido
+                    or f"El proceso {sin_proceso[id_trabajo]} terminó durante la transcripción"
+                )
+                self._contadores["errores"] += 1
+        for id_trabajo, trabajo in perdidos:
+            self._avisar(id_trabajo, trabajo)
+
+    def _vaciar_cola(self) -> None:
+        """Descarta los trabajos (y su audio) que ya no leerá ningún proceso."""
+        while True:
+            try:
+                self._cola.get_nowait()
+            except queue.Empty:
+                return
+
+    def _olvidar_terminados(self) -> None:
+        terminados = [
+            i for i, t in self._trabajos.items() if t["estado"] in ("listo", "error")
+        ]
+        for id_trabajo in terminados[: max(0, len(terminados) - MAXIMO_TERMINADOS)]:
+            del self._trabajos[id_trabajo]
+
+    @staticmethod
+    def _resumen(trabajo: dict) -> dict:
+        return {
+            clave: trabajo[clave]
+            for clave in ("estado", "enviado", "inicio", "fin", "texto", "error")
+            if clave in trabajo
+        }
+
+    def estado(self, id_trabajo: str) -> dict:
+        """Estado del trabajo: en_cola, procesando, listo o error (con texto o error)."""
+        with self._lock:
+            trabajo = self._trabajos.get(id_trabajo)
+            if trabajo is None:
+                raise KeyError(id_trabajo)
+            resumen = self._resumen(trabajo)
+            if trabajo["estado"] == "en_cola":
+                resumen["posicion"] = sum(
+                    1
+                    for t in self._trabajos.values()
+                    if t["estado"] == "en_cola" and t["enviado"] < trabajo["enviado"]
+                )
+            return resumen
+
+    def resultado(self, id_trabajo: str, timeout: float | None = None) -> str:
+        """
+        Espera el trabajo, lo olvida y devuelve el texto. Lanza RuntimeError si
+        falló la transcripción y ServicioCaido si se perdió con su proceso.
+        """
+        with self._lock:
+            trabajo = self._trabajos[id_trabajo]
+        if not trabajo["evento"].wait(timeout):
+            raise TimeoutError(
+                f"La transcripción {id_trabajo} no terminó en {timeout} s"
+            )
+        with self._lock:
+            self._trabajos.pop(id_trabajo, None)
+        if trabajo["estado"] == "error":
+            raise (ServicioCaido if trabajo.get("caido") else RuntimeError)(
+                trabajo["error"]
+            )
+        return trabajo["texto"]
+
+    def transcribir(
+        self, audio: np.ndarray, samplerate: int = 16000, timeout: float | None = None
+    ) -> str:
+        """Envía (esperando hueco) y espera el texto: reemplazo directo de transcribir_audio()."""
+        return self.resultado(
+            self.enviar(audio, samplerate, bloquear=True, timeout=timeout), timeout
+        )
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            esperas, duraciones = sorted(self._esperas), sorted(self._duraciones)
+            estados = [t["estado"] for t in self._trabajos.values()]
+            resumen = dict(self._contadores)
+        resumen["en_cola"] = estados.count("en_cola")
+        resumen["procesando"] = estados.count("procesando")
+        for nombre, muestras in (("espera", esperas), ("duracion", duraciones)):
+            if muestras:
+                resumen[f"{nombre}_p50_s"] = muestras[len(muestras) // 2]
+                resumen[f"{nombre}_p95_s"] = muestras[
+                    min(len(muestras) - 1, int(len(muestras) * 0.95))
+                ]
+        return resumen
+
+    def cerrar(self, timeout: float = 10.0) -> None:
+        if self._cerrado:
+            return
+        self._cerrado = True
+        for _ in self._procesos:
+            self._cola.put(None)
+        for proceso in self._procesos:
+            try:
+                proceso.wait(timeout)
+            except subprocess.TimeoutExpired:
+                proceso.terminate()
+                proceso.wait()
+        for hilo in self._alimentadores:
+            hilo.join(timeout)
+        for proceso in self._procesos:
+            # Si el proceso murió a mitad de un envío, la tubería ya está rota
+            with suppress(OSError):
+                proceso.stdin.close()
+            proceso.stdout.close()
+        self._vaciar_cola()
+        self._resultados.put(("fin", None, None, 0.0))
+        self._recolector.join(timeout)
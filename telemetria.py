@@ -0,0 +1,295 @@
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from collections.abc import Iterator
+from contextlib import contextmanager
+from datetime import datetime
+
+import db
+
+log = logging.getLogger(__name__)
+
+# --- Configuración ---
+# TELEMETRIA=0 la desactiva al arrancar; también se activa y desactiva desde Administración
+ACTIVA = os.environ.get("TELEMETRIA", "1") != "0"
+# Límites superiores (segundos) de los cubos de los histogramas; el último recoge el resto
+LIMITES = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+    float("inf"),
+)
+# Lo acumulado se suma a SQLite cada tantas observaciones o segundos, lo que llegue antes
+VOLCAR_CADA = 100
+VOLCAR_SEGUNDOS = 30.0
+
+
+class Telemetria:
+    """
+    Tramos cronometrados y contadores del flujo de dictado. Cada observación solo
+    toca memoria (su cubo del histograma y la ventana de las últimas duraciones);
+    las tablas metricas_* se actualizan por lotes, así medir no espera a la base.
+    """
+
+    def __init__(self, activa: bool = ACTIVA, ventana: int = 500):
+        self.activa = activa
+        self.ventana = ventana
+        self._lock = threading.Lock()
+        self._recientes: dict[str, deque[float]] = {}
+        # Pendiente de volcar: (nombre, limite) -> [veces, suma] y nombre -> incremento
+        self._cubos: dict[tuple[str, float], list] = {}
+        self._contadores: dict[str, int] = {}
+        self._sin_volcar = 0
+        self._ultimo_volcado = time.monotonic()
+        self._captura = threading.local()
+
+    @contextmanager
+    def capturar(self) -> Iterator[list[tuple[str, float]]]:
+        """
+        Dentro del bloque, las duraciones observadas en este hilo van a la lista
+        que devuelve y no al registro: un proceso trabajador las envía así al
+        proceso de la app, que es el que las guarda.
+        """
+        self._captura.lista = capturadas = []
+        try:
+            yield capturadas
+        finally:
+            self._captura.lista = None
+
+    @contextmanager
+    def tramo(self, nombre: str) -> Iterator[None]:
+        """Cronometra el bloque, también si sale con excepción."""
+        if not self.activa:
+            yield
+            return
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nombre, time.perf_counter() - inicio)
+
+    def observar(self, nombre: str, segundos: float) -> None:
+        if not self.activa:
+            return
+        capturadas = getattr(self._captura, "lista", None)
+        if capturadas is not None:
+            capturadas.append((nombre, segundos))
+            return
+        limite = LIMITES[bisect_left(LIMITES, segundos)]
+        with self._lock:
+            self._recientes.setdefault(nombre, deque(maxlen=self.ventana)).append(
+                segundos
+            )
+            cubo = self._cubos.setdefault((nombre, limite), [0, 0.0])
+            cubo[0] += 1
+            cubo[1] += segundos
+            volcar = self._toca_volcar()
+        if volcar:
+            self.volcar()
+
+    def contar(self, nombre: str, n: int = 1) -> None:
+        if not self.activa:
+            return
+        with self._lock:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + n
+            volcar = self._toca_volcar()
+        if volcar:
+            self.volcar()
+
+    def _toca_volcar(self) -> bool:
+        self._sin_volcar += 1
+        return (
+            self._sin_volcar >= VOLCAR_CADA
+            or time.monotonic() - self._ultimo_volcado >= VOLCAR_SEGUNDOS
+        )
+
+    def volcar(self) -> None:
+        """
+        Suma a SQLite lo acumulado desde el último volcado. Si falla se registra y
+        se pierde ese lote. Con la base sin migrar (un benchmark o un script que no
+        llamó a init_db) no se escribe nada y lo acumulado sigue en memoria.
+        """
+        with self._lock:
+            self._sin_volcar = 0
+            self._ultimo_volcado = time.monotonic()
+            if not db.esquema_al_dia():
+                return
+            cubos, contadores = self._cubos, self._contadores
+            self._cubos, self._contadores = {}, {}
+        if not cubos and not contadores:
+            return
+        try:
+            db.metricas_sumar(
+                [
+                    (nombre, limite, veces, suma)
+                    for (nombre, limite), (veces, suma) in cubos.items()
+                ],
+                list(contadores.items()),
+            )
+        except Exception:
+            log.exception("No se pudieron guardar las métricas")
+
+    def recientes(self) -> dict[str, dict]:
+        """p50, p95 y máximo (ms) de las últimas `ventana` duraciones de cada tramo en este proceso."""
+        with self._lock:
+            muestras = {
+                nombre: sorted(duraciones)
+                for nombre, duraciones in self._recientes.items()
+            }
+        return {
+            nombre: {
+                "veces": len(d),
+                "p50_ms": d[len(d) // 2] * 1000,
+                "p95_ms": d[min(len(d) - 1, int(len(d) * 0.95))] * 1000,
+                "max_ms": d[-1] * 1000,
+            }
+            for nombre, d in muestras.items()
+        }
+
+    def reiniciar(self, persistente: bool = False) -> None:
+        with self._lock:
+            self._recientes.clear()
+            self._cubos.clear()
+            self._contadores.clear()
+            self._sin_volcar = 0
+        if persistente:
+            db.metricas_vaciar()
+
+
+registro = Telemetria()
+tramo = registro.tramo
+observar = registro.observar
+contar = registro.contar
+
+
+# --- Lectura y exportación ---
+def cuantil_histograma(cubos: list[tuple[float, int]], q: float) -> float | None:
+    """
+    Cuantil aproximado a partir de los cubos (limite, veces) ordenados, con
+    interpolación lineal dentro del cubo como histogram_quantile de Prometheus.
+    En el último cubo (sin límite) se devuelve su límite inferior.
+    """
+    total = sum(veces for _, veces in cubos)
+    if not total:
+        return None
+    objetivo = q * total
+    acumulado = 0
+    for limite, veces in cubos:
+        indice = bisect_left(LIMITES, limite)
+        inferior = LIMITES[indice - 1] if indice > 0 else 0.0
+        if veces and acumulado + veces >= objetivo:
+            if limite == float("inf"):
+                return inferior
+            return inferior + (limite - inferior) * (objetivo - acumulado) / veces
+        acumulado += veces
+    return cubos[-1][0]
+
+
+def historico() -> dict:
+    """
+    Todo lo guardado en SQLite (tras volcar lo pendiente de este proceso):
+    {"tramos": {nombre: {veces, suma_s, p50_s, p95_s, cubos}}, "contadores": {nombre: valor}}.
+    """
+    registro.volcar()
+    filas, contadores = db.metricas_leer()
+    tramos: dict[str, dict] = {}
+    for nombre, limite, veces, suma in filas:
+        datos = tramos.setdefault(nombre, {"veces": 0, "suma_s": 0.0, "cubos": []})
+        datos["veces"] += veces
+        datos["suma_s"] += suma
+        datos["cubos"].append((limite, veces))
+    for datos in tramos.values():
+        datos["p50_s"] = cuantil_histograma(datos["cubos"], 0.5)
+        datos["p95_s"] = cuantil_histograma(datos["cubos"], 0.95)
+    return {"tramos": tramos, "contadores": dict(contadores)}
+
+
+def _etiqueta(valor: str) -> str:
+    return valor.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _limite_texto(limite: float) -> str:
+    return "+Inf" if limite == float("inf") else f"{limite:g}"
+
+
+def a_prometheus(datos: dict | None = None) -> str:
+    """Formato de texto de Prometheus (sirve para el textfile collector de node_exporter)."""
+    datos = historico() if datos is None else datos
+    lineas = [
+        "# HELP ambulancias_tramo_segundos Duración de cada tramo del dictado.",
+        "# TYPE ambulancias_tramo_segundos histogram",
+    ]
+    for nombre, datos_tramo in sorted(datos["tramos"].items()):
+        etiqueta = _etiqueta(nombre)
+        por_limite = dict(datos_tramo["cubos"])
+        acumulado = 0
+        for limite in sorted(set(LIMITES) | set(por_limite)):
+            acumulado += por_limite.get(limite, 0)
+            lineas.append(
+                f'ambulancias_tramo_segundos_bucket{{tramo="{etiqueta}",le="{_limite_texto(limite)}"}} {acumulado}'
+            )
+        lineas.append(
+            f'ambulancias_tramo_segundos_sum{{tramo="{etiqueta}"}} {datos_tramo["suma_s"]:.6f}'
+        )
+        lineas.append(
+            f'ambulancias_tramo_segundos_count{{tramo="{etiqueta}"}} {datos_tramo["veces"]}'
+        )
+    lineas += [
+        "# HELP ambulancias_eventos_total Eventos del dictado (coberturas y fallos de Gemini, reparaciones de JSON...).",
+        "# TYPE ambulancias_eventos_total counter",
+    ]
+    for nombre, valor in sorted(datos["contadores"].items()):
+        lineas.append(
+            f'ambulancias_eventos_total{{evento="{_etiqueta(nombre)}"}} {valor}'
+        )
+    return "\n".join(lineas) + "\n"
+
+
+def a_json(datos: dict | None = None) -> str:
+    datos = historico() if datos is None else datos
+    return json.dumps(
+        {
+            "generado": datetime.now().isoformat(timespec="seconds"),
+            "tramos": {
+                nombre: {
+                    "veces": datos_tramo["veces"],
+                    "suma_s": datos_tramo["suma_s"],
+                    "p50_s": datos_tramo["p50_s"],
+                    "p95_s": datos_tramo["p95_s"],
+                    "cubos": {
+                        _limite_texto(limite): veces
+                        for limite, veces in datos_tramo["cubos"]
+                    },
+                }
+                for nombre, datos_tramo in datos["tramos"].items()
+            },
+            "contadores": datos["contadores"],
+        },
+        ensure_ascii=False,
+        indent=2,
+    )
+
+
+def exportar(ruta: str, formato: str = "prometheus") -> None:
+    """Escribe el volcado en `ruta` de forma atómica (un lector nunca ve un archivo a medias)."""
+    if formato not in ("prometheus", "json"):
+        raise ValueError(f"Formato no soportado: '{formato}' (usa prometheus o json)")
+    contenido = a_prometheus() if formato == "prometheus" else a_json()
+    temporal = f"{ruta}.tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        f.write(contenido)
+    os.replace(temporal, ruta)
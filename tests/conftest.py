@@ -0,0 +1,10 @@
+import os
+import tempfile
+
+# Las pruebas nunca deben tocar la historias.db del repositorio (app.py llama a
+# init_db() al importarse); se fija una base temporal antes de importar db.
+os.environ.setdefault(
+    "HISTORIAS_DB", os.path.join(tempfile.mkdtemp(), "historias_pruebas.db")
+)
+# Coste de scrypt bajo para que crear usuarios y hacer login en pruebas sea rápido
+os.environ.setdefault("SCRYPT_N", "1024")
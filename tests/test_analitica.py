@@ -0,0 +1,163 @@
+from datetime import date
+
+import numpy as np
+import pytest
+
+import analitica
+import db
+
+
+@pytest.fixture(autouse=True)
+def base(tmp_path):
+    db.configurar_db(tmp_path / "analitica.db")
+    yield
+    db.cerrar_conexiones()
+
+
+def _resumenes():
+    with db.conexion() as c:
+        return (
+            c.execute(
+                "SELECT dia, usuario_id, estado, total FROM resumen_diario WHERE total > 0 ORDER BY 1, 2, 3"
+            ).fetchall(),
+            c.execute(
+                "SELECT dia, diagnostico, total FROM resumen_diagnosticos WHERE total > 0 ORDER BY 1, 2"
+            ).fetchall(),
+        )
+
+
+def test_triggers_mantienen_los_resumenes_como_un_recalculo():
+    db.init_db()
+    db.guardar_historia(None, "ana", "P1", "40", "M", "Neumonía", "T")
+    db.guardar_historia(None, "ana", "P2", "50", "M", "", "T", estado="completa")
+    consecutivo = db.guardar_historia(None, "luis", "P3", "60", "M", "", "T")
+    db.importar_historias(
+        [
+            (
+                "HC-2025-0100",
+                "eva",
+                "P4",
+                "30",
+                "M",
+                "Fractura",
+                "T",
+                "2025-06-01 10:00:00",
+                "completa",
+            )
+        ]
+    )
+    # La cola completa un diagnóstico vacío; otra historia cambia de estado y otra se borra
+    id_trabajo = db.cola_ia_encolar(consecutivo, "dictado")
+    db.cola_ia_completar(id_trabajo, consecutivo, {"diagnostico": "Neumonía"})
+    with db.transaccion() as c:
+        c.execute("UPDATE historias SET estado='completa' WHERE paciente='P1'")
+        c.execute("DELETE FROM historias WHERE paciente='P2'")
+
+    mantenidos = _resumenes()
+    db.resumen_reconstruir()
+    assert mantenidos == _resumenes()
+    hoy = date.today().isoformat()
+    assert (hoy, "neumonía", 2) in mantenidos[1]
+    assert ("2025-06-01", "fractura", 1) in mantenidos[1]
+
+
+def test_la_migracion_llena_los_resumenes_de_historias_existentes():
+    db.migrar(hasta=2)
+    db.guardar_historia(None, "ana", "P1", "40", "M", "Asma", "T")
+    db.guardar_historia(None, "ana", "P2", "40", "M", "asma", "T", estado="completa")
+    db.init_db()
+    assert _resumenes()[1] == [(date.today().isoformat(), "asma", 2)]
+    assert sorted(fila[2] for fila in _resumenes()[0]) == ["completa", "incompleta"]
+
+
+def test_panel_agrega_por_tripulacion_dia_y_diagnostico():
+    db.init_db()
+    filas = [
+        (
+            "HC-2026-0001",
+            "ana",
+            "P",
+            "40",
+            "M",
+            "Neumonía",
+            "T",
+            "2026-03-01 08:00:00",
+            "completa",
+        ),
+        (
+            "HC-2026-0002",
+            "ana",
+            "P",
+            "40",
+            "M",
+            "neumonía",
+            "T",
+            "2026-03-01 09:00:00",
+            "incompleta",
+        ),
+        (
+            "HC-2026-0003",
+            "ana",
+            "P",
+            "40",
+            "M",
+            "Asma",
+            "T",
+            "2026-03-03 09:00:00",
+            "completa",
+        ),
+        (
+            "HC-2026-0004",
+            "luis",
+            "P",
+            "40",
+            "M",
+            "",
+            "T",
+            "2026-03-03 10:00:00",
+            "incompleta",
+        ),
+        # Fuera del periodo
+        (
+            "HC-2026-0005",
+            "luis",
+            "P",
+            "40",
+            "M",
+            "Asma",
+            "T",
+            "2026-04-01 10:00:00",
+            "completa",
+        ),
+    ]
+    db.importar_historias(filas)
+
+    panel = analitica.panel(date(2026, 3, 1), date(2026, 3, 3), n=3)
+    assert panel["total"] == 4
+    assert panel["tasa_completas"] == pytest.approx(0.5)
+    tripulaciones = panel["por_tripulacion"]
+    assert list(tripulaciones.index) == ["ana", "luis"]
+    assert tripulaciones.loc["ana", ["incompleta", "completa", "total"]].tolist() == [
+        1,
+        2,
+        3,
+    ]
+    assert tripulaciones.loc["luis", "tasa_completas"] == 0.0
+    # Los días sin atenciones aparecen en cero
+    assert panel["por_dia"].to_numpy().tolist() == [[1, 1], [0, 0], [1, 1]]
+    assert panel["diagnosticos"].to_dict() == {
+        "neumonía": 2,
+        analitica.SIN_DIAGNOSTICO: 1,
+        "asma": 1,
+    }
+
+    vacio = analitica.panel(date(2020, 1, 1), date(2020, 1, 2))
+    assert (vacio["total"], vacio["tasa_completas"], len(vacio["por_tripulacion"])) == (
+        0,
+        0.0,
+        0,
+    )
+
+
+def test_tasa_sin_atenciones_es_cero():
+    assert analitica.tasa(np.array([1, 0]), np.array([4, 0])).tolist() == [0.25, 0.0]
@@ -1,5 +1,24 @@
 import json
+import threading
+import time
+
 import app
+import db
+import utils_ia
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def cache_aislada(tmp_path):
+    # Cada prueba con su propia base y la caché de la IA vacía
+    db.configurar_db(tmp_path / "test_historias.db")
+    db.init_db()
+    utils_ia.cache.limpiar()
+    utils_ia.interruptor.reiniciar()
+    utils_ia.metricas.reiniciar()
+    yield
+    db.cerrar_conexiones()
 
 
 def test_analizar_con_gemini_exito(monkeypatch):
@@ -9,7 +28,9 @@ def test_analizar_con_gemini_exito(monkeypatch):
 
     class GoodModel:
         def generate_content(self, prompt, generation_config=None):
-            return FakeResp('{"texto_corregido":"Texto ok","paciente":"Juan","edad":45,"motivo":"Dolor torácico","diagnostico":"Sospecha IAM","tratamiento":"Aspirina"}')
+            return FakeResp(
+                '{"texto_corregido":"Texto ok","paciente":"Juan","edad":45,"motivo":"Dolor torácico","diagnostico":"Sospecha IAM","tratamiento":"Aspirina"}'
+            )
 
     def fake_factory(model_id):
         return GoodModel()
@@ -47,3 +68,207 @@ def test_analizar_con_gemini_fallback_y_correcciones(monkeypatch):
     datos = json.loads(salida)
     assert datos["paciente"] == "Ana"
     assert datos["edad"] == 30
+
+
+def test_analizar_con_gemini_usa_cache_sin_llamar_al_modelo(monkeypatch):
+    class FakeResp:
+        def __init__(self, text):
+            self.text = text
+
+    llamadas = []
+
+    class GoodModel:
+        def generate_content(self, prompt, generation_config=None):
+            llamadas.append(prompt)
+            return FakeResp('{"texto_corregido":"X","paciente":"Luis","edad":60}')
+
+    monkeypatch.setattr(app.genai, "GenerativeModel", lambda model_id: GoodModel())
+
+    primera = app.analizar_con_gemini("Paciente Luis, 60 años")
+    # Mismo dictado con otras mayúsculas y espacios
+    segunda = app.analizar_con_gemini("  paciente   luis, 60 AÑOS ")
+    assert segunda == primera
+    assert len(llamadas) == 1
+
+    def factory_que_falla(model_id):
+        raise AssertionError("no debe construir el modelo en un acierto de caché")
+
+    monkeypatch.setattr(app.genai, "GenerativeModel", factory_que_falla)
+    # Acierto desde SQLite con la memoria vacía
+    utils_ia.cache.limpiar()
+    assert (
+        json.loads(app.analizar_con_gemini("Paciente Luis, 60 años"))["paciente"]
+        == "Luis"
+    )
+    assert utils_ia.cache.estadisticas()["aciertos"] == 1
+
+
+class _Resp:
+    def __init__(self, text):
+        self.text = text
+
+
+class _FastModel:
+    def generate_content(self, prompt, generation_config=None):
+        return _Resp('{"paciente":"Respaldo"}')
+
+
+def test_cobertura_usa_el_respaldo_si_el_principal_tarda(monkeypatch):
+    liberar = threading.Event()
+
+    class SlowModel:
+        def generate_content(self, prompt, generation_config=None):
+            liberar.wait(5)
+            return _Resp('{"paciente":"Lento"}')
+
+    class FastModel:
+        def generate_content(self, prompt, generation_config=None):
+            return _Resp('{"paciente":"Rápido"}')
+
+    def factory(model_id):
+        return SlowModel() if model_id.endswith("-flash") else FastModel()
+
+    monkeypatch.setattr(app.genai, "GenerativeModel", factory)
+    try:
+        salida = utils_ia.analizar_texto(
+            "dictado con red lenta", retardo_cobertura=0.05
+        )
+    finally:
+        liberar.set()
+    assert json.loads(salida)["paciente"] == "Rápido"
+    assert utils_ia.metricas.resumen()["gemini-2.5-flash-lite"]["exitos"] == 1
+
+
+def test_timeout_por_modelo_lanza_el_respaldo(monkeypatch):
+    liberar = threading.Event()
+
+    class HangModel:
+        def generate_content(self, prompt, generation_config=None):
+            liberar.wait(5)
+            return _Resp('{"paciente":"Tarde"}')
+
+    class FastModel:
+        def generate_content(self, prompt, generation_config=None):
+            return _Resp('{"paciente":"Respaldo"}')
+
+    monkeypatch.setattr(
+        app.genai,
+        "GenerativeModel",
+        lambda m: HangModel() if m.endswith("-flash") else FastModel(),
+    )
+    monkeypatch.setitem(utils_ia.TIMEOUTS_MODELO, "gemini-2.5-flash", 0.05)
+    avisos = []
+    try:
+        salida = utils_ia.analizar_texto(
+            "dictado sin respuesta", avisar=avisos.append, retardo_cobertura=60
+        )
+    finally:
+        liberar.set()
+    assert json.loads(salida)["paciente"] == "Respaldo"
+    assert utils_ia.metricas.resumen()["gemini-2.5-flash"]["timeouts"] == 1
+    assert "gemini-2.5-flash falló" in avisos[0]
+
+
+def test_respuesta_tardia_no_cuenta_como_exito(monkeypatch):
+    liberar, leida = threading.Event(), threading.Event()
+
+    class RespTardia:
+        @property
+        def text(self):
+            leida.set()
+            return '{"paciente":"Tarde"}'
+
+    class HangModel:
+        def generate_content(self, prompt, generation_config=None):
+            liberar.wait(5)
+            return RespTardia()
+
+    monkeypatch.setattr(
+        app.genai,
+        "GenerativeModel",
+        lambda m: HangModel() if m.endswith("-flash") else _FastModel(),
+    )
+    monkeypatch.setitem(utils_ia.TIMEOUTS_MODELO, "gemini-2.5-flash", 0.05)
+    salida = utils_ia.analizar_texto("dictado que llega tarde", retardo_cobertura=60)
+    assert json.loads(salida)["paciente"] == "Respaldo"
+
+    # El modelo lento termina después de su timeout: se descarta sin contarse
+    liberar.set()
+    assert leida.wait(5)
+    time.sleep(0.1)
+    resumen = utils_ia.metricas.resumen()["gemini-2.5-flash"]
+    assert (resumen["timeouts"], resumen["exitos"]) == (1, 0)
+
+
+def test_interruptor_salta_el_modelo_tras_fallos_seguidos(monkeypatch):
+    construidos = []
+
+    class BadModel:
+        def generate_content(self, prompt, generation_config=None):
+            raise ConnectionError("sin red")
+
+    class GoodModel:
+        def generate_content(self, prompt, generation_config=None):
+            return _Resp('{"paciente":"Ana"}')
+
+    def factory(model_id):
+        construidos.append(model_id)
+        return BadModel() if model_id.endswith("-flash") else GoodModel()
+
+    monkeypatch.setattr(app.genai, "GenerativeModel", factory)
+    for i in range(utils_ia.interruptor.umbral):
+        app.analizar_con_gemini(f"dictado {i}")
+    construidos.clear()
+
+    app.analizar_con_gemini("dictado con el interruptor abierto")
+    assert construidos == ["gemini-2.5-flash-lite"]
+
+
+def test_consultas_en_cache_se_invalidan_al_guardar():
+    app.invalidar_historias()
+    assert app.pagina_en_cache("ana", "incompleta", 25, None) == ([], None)
+    db.guardar_historia(None, "ana", "Pedro", "40", "Caída", "", "")
+    # Sin invalidar se sigue viendo la página en caché
+    assert app.pagina_en_cache("ana", "incompleta", 25, None) == ([], None)
+    app.invalidar_historias()
+    historias, _ = app.pagina_en_cache("ana", "incompleta", 25, None)
+    assert [h[2] for h in historias] == ["Pedro"]
+
+
+def _iniciar_sesion(usuario: str):
+    from streamlit.testing.v1 import AppTest
+
+    db.crear_usuario(usuario, "clave-segura")
+    at = AppTest.from_file("../app.py", default_timeout=60)
+    at.secrets["GEMINI_API_KEY"] = "sin-red"
+    at.run()
+    at.text_input(key="login_usuario").input(usuario)
+    at.text_input(key="login_pass").input("clave-segura")
+    next(b for b in at.button if "Iniciar sesión" in b.label).click().run()
+    assert not at.exception
+    return at
+
+
+def test_el_borrador_recuperado_llena_el_formulario():
+    db.crear_usuario("ana", "clave-segura")
+    db.borrador_guardar("ana", {"paciente": "Pedro", "edad": "40", "motivo": "Caída"})
+    at = _iniciar_sesion("ana")
+    # Con key, el widget ignora `value`: sin copiar a la key quedaría vacío
+    assert at.text_input(key="paciente").value == "Pedro"
+    assert at.text_input(key="edad").value == "40"
+    assert at.text_area(key="motivo_text").value == "Caída"
+
+
+def test_administracion_solo_para_administradores(monkeypatch):
+    monkeypatch.setenv("ADMINISTRADORES", "jefe, supervisora")
+    opciones = _iniciar_sesion("ana").sidebar.radio[0].options
+    assert "Administración" not in opciones
+    assert "Panel de supervisión" not in opciones
+
+    at = _iniciar_sesion("jefe")
+    assert "Administración" in at.sidebar.radio[0].options
+    at.sidebar.radio[0].set_value("Panel de supervisión").run()
+    assert not at.exception
+    at.sidebar.radio[0].set_value("Administración").run()
+    assert not at.exception
+    assert any("Reanalizar incompletas" in b.label for b in at.button)
@@ -0,0 +1,45 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+# Presupuesto de `import app` sin contar la importación de streamlit
+PRESUPUESTO_S = 2.5
+
+# Whisper, PyTorch y sounddevice se sustituyen por módulos que fallan al usarse:
+# importar app no debe tocarlos.
+CODIGO = """
+import sys, time, types
+
+class Pesado(types.ModuleType):
+    def __getattr__(self, nombre):
+        if nombre.startswith("__"):
+            raise AttributeError(nombre)
+        raise AssertionError(f"{self.__name__}.{nombre} usado al importar app")
+
+for nombre in ("whisper", "torch", "sounddevice"):
+    sys.modules[nombre] = Pesado(nombre)
+
+import streamlit
+
+inicio = time.perf_counter()
+import app
+print(time.perf_counter() - inicio)
+"""
+
+
+def test_import_app_dentro_del_presupuesto(tmp_path):
+    raiz = Path(__file__).resolve().parent.parent
+    entorno = dict(os.environ, HISTORIAS_DB=str(tmp_path / "arranque.db"))
+    resultado = subprocess.run(
+        [sys.executable, "-c", CODIGO],
+        cwd=raiz,
+        env=entorno,
+        capture_output=True,
+        text=True,
+        timeout=120,
+        check=False,
+    )
+    assert resultado.returncode == 0, resultado.stderr
+    duracion = float(resultado.stdout.strip().splitlines()[-1])
+    assert duracion < PRESUPUESTO_S
@@ -0,0 +1,98 @@
+import pytest
+
+import borradores
+
+
+class Base:
+    """Sustituye a db.borrador_guardar y recuerda cada escritura."""
+
+    def __init__(self):
+        self.escrituras = []
+        self.fallar = False
+
+    def __call__(self, usuario, cambios):
+        if self.fallar:
+            raise OSError("base bloqueada")
+        self.escrituras.append(dict(cambios))
+
+
+@pytest.fixture
+def base():
+    return Base()
+
+
+def autoguardado(base, guardado=None):
+    return borradores.AutoguardadoBorrador(
+        "ana",
+        guardado,
+        espera=2.0,
+        espera_maxima=10.0,
+        guardar=base,
+        temporizador=False,
+    )
+
+
+def test_escribe_tras_la_espera_solo_lo_que_cambio(base):
+    auto = autoguardado(base, {"paciente": "Ana", "edad": "40"})
+    auto.actualizar({"paciente": "Ana", "edad": "41", "motivo": ""}, ahora=0.0)
+    assert auto.pendiente == {"edad": "41"}
+    assert not auto.procesar(1.9)
+    assert auto.procesar(2.0)
+    assert base.escrituras == [{"edad": "41"}]
+    # Sin cambios nuevos no se vuelve a escribir
+    auto.actualizar({"paciente": "Ana", "edad": "41"}, ahora=5.0)
+    assert not auto.procesar(100.0)
+
+
+def test_cada_cambio_aplaza_pero_con_tope(base):
+    auto = autoguardado(base)
+    # Un cambio cada segundo: la espera nunca vence, el tope sí
+    for segundo in range(10):
+        auto.actualizar({"texto_libre": "x" * (segundo + 1)}, ahora=float(segundo))
+        assert not auto.procesar(float(segundo) + 0.5)
+    assert auto.procesar(10.0)
+    assert base.escrituras == [{"texto_libre": "x" * 10}]
+
+
+def test_volver_al_valor_guardado_cancela_lo_pendiente(base):
+    auto = autoguardado(base, {"motivo": "Caída"})
+    auto.actualizar({"motivo": "Caíd"}, ahora=0.0)
+    auto.actualizar({"motivo": "Caída"}, ahora=1.0)
+    assert auto.pendiente == {}
+    assert not auto.procesar(50.0)
+    assert base.escrituras == []
+
+
+def test_reintenta_si_falla_la_escritura(base):
+    auto = autoguardado(base)
+    auto.actualizar({"paciente": "Ana"}, ahora=0.0)
+    base.fallar = True
+    assert not auto.procesar(3.0)
+    assert auto.pendiente == {"paciente": "Ana"}
+    base.fallar = False
+    # Lo que falló ya venció: se escribe en cuanto se procesa
+    assert auto.procesar(3.1)
+    assert base.escrituras == [{"paciente": "Ana"}]
+    assert (auto.escrituras, auto.campos_escritos) == (1, 1)
+
+
+def test_descartar_olvida_lo_pendiente_y_lo_guardado(base):
+    auto = autoguardado(base, {"paciente": "Ana"})
+    auto.actualizar({"paciente": "Luis"}, ahora=0.0)
+    auto.descartar()
+    assert not auto.vaciar()
+    # Tras descartar, el formulario vacío no genera escrituras y uno nuevo sí
+    auto.actualizar({"paciente": ""}, ahora=1.0)
+    assert auto.pendiente == {}
+    auto.actualizar({"paciente": "Ana"}, ahora=2.0)
+    assert auto.vaciar()
+    assert base.escrituras == [{"paciente": "Ana"}]
+
+
+def test_temporizador_escribe_solo(base):
+    auto = borradores.AutoguardadoBorrador(
+        "ana", espera=0.01, espera_maxima=1.0, guardar=base
+    )
+    auto.actualizar({"paciente": "Ana"})
+    auto._temporizador.join(1.0)
+    assert base.escrituras == [{"paciente": "Ana"}]
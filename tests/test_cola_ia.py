@@ -0,0 +1,139 @@
+import json
+
+import pytest
+
+import cola_ia
+import db
+import utils_ia
+
+
+@pytest.fixture(autouse=True)
+def conn(tmp_path):
+    db.configurar_db(tmp_path / "test_historias.db")
+    db.init_db()
+    utils_ia.cache.limpiar()
+    utils_ia.interruptor.reiniciar()
+    yield
+    db.cerrar_conexiones()
+
+
+class ModeloFalso:
+    """Analiza lotes localmente; con `caido=True` simula que no hay conexión."""
+
+    def __init__(self):
+        self.caido = False
+        self.llamadas: list[dict[str, str]] = []
+
+    def __call__(self, textos):
+        self.llamadas.append(dict(textos))
+        if self.caido:
+            raise RuntimeError("Sin conexión")
+        return {
+            id_texto: json.dumps(
+                {
+                    "paciente": texto.split()[0],
+                    "edad": 40,
+                    "motivo": "Disnea",
+                    "diagnostico": "",
+                    "tratamiento": "Oxígeno",
+                }
+            )
+            for id_texto, texto in textos.items()
+        }
+
+
+def _guardar_y_encolar(paciente, texto, motivo=""):
+    consecutivo = db.guardar_historia(None, "u1", paciente, "", motivo, "", "")
+    db.cola_ia_encolar(consecutivo, texto)
+    return consecutivo
+
+
+def _historia(consecutivo):
+    with db.conexion() as c:
+        return c.execute(
+            "SELECT paciente, edad, motivo, diagnostico, tratamiento FROM historias WHERE consecutivo=?",
+            (consecutivo,),
+        ).fetchone()
+
+
+def test_procesa_en_lote_y_solo_llena_campos_vacios():
+    modelo = ModeloFalso()
+    trabajador = cola_ia.TrabajadorCola(analizar=modelo, tamano_lote=10)
+    primero = _guardar_y_encolar("", "Pedro con dificultad respiratoria")
+    segundo = _guardar_y_encolar("Ana", "Ana refiere ahogo", motivo="Ahogo nocturno")
+
+    assert trabajador.procesar_una_vez() == 2
+    assert len(modelo.llamadas) == 1 and len(modelo.llamadas[0]) == 2
+    assert _historia(primero) == ("Pedro", 40, "Disnea", "", "Oxígeno")
+    # Lo escrito a mano se conserva
+    assert _historia(segundo) == ("Ana", 40, "Ahogo nocturno", "", "Oxígeno")
+    assert db.cola_ia_estado() == (0, None)
+    assert trabajador.estadisticas()["latencia_p50_s"] is not None
+
+
+def test_sin_conexion_reintenta_con_espera_exponencial():
+    modelo = ModeloFalso()
+    modelo.caido = True
+    trabajador = cola_ia.TrabajadorCola(
+        analizar=modelo, retardo_base=10, retardo_maximo=25
+    )
+    consecutivo = _guardar_y_encolar("", "Luis con dolor abdominal")
+    ahora = db.cola_ia_pendientes(float("inf"))[0][4]
+
+    assert trabajador.procesar_una_vez(ahora) == 0
+    assert trabajador.estadisticas()["ultimo_error"] == "Sin conexión"
+    # Ni el trabajo ni el trabajador vuelven a intentarlo antes de tiempo
+    assert db.cola_ia_pendientes(ahora + 9) == []
+    assert trabajador.procesar_una_vez(ahora + 9) == 0
+    assert len(modelo.llamadas) == 1
+
+    assert trabajador.procesar_una_vez(ahora + 10) == 0
+    # Segundo fallo: 10 * 2 = 20 s de espera
+    assert db.cola_ia_pendientes(ahora + 29) == []
+    trabajo = db.cola_ia_pendientes(ahora + 30)[0]
+    assert trabajo[3] == 2
+
+    # Vuelve la conexión
+    modelo.caido = False
+    assert trabajador.procesar_una_vez(ahora + 60) == 1
+    assert _historia(consecutivo)[0] == "Luis"
+    assert db.cola_ia_estado()[0] == 0
+
+
+def test_espera_acotada_al_maximo():
+    consecutivo = _guardar_y_encolar("", "texto")
+    id_trabajo = db.cola_ia_pendientes(float("inf"))[0][0]
+    for _ in range(40):
+        db.cola_ia_reprogramar([id_trabajo], 0.0, 10, 25, "fallo")
+    assert db.cola_ia_pendientes(25.0)[0][1] == consecutivo
+
+
+def test_ids_sin_respuesta_se_reprograman():
+    def analizar_parcial(textos):
+        id_texto = min(textos, key=int)
+        return {id_texto: json.dumps({"paciente": "Eva"})}
+
+    trabajador = cola_ia.TrabajadorCola(analizar=analizar_parcial, retardo_base=10)
+    primero = _guardar_y_encolar("", "uno")
+    _guardar_y_encolar("", "dos")
+    ahora = db.cola_ia_pendientes(float("inf"))[-1][4]
+
+    assert trabajador.procesar_una_vez(ahora) == 1
+    assert _historia(primero)[0] == "Eva"
+    pendiente = db.cola_ia_pendientes(ahora + 10)
+    assert len(pendiente) == 1 and pendiente[0][2] == "dos"
+
+
+def test_trabajador_en_segundo_plano():
+    modelo = ModeloFalso()
+    trabajador = cola_ia.TrabajadorCola(analizar=modelo, intervalo=0.01)
+    consecutivo = _guardar_y_encolar("", "Marta con fiebre")
+    trabajador.iniciar()
+    try:
+        for _ in range(200):
+            if db.cola_ia_estado()[0] == 0:
+                break
+            utils_ia.time.sleep(0.01)
+    finally:
+        trabajador.detener()
+    assert _historia(consecutivo)[0] == "Marta"
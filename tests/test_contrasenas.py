@@ -0,0 +1,29 @@
+import contrasenas
+
+
+def test_hash_con_sal_y_verificacion():
+    primero, segundo = contrasenas.hashear("clave", n=1024), contrasenas.hashear(
+        "clave", n=1024
+    )
+    assert primero != segundo  # sal distinta
+    assert contrasenas.verificar("clave", primero) and contrasenas.verificar(
+        "clave", segundo
+    )
+    assert not contrasenas.verificar("Clave", primero)
+
+
+def test_valores_guardados_mal_formados_no_validan():
+    for almacenado in (
+        "",
+        "clave",
+        "scrypt$x$8$1$AAAA$AAAA",
+        "scrypt$1024$8$1$no-base64$AAAA",
+    ):
+        assert not contrasenas.verificar("clave", almacenado)
+
+
+def test_necesita_rehash_al_cambiar_el_coste():
+    almacenado = contrasenas.hashear("clave", n=1024)
+    assert not contrasenas.necesita_rehash(almacenado, n=1024)
+    assert contrasenas.necesita_rehash(almacenado, n=2048)
+    assert contrasenas.necesita_rehash("texto plano")
@@ -1,21 +1,17 @@
-import sqlite3
-import db
+import threading
 
 import pytest
 
+import db
+
+
 @pytest.fixture
-def conn(monkeypatch, tmp_path):
+def conn(tmp_path):
     # Usar un archivo de base de datos temporal para que múltiples conexiones funcionen correctamente
     db_path = tmp_path / "test_historias.db"
-
-    # Guardar la función original para evitar recursión cuando reemplacemos connect
-    original_connect = sqlite3.connect
-
-    def connect(*args, **kwargs):
-        return original_connect(str(db_path))
-
-    monkeypatch.setattr(db.sqlite3, "connect", connect)
-    return db_path
+    db.configurar_db(db_path)
+    yield db_path
+    db.cerrar_conexiones()
 
 
 def test_init_and_user_ops(conn):
@@ -39,5 +35,267 @@ def test_guardar_y_obtener(conn):
     assert row[0] == consec
     assert row[1] == "u2"
     assert row[2] == "Paciente X"
-    assert row[3] == "40"
+    assert row[3] == 40
     assert row[4] == "Dolor"
+
+
+def test_pool_reutiliza_conexiones_en_wal(conn):
+    db.init_db()
+    with db.conexion() as c1:
+        assert c1.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    with db.conexion() as c2:
+        assert c2 is c1
+
+
+def test_escritores_concurrentes_sin_bloqueos(conn):
+    db.init_db()
+    errores = []
+
+    def escribir(n):
+        try:
+            for i in range(20):
+                db.guardar_historia(f"HC-T{n}-{i}", "u3", "P", "30", "M", "D", "T")
+        except Exception as e:  # noqa: BLE001  # pragma: no cover
+            # Solo se registra para el assert
+            errores.append(e)
+
+    hilos = [threading.Thread(target=escribir, args=(n,)) for n in range(6)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert errores == []
+    assert len(db.obtener_historias_por_estado("u3", "incompleta")) == 120
+
+
+def test_consecutivo_previa_no_consume_numero(conn):
+    db.init_db()
+    previa = db.obtener_consecutivo()
+    assert db.obtener_consecutivo() == previa
+    assert db.guardar_historia(None, "u4", "P", "30", "M", "D", "T") == previa
+    assert db.obtener_consecutivo() != previa
+
+
+def test_consecutivos_concurrentes_sin_duplicados(conn):
+    db.init_db()
+    asignados = []
+    lock = threading.Lock()
+
+    def asignar():
+        for _ in range(25):
+            consec = db.guardar_historia(None, "u5", "P", "30", "M", "D", "T")
+            with lock:
+                asignados.append(consec)
+
+    hilos = [threading.Thread(target=asignar) for _ in range(8)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    assert len(asignados) == 200
+    assert len(set(asignados)) == 200
+
+
+def test_init_db_renumera_duplicados_antiguos(conn):
+    import sqlite3
+
+    antigua = sqlite3.connect(conn)
+    antigua.execute(
+        "CREATE TABLE historias (id INTEGER PRIMARY KEY AUTOINCREMENT, consecutivo TEXT, usuario TEXT,"
+        " paciente TEXT, edad TEXT, motivo TEXT, diagnostico TEXT, tratamiento TEXT, fecha_creacion TEXT, estado TEXT)"
+    )
+    antigua.executemany(
+        "INSERT INTO historias (consecutivo, usuario, estado) VALUES (?, 'u6', 'incompleta')",
+        [("HC-2026-0001",), ("HC-2026-0002",), ("HC-2026-0002",)],
+    )
+    antigua.commit()
+    antigua.close()
+
+    db.init_db()
+    consecutivos = [
+        fila[0] for fila in db.obtener_historias_por_estado("u6", "incompleta")
+    ]
+    assert len(set(consecutivos)) == 3
+    assert db.guardar_historia(None, "u6", "P", "30", "M", "D", "T") not in consecutivos
+
+
+def test_paginacion_por_cursor_recorre_todas_sin_repetir(conn):
+    db.init_db()
+    for i in range(7):
+        db.guardar_historia(None, "u7", f"Paciente {i}", "30", "M", "D", "T")
+    db.guardar_historia(None, "u7", "Completa", "30", "M", "D", "T", estado="completa")
+
+    vistos = []
+    cursor = None
+    paginas = 0
+    while True:
+        filas, cursor = db.obtener_historias_pagina(
+            "u7", "incompleta", tamano=3, cursor=cursor
+        )
+        vistos.extend(fila[2] for fila in filas)
+        paginas += 1
+        if cursor is None:
+            break
+
+    assert paginas == 3
+    # Mismo segundo de creación: el id desempata, del más reciente al más antiguo
+    assert vistos == [f"Paciente {i}" for i in reversed(range(7))]
+
+
+def test_busqueda_texto_completo_sin_tildes_y_por_relevancia(conn):
+    db.init_db()
+    db.guardar_historia(
+        None,
+        "u8",
+        "Juan Pérez",
+        "45",
+        "Dolor torácico opresivo",
+        "Sospecha IAM",
+        "Aspirina",
+    )
+    db.guardar_historia(
+        None, "u8", "Ana Torres", "30", "Caída", "Trauma de tórax", "Inmovilización"
+    )
+    db.guardar_historia(
+        None, "u8", "Luis Gómez", "60", "Disnea", "EPOC", "Oxígeno", estado="completa"
+    )
+    db.guardar_historia(
+        None, "otro", "Juan Ruiz", "50", "Dolor torácico", "IAM", "Aspirina"
+    )
+
+    filas, hay_mas = db.buscar_historias("u8", "toracico")
+    assert [fila[2] for fila in filas] == ["Juan Pérez"]
+    assert hay_mas is False
+
+    # Prefijo, sin tildes y filtrado por estado
+    assert [f[2] for f in db.buscar_historias("u8", "tor", estado="incompleta")[0]] == [
+        "Ana Torres",
+        "Juan Pérez",
+    ]
+    assert db.buscar_historias("u8", "epoc", estado="incompleta")[0] == []
+    # Caracteres especiales de FTS5 no rompen la consulta
+    assert db.buscar_historias("u8", 'juan" (*')[0][0][2] == "Juan Pérez"
+    assert db.buscar_historias("u8", "   ") == ([], False)
+
+
+def test_busqueda_sigue_las_actualizaciones_y_reindexa_bases_existentes(conn):
+    db.init_db()
+    db.guardar_historia("HC-2026-0001", "u9", "Pedro", "40", "Fiebre", "", "")
+    with db.transaccion() as c:
+        c.execute(
+            "UPDATE historias SET diagnostico='Neumonía' WHERE consecutivo='HC-2026-0001'"
+        )
+    assert len(db.buscar_historias("u9", "neumonia")[0]) == 1
+    assert db.buscar_historias("u9", "fiebre")[0][0][5] == "Neumonía"
+
+    with db.transaccion() as c:
+        c.execute("DROP TABLE historias_fts")
+    db.init_db()
+    assert len(db.buscar_historias("u9", "pedro")[0]) == 1
+
+
+def test_muletillas_por_usuario(conn):
+    db.init_db()
+    db.guardar_muletillas("u1", ["Digamos", " bueno ", "", "digamos"])
+    db.guardar_muletillas("u2", ["vale"])
+    assert db.obtener_muletillas("u1") == ["bueno", "digamos"]
+    db.guardar_muletillas("u1", ["listo"])
+    assert db.obtener_muletillas("u1") == ["listo"]
+
+
+def test_contrasenas_con_hash_y_migracion(conn, monkeypatch):
+    db.init_db()
+    db.crear_usuario("u1", "secreta")
+    with db.conexion() as c:
+        c.execute(
+            "INSERT INTO usuarios (usuario, contrasena) VALUES ('viejo', 'plano')"
+        )
+        guardada = c.execute(
+            "SELECT contrasena FROM usuarios WHERE usuario='u1'"
+        ).fetchone()[0]
+    assert guardada.startswith("scrypt$") and "secreta" not in guardada
+
+    # La migración de init_db() pasa las contraseñas en texto plano a scrypt
+    db.init_db()
+    with db.conexion() as c:
+        assert (
+            c.execute("SELECT contrasena FROM usuarios WHERE usuario='viejo'")
+            .fetchone()[0]
+            .startswith("scrypt$")
+        )
+    assert db.validar_usuario("viejo", "plano") is True
+    assert db.validar_usuario("viejo", "otra") is False
+    assert db.validar_usuario("nadie", "plano") is False
+
+
+def test_login_usa_cache_y_rehace_el_hash_si_cambia_el_coste(conn, monkeypatch):
+    db.init_db()
+    db.crear_usuario("u1", "secreta")
+    assert db.validar_usuario("u1", "secreta") is True
+
+    consultas = []
+    with db.conexion() as c:
+        c.set_trace_callback(consultas.append)
+        try:
+            assert db.validar_usuario("u1", "secreta") is True
+            assert db.validar_usuario("nadie", "x") is False
+            assert db.validar_usuario("nadie", "x") is False
+        finally:
+            c.set_trace_callback(None)
+    assert [q for q in consultas if "FROM usuarios" in q] == [
+        "SELECT contrasena FROM usuarios WHERE usuario='nadie'"
+    ]
+
+    # Crear el usuario invalida el "no existe" guardado
+    db.crear_usuario("nadie", "x")
+    assert db.validar_usuario("nadie", "x") is True
+
+    monkeypatch.setattr(db.contrasenas, "SCRYPT_N", 2048)
+    assert db.validar_usuario("u1", "secreta") is True
+    with db.conexion() as c:
+        assert (
+            c.execute("SELECT contrasena FROM usuarios WHERE usuario='u1'")
+            .fetchone()[0]
+            .startswith("scrypt$2048$")
+        )
+    assert db.validar_usuario("u1", "secreta") is True
+
+
+def test_borrador_escribe_solo_los_campos_recibidos(conn):
+    db.init_db()
+    db.borrador_guardar("u1", {"paciente": "Ana", "motivo": "Caída"})
+    db.borrador_guardar("u1", {"edad": "40"})
+    borrador = db.borrador_obtener("u1")
+    assert (borrador["paciente"], borrador["edad"], borrador["motivo"]) == (
+        "Ana",
+        "40",
+        "Caída",
+    )
+    assert borrador["diagnostico"] == ""
+    assert db.borrador_obtener("otro") is None
+
+
+def test_promover_borrador_es_atomico(conn, monkeypatch):
+    db.init_db()
+    db.borrador_guardar(
+        "u1", {"paciente": "Ana", "edad": "40", "diagnostico": "Esguince"}
+    )
+
+    def falla(consecutivo, texto):
+        raise RuntimeError("sin espacio")
+
+    monkeypatch.setattr(db, "cola_ia_encolar", falla)
+    with pytest.raises(RuntimeError):
+        db.borrador_promover("u1", {"motivo": "Caída"}, "dictado")
+    # Nada a medias: ni historia ni borrador perdido
+    assert db.obtener_historias_por_estado("u1", "incompleta") == []
+    assert db.borrador_obtener("u1")["paciente"] == "Ana"
+
+    monkeypatch.undo()
+    consecutivo = db.borrador_promover("u1", {"motivo": "Caída"}, "dictado")
+    fila = db.obtener_historias_por_estado("u1", "incompleta")[0]
+    assert fila[0] == consecutivo and fila[2:6] == ("Ana", 40, "Caída", "Esguince")
+    assert db.borrador_obtener("u1") is None
+    assert db.cola_ia_estado()[0] == 1
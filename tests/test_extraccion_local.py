@@ -0,0 +1,56 @@
+import pytest
+
+import extraccion_local
+
+
+def test_plantilla_completa_es_confiable():
+    datos, confianza = extraccion_local.extraer(
+        "paciente juan pérez, 45 años, motivo dolor torácico, diagnóstico sospecha de IAM, tratamiento aspirina y oxígeno"
+    )
+    assert datos == {
+        "texto_corregido": "Paciente juan pérez, 45 años, motivo dolor torácico, diagnóstico sospecha de IAM, tratamiento aspirina y oxígeno.",
+        "paciente": "Juan Pérez",
+        "edad": 45,
+        "motivo": "Dolor torácico",
+        "diagnostico": "Sospecha de IAM",
+        "tratamiento": "Aspirina y oxígeno",
+    }
+    assert extraccion_local.es_confiable(confianza)
+
+
+def test_sinonimos_de_etiquetas_y_edad_sin_anios():
+    datos, confianza = extraccion_local.extraer(
+        "Nombre del paciente: María López. Edad: 70. Motivo de consulta: disnea súbita. "
+        "Dx: EPOC exacerbado. Manejo: nebulización con salbutamol."
+    )
+    assert (datos["paciente"], datos["edad"], datos["diagnostico"]) == (
+        "María López",
+        70,
+        "EPOC exacerbado",
+    )
+    assert datos["tratamiento"] == "Nebulización con salbutamol"
+    assert extraccion_local.es_confiable(confianza)
+
+
+@pytest.mark.parametrize(
+    "texto, campo",
+    [
+        (
+            "llegamos al sitio y el paciente refiere dolor en el pecho desde hace dos horas",
+            "paciente",
+        ),
+        (
+            "paciente Ana Ruiz de 8 meses, motivo fiebre, diagnóstico faringitis, tratamiento antipirético",
+            "edad",
+        ),
+        (
+            "paciente Luis, 30 años, motivo caída, diagnóstico fractura, diagnóstico trauma, tratamiento férula",
+            "diagnostico",
+        ),
+        ("paciente Eva, 50 años, motivo síncope, tratamiento líquidos", "diagnostico"),
+    ],
+)
+def test_dictados_dudosos_no_superan_el_umbral(texto, campo):
+    _, confianza = extraccion_local.extraer(texto)
+    assert confianza[campo] < extraccion_local.UMBRAL
+    assert not extraccion_local.es_confiable(confianza)
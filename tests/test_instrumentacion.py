@@ -0,0 +1,73 @@
+import logging
+import threading
+
+import pytest
+
+import db
+import instrumentacion
+
+
+@pytest.fixture(autouse=True)
+def base_aislada(tmp_path):
+    db.configurar_db(tmp_path / "instrumentacion.db")
+    db.init_db()
+    instrumentacion.registros.clear()
+    yield
+    db.cerrar_conexiones()
+
+
+def test_consultas_del_hilo_cuenta_sentencias():
+    antes = db.consultas_del_hilo()
+    db.obtener_consecutivo()
+    db.obtener_historias_pagina("ana", "incompleta")
+    assert db.consultas_del_hilo() - antes >= 2
+
+
+def test_consultas_son_por_hilo():
+    antes = db.consultas_del_hilo()
+    hilo = threading.Thread(target=db.obtener_consecutivo)
+    hilo.start()
+    hilo.join()
+    assert db.consultas_del_hilo() == antes
+
+
+def test_medir_registra_tiempo_y_consultas(caplog):
+    with caplog.at_level(
+        logging.INFO, logger="ambulancias.rendimiento"
+    ), instrumentacion.medir("listado"):
+        db.obtener_historias_pagina("ana", "incompleta")
+    nombre, milisegundos, consultas = instrumentacion.registros[-1]
+    assert nombre == "listado"
+    assert milisegundos >= 0
+    assert consultas >= 1
+    assert "listado" in caplog.text
+
+
+def test_medir_registra_aunque_haya_excepcion():
+    with pytest.raises(ValueError), instrumentacion.medir("falla"):
+        raise ValueError
+    assert instrumentacion.registros[-1][0] == "falla"
+
+
+def test_rerun_sin_terminar_se_descarta():
+    instrumentacion.iniciar_rerun()
+    # El script anterior terminó con una excepción: su medición no se cierra
+    instrumentacion.iniciar_rerun()
+    db.obtener_consecutivo()
+    instrumentacion.terminar_rerun()
+    instrumentacion.terminar_rerun()
+    assert [r[0] for r in instrumentacion.registros] == ["rerun"]
+    assert instrumentacion.registros[0][2] >= 1
+
+
+def test_resumen_por_nombre():
+    for _ in range(3):
+        with instrumentacion.medir("fragmento"):
+            pass
+    with instrumentacion.medir("rerun"):
+        db.obtener_consecutivo()
+    resumen = instrumentacion.resumen()
+    assert resumen["fragmento"]["veces"] == 3
+    assert resumen["fragmento"]["consultas_p50"] == 0
+    assert resumen["rerun"]["consultas_p50"] >= 1
+    assert resumen["rerun"]["max_ms"] >= resumen["rerun"]["p50_ms"]
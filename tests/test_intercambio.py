@@ -0,0 +1,54 @@
+import pytest
+
+import db
+import intercambio
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db.configurar_db(tmp_path / "test_historias.db")
+    db.init_db()
+    yield
+    db.cerrar_conexiones()
+
+
+def _sembrar(n):
+    for i in range(n):
+        db.guardar_historia(
+            None, "u1", f"Paciente {i}", str(20 + i), "Dolor", "Dx", "Tx"
+        )
+
+
+@pytest.mark.parametrize("formato", ["csv", "jsonl", "parquet"])
+def test_exportar_e_importar_ida_y_vuelta(conn, tmp_path, formato):
+    if formato == "parquet":
+        pytest.importorskip("pyarrow")
+    _sembrar(5)
+    archivo = tmp_path / f"historias.{formato}"
+    assert intercambio.exportar(archivo, tamano_lote=2) == 5
+
+    db.configurar_db(tmp_path / "destino.db")
+    db.init_db()
+    assert intercambio.importar(archivo, tamano_lote=2) == (5, 0)
+
+    filas = db.obtener_historias_por_estado("u1", "incompleta")
+    assert sorted(fila[2] for fila in filas) == sorted(
+        f"Paciente {i}" for i in range(5)
+    )
+    # El contador del destino avanza para no repetir consecutivos importados
+    assert db.obtener_consecutivo().endswith("-0006")
+
+
+def test_importar_omite_consecutivos_duplicados(conn, tmp_path):
+    _sembrar(3)
+    archivo = tmp_path / "historias.jsonl"
+    intercambio.exportar(archivo)
+    _sembrar(1)
+
+    assert intercambio.importar(archivo) == (0, 3)
+    assert len(db.obtener_historias_por_estado("u1", "incompleta")) == 4
+
+
+def test_formato_desconocido(tmp_path):
+    with pytest.raises(ValueError):
+        intercambio.detectar_formato(tmp_path / "historias.xlsx")
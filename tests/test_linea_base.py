@@ -0,0 +1,137 @@
+import json
+from functools import partial
+
+import pytest
+
+import db
+import servicio_transcripcion
+import utils_ia
+from benchmarks import bench_carga_app, entorno, linea_base
+
+
+@pytest.fixture(autouse=True)
+def base(tmp_path):
+    db.configurar_db(tmp_path / "linea_base.db")
+    db.init_db()
+    yield
+    db.cerrar_conexiones()
+
+
+def _documento(**metricas):
+    return {"metricas": metricas}
+
+
+def _estados(filas):
+    return {nombre: estado for nombre, _, _, _, estado in filas}
+
+
+def test_comparar_marca_regresiones_en_los_dos_sentidos():
+    base = _documento(
+        **{
+            "micro.extraer.p50_ms": 1.0,
+            "carga.flujos_por_s": 2.0,
+            "carga.errores": 0,
+            "vieja": 1.0,
+        }
+    )
+    actual = _documento(
+        **{
+            "micro.extraer.p50_ms": 1.5,
+            "carga.flujos_por_s": 1.0,
+            "carga.errores": 0,
+            "nueva": 1.0,
+        }
+    )
+    assert _estados(linea_base.comparar(base, actual, umbral=0.25)) == {
+        "micro.extraer.p50_ms": "regresión",
+        "carga.flujos_por_s": "regresión",
+        "carga.errores": "igual",
+        "vieja": "eliminada",
+        "nueva": "nueva",
+    }
+    # Al revés son mejoras
+    assert set(_estados(linea_base.comparar(actual, base, umbral=0.25)).values()) >= {
+        "mejora"
+    }
+
+
+def test_comparar_tolera_cambios_dentro_del_umbral_y_ruido_absoluto():
+    base = _documento(
+        **{
+            "micro.extraer.p50_ms": 10.0,
+            "micro.limpiar_texto.p50_ms": 0.01,
+            "carga.flujos_por_s": 2.0,
+        }
+    )
+    actual = _documento(
+        **{
+            "micro.extraer.p50_ms": 12.0,
+            "micro.limpiar_texto.p50_ms": 0.03,
+            "carga.flujos_por_s": 1.7,
+        }
+    )
+    assert set(_estados(linea_base.comparar(base, actual, umbral=0.25)).values()) == {
+        "igual"
+    }
+    # Sin suelo absoluto los 0,02 ms de más sí cuentan
+    estados = _estados(linea_base.comparar(base, actual, umbral=0.25, minimo_ms=0.0))
+    assert estados["micro.limpiar_texto.p50_ms"] == "regresión"
+
+
+def test_gemini_falso_responde_con_el_esquema_pedido():
+    with entorno.sin_red(gemini=entorno.GeminiFalso()):
+        uno = json.loads(
+            utils_ia.analizar_texto(
+                "paciente Juan Pérez de 45 años con dolor torácico", umbral_local=2.0
+            )
+        )
+        lote = utils_ia.analizar_lote(
+            {"a": "dictado uno con fiebre", "b": "dictado dos con tos"},
+            umbral_local=2.0,
+        )
+    assert uno["paciente"] and uno["edad"]
+    assert set(lote) == {"a", "b"}
+    assert all(json.loads(resultado)["paciente"] for resultado in lote.values())
+
+
+def test_whisper_falso_es_determinista_por_audio(tmp_path):
+    uno, otro = entorno.audios_wav(tmp_path, 2, 1.0)
+    whisper = entorno.WhisperFalso()
+    assert whisper.transcribe(uno) == whisper.transcribe(uno)
+    assert whisper.transcribe(uno) != whisper.transcribe(otro)
+
+
+def test_historias_sinteticas_se_importan():
+    db.importar_historias(entorno.historias(50))
+    with db.conexion() as c:
+        assert c.execute("SELECT COUNT(*) FROM historias").fetchone()[0] == 50
+
+
+def test_el_dictado_llena_el_formulario_y_se_guarda(tmp_path, monkeypatch):
+    # El flujo de la prueba de carga sobre la app real: el análisis debe llegar a los widgets
+    monkeypatch.setattr(
+        servicio_transcripcion,
+        "ServicioTranscripcion",
+        partial(
+            servicio_transcripcion.ServicioTranscripcion,
+            procesos=1,
+            iniciar=entorno.iniciar_whisper_falso,
+            transcribir=entorno.transcribir_falso,
+        ),
+    )
+    microfono = entorno.MicrofonoFalso(
+        entorno.audios_wav(tmp_path, 1, 2.0), velocidad=20.0
+    )
+    with entorno.sin_red(microfono=microfono):
+        at = bench_carga_app.abrir()
+        at.text_input(key="login_usuario").input("tripulacion")
+        at.text_input(key="login_pass").input(bench_carga_app.CONTRASENA)
+        bench_carga_app._boton(at, "Crear cuenta").click().run()
+        tiempos = bench_carga_app.flujo("tripulacion")
+    assert set(tiempos) == set(bench_carga_app.PASOS)
+    (historia,) = [
+        fila
+        for estado in db.ESTADOS
+        for fila in db.obtener_historias_por_estado("tripulacion", estado)
+    ]
+    assert historia[2]  # paciente, llenado por el análisis
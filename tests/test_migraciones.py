@@ -0,0 +1,166 @@
+import sqlite3
+
+import pytest
+
+import db
+
+
+@pytest.fixture
+def ruta(tmp_path):
+    ruta = tmp_path / "migraciones.db"
+    db.configurar_db(ruta)
+    yield ruta
+    db.cerrar_conexiones()
+
+
+def _historias_de_texto(ruta, filas):
+    """Base anterior a las migraciones: todo TEXT y sin user_version."""
+    antigua = sqlite3.connect(ruta)
+    antigua.execute(
+        "CREATE TABLE historias (id INTEGER PRIMARY KEY AUTOINCREMENT, consecutivo TEXT, usuario TEXT,"
+        " paciente TEXT, edad TEXT, motivo TEXT, diagnostico TEXT, tratamiento TEXT, fecha_creacion TEXT, estado TEXT)"
+    )
+    antigua.executemany(
+        "INSERT INTO historias (consecutivo, usuario, paciente, edad, fecha_creacion, estado) VALUES (?, ?, ?, ?, ?, ?)",
+        filas,
+    )
+    antigua.commit()
+    antigua.close()
+
+
+def test_base_antigua_pasa_a_historias_con_tipos(ruta):
+    _historias_de_texto(
+        ruta,
+        [
+            (
+                "HC-2025-0001",
+                "ana",
+                "Pedro",
+                "45 años",
+                "2025-03-01 10:00:00",
+                "incompleta",
+            ),
+            ("HC-2025-0002", "ana", "Lucía", "8 meses", "01/04/2025 08:30", "Completa"),
+            (
+                "HC-2025-0003",
+                "luis",
+                "Sin edad",
+                "desconocida",
+                "2025-05-02T09:15:00",
+                None,
+            ),
+            ("HC-2025-0004", "luis", "Sin fecha", "", None, "completada"),
+        ],
+    )
+    db.init_db()
+    assert db.version_esquema() == db.MIGRACIONES[-1].version
+
+    with db.conexion() as c:
+        filas = c.execute("""
+            SELECT h.paciente, h.edad, h.fecha_creacion, h.estado, u.usuario
+            FROM historias h JOIN usuarios u ON u.id = h.usuario_id ORDER BY h.id
+        """).fetchall()
+    assert filas == [
+        ("Pedro", 45, "2025-03-01 10:00:00", "incompleta", "ana"),
+        ("Lucía", 0, "2025-04-01 08:30:00", "completa", "ana"),
+        ("Sin edad", None, "2025-05-02 09:15:00", "incompleta", "luis"),
+        ("Sin fecha", None, db.FECHA_DESCONOCIDA, "completa", "luis"),
+    ]
+    # Las historias siguen listándose y buscándose; los ids no se repiten
+    assert [f[2] for f in db.obtener_historias_por_estado("ana", "completa")] == [
+        "Lucía"
+    ]
+    assert len(db.buscar_historias("luis", "sin")[0]) == 2
+    db.guardar_historia(None, "ana", "Nueva", "30", "M", "D", "T")
+    with db.conexion() as c:
+        assert c.execute("SELECT MAX(id) FROM historias").fetchone()[0] == 5
+
+    # Los usuarios creados por la migración no tienen contraseña hasta crear la cuenta
+    assert db.validar_usuario("luis", "") is False
+    db.crear_usuario("luis", "clave")
+    assert db.validar_usuario("luis", "clave") is True
+
+
+@pytest.mark.parametrize(
+    "edad",
+    ["45", " 45 años", "8 meses", "0", "130", "131", "-3", "abc", "", None, 40, 40.7],
+)
+def test_edad_entera_coincide_con_la_regla_sql(ruta, edad):
+    db.migrar(hasta=1)
+    with db.conexion() as c:
+        c.execute("INSERT OR IGNORE INTO usuarios (usuario) VALUES ('')")
+        sql = c.execute(
+            f"SELECT {db._columnas_tipadas('f.')} FROM (SELECT NULL AS consecutivo, NULL AS usuario,"
+            " NULL AS paciente, ? AS edad, NULL AS motivo, NULL AS diagnostico, NULL AS tratamiento,"
+            " NULL AS fecha_creacion, NULL AS estado) AS f",
+            (edad,),
+        ).fetchone()[3]
+    assert sql == db.edad_entera(edad)
+
+
+def test_edad_entera_rechaza_valores_no_finitos():
+    assert db.edad_entera(float("inf")) is None
+    assert db.edad_entera(float("nan")) is None
+
+
+def test_migracion_por_lotes_sigue_las_escrituras_concurrentes(ruta):
+    _historias_de_texto(
+        ruta,
+        [
+            (
+                f"HC-2025-{i:04d}",
+                "ana",
+                f"P{i}",
+                "30",
+                "2025-01-01 00:00:00",
+                "incompleta",
+            )
+            for i in range(1, 11)
+        ],
+    )
+    db.migrar(hasta=1)
+
+    avances = []
+
+    def escribir_entre_lotes(copiadas, total):
+        # La app sigue usando el esquema de texto mientras se copia
+        avances.append((copiadas, total))
+        if len(avances) == 1:
+            with db.transaccion() as c:
+                c.execute(
+                    "UPDATE historias SET edad='31' WHERE consecutivo='HC-2025-0001'"
+                )
+                c.execute(
+                    "UPDATE historias SET edad='32' WHERE consecutivo='HC-2025-0009'"
+                )
+                c.execute("DELETE FROM historias WHERE consecutivo='HC-2025-0002'")
+                c.execute(
+                    "INSERT INTO historias (consecutivo, usuario, paciente, edad, fecha_creacion, estado)"
+                    " VALUES ('HC-2025-0011', 'eva', 'Nueva', '50', '2025-01-02 00:00:00', 'incompleta')"
+                )
+
+    assert db.migrar(hasta=2, tamano_lote=3, progreso=escribir_entre_lotes) == [2]
+    assert avances[0] == (3, 10)
+    with db.conexion() as c:
+        edades = dict(c.execute("SELECT consecutivo, edad FROM historias").fetchall())
+    assert len(edades) == 10 and "HC-2025-0002" not in edades
+    assert (edades["HC-2025-0001"], edades["HC-2025-0009"], edades["HC-2025-0011"]) == (
+        31,
+        32,
+        50,
+    )
+    assert [f[2] for f in db.obtener_historias_por_estado("eva", "incompleta")] == [
+        "Nueva"
+    ]
+    assert db.migrar(hasta=2) == []
+
+
+def test_restricciones_del_esquema_con_tipos(ruta):
+    db.init_db()
+    with pytest.raises(sqlite3.IntegrityError):
+        db.guardar_historia(None, "ana", "P", "30", "M", "D", "T", estado="archivada")
+    with pytest.raises(sqlite3.IntegrityError), db.transaccion() as c:
+        c.execute(
+            "INSERT INTO historias (consecutivo, usuario_id, fecha_creacion, estado)"
+            " VALUES ('X', 999, '2026-01-01 00:00:00', 'incompleta')"
+        )
@@ -0,0 +1,44 @@
+import normalizacion
+from utils_audio import limpiar_texto
+
+
+def test_un_solo_separador_entre_palabras():
+    texto = "Paciente , eh, o sea ,, con  dolor\\n este torácico"
+    assert (
+        normalizacion.Normalizador(abreviaturas={}).limpiar(texto.replace("\\n", "\n"))
+        == "Paciente, con dolor torácico"
+    )
+
+
+def test_no_toca_palabras_que_contienen_muletillas():
+    assert (
+        limpiar_texto("Después de ahí, pues, estetoscopio")
+        == "Después de ahí, estetoscopio"
+    )
+
+
+def test_expande_abreviaturas_respetando_mayusculas():
+    assert limpiar_texto("TA 120/80, FC 95 y SatO2 91%, ta bien") == (
+        "tensión arterial 120/80, frecuencia cardiaca 95 y saturación de oxígeno 91%, ta bien"
+    )
+
+
+def test_muletillas_por_usuario():
+    texto = "Paciente digamos con dolor, bueno, en el pecho"
+    assert limpiar_texto(texto) == texto
+    assert (
+        limpiar_texto(texto, ["digamos", "bueno"]) == "Paciente con dolor, en el pecho"
+    )
+    # Un normalizador compilado por diccionario
+    assert normalizacion.obtener_normalizador(
+        ("digamos", "bueno")
+    ) is normalizacion.obtener_normalizador(("digamos", "bueno"))
+
+
+def test_lote():
+    textos = ["eh hola", "FC 80", "  a ,  b  "]
+    assert normalizacion.limpiar_textos(textos) == [
+        "hola",
+        "frecuencia cardiaca 80",
+        "a, b",
+    ]
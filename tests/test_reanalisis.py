@@ -0,0 +1,148 @@
+import json
+import threading
+import time
+
+import pytest
+
+import db
+import reanalisis
+
+
+@pytest.fixture(autouse=True)
+def conn(tmp_path):
+    db.configurar_db(tmp_path / "test_historias.db")
+    db.init_db()
+    yield
+    db.cerrar_conexiones()
+
+
+def _analizar(texto):
+    if "falla" in texto:
+        raise RuntimeError("Modelo no disponible")
+    return json.dumps(
+        {"diagnostico": "Dx IA", "tratamiento": "Tx IA", "motivo": "Motivo IA"}
+    )
+
+
+def _historias():
+    with db.conexion() as c:
+        return c.execute(
+            "SELECT paciente, motivo, diagnostico, tratamiento FROM historias ORDER BY id"
+        ).fetchall()
+
+
+def test_completa_solo_campos_vacios_y_cuenta_errores():
+    db.guardar_historia(None, "u1", "Ana", "30", "Dolor", "", "")
+    db.guardar_historia(None, "u1", "Luis", "40", "Caída", "Fractura", "")
+    db.guardar_historia(None, "u1", "falla", "50", "Tos", "", "")
+    db.guardar_historia(None, "u1", "Eva", "60", "Fiebre", "", "", estado="completa")
+    progresos = []
+
+    resumen = reanalisis.reanalizar_incompletas(
+        _analizar,
+        trabajadores=2,
+        tasa=1000,
+        tamano_lote=2,
+        al_progresar=progresos.append,
+    )
+
+    assert _historias() == [
+        ("Ana", "Dolor", "Dx IA", "Tx IA"),
+        ("Luis", "Caída", "Fractura", "Tx IA"),
+        ("falla", "Tos", "", ""),
+        ("Eva", "Fiebre", "", ""),
+    ]
+    assert [p["procesadas"] for p in progresos] == [2, 3]
+    assert resumen["total"] == 3 and resumen["errores"] == 1
+    assert resumen["tasa_error"] == pytest.approx(1 / 3)
+    assert progresos[-1]["restante_s"] == 0
+
+
+def test_retoma_desde_el_punto_de_control():
+    for i in range(5):
+        db.guardar_historia(None, "u1", f"P{i}", "30", "Dolor", "", "")
+    detener = threading.Event()
+    llamadas = []
+
+    def analizar(texto):
+        llamadas.append(texto)
+        if len(llamadas) == 2:
+            detener.set()  # simula una caída tras el primer lote
+        return _analizar(texto)
+
+    reanalisis.reanalizar_incompletas(
+        analizar, trabajadores=1, tasa=1000, tamano_lote=2, detener=detener
+    )
+    assert db.reanalisis_obtener_punto(reanalisis.NOMBRE)[1] == 2
+
+    llamadas.clear()
+    resumen = reanalisis.reanalizar_incompletas(
+        analizar, trabajadores=1, tasa=1000, tamano_lote=2
+    )
+    assert len(llamadas) == 3
+    assert resumen["procesadas"] == resumen["total"] == 5
+    assert all(fila[2] == "Dx IA" for fila in _historias())
+
+
+def test_reiniciar_reintenta_los_errores():
+    db.guardar_historia(None, "u1", "falla", "30", "Dolor", "", "")
+    assert reanalisis.reanalizar_incompletas(_analizar, tasa=1000)["errores"] == 1
+    assert reanalisis.reanalizar_incompletas(_analizar, tasa=1000)["total"] == 1
+    assert (
+        reanalisis.reanalizar_incompletas(
+            lambda texto: _analizar("ok"), tasa=1000, reiniciar=True
+        )["errores"]
+        == 0
+    )
+    assert _historias()[0][2] == "Dx IA"
+
+
+def test_limitador_respeta_la_tasa():
+    limitador = reanalisis.LimitadorTasa(tasa=50, rafaga=1)
+    inicio = time.monotonic()
+    hilos = [threading.Thread(target=limitador.adquirir) for _ in range(6)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    # La primera ficha está disponible de inmediato; las otras 5 a 50 por segundo
+    assert time.monotonic() - inicio >= 5 / 50 * 0.9
+
+
+def test_texto_historia_omite_campos_vacios():
+    assert (
+        reanalisis.texto_historia((1, "Ana", "30", "Dolor", None, ""))
+        == "Paciente: Ana. Edad: 30. Motivo: Dolor"
+    )
+
+
+def test_en_fondo_no_bloquea_y_se_puede_detener():
+    for i in range(6):
+        db.guardar_historia(None, "u1", f"P{i}", "30", "Dolor", "", "")
+    empezado, liberar, terminado = (
+        threading.Event(),
+        threading.Event(),
+        threading.Event(),
+    )
+
+    def analizar(texto):
+        empezado.set()
+        liberar.wait(5)
+        return _analizar(texto)
+
+    fondo = reanalisis.ReanalisisEnFondo(
+        lambda **kwargs: reanalisis.reanalizar_incompletas(
+            analizar, trabajadores=1, tasa=1000, tamano_lote=2, **kwargs
+        )
+    )
+    assert fondo.iniciar(al_terminar=terminado.set)
+    # iniciar() vuelve enseguida y no admite un segundo reanálisis a la vez
+    assert fondo.estado()["en_marcha"] and not fondo.iniciar()
+
+    assert empezado.wait(5)
+    fondo.detener(espera=0)
+    liberar.set()
+    assert terminado.wait(5)
+    estado = fondo.estado()
+    assert not estado["en_marcha"] and estado["detenido"] and estado["error"] is None
+    assert estado["resumen"]["procesadas"] == 2  # se detiene al acabar el lote en curso
@@ -0,0 +1,177 @@
+import os
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+import servicio_transcripcion
+import telemetria
+
+
+# Funciones de los procesos hijos: deben poder importarse desde este módulo
+def iniciar_falso(hilos):
+    pass
+
+
+def iniciar_roto(hilos):
+    raise OSError("sin modelo")
+
+
+def transcribir_falso(audio, samplerate):
+    if audio.size == 0:
+        raise ValueError("audio vacío")
+    if audio[0] < 0:
+        os._exit(1)  # el proceso muere a mitad del trabajo
+    time.sleep(float(audio[0]))  # el primer valor indica cuánto "tarda"
+    return f"{audio.size / samplerate:.1f} s"
+
+
+def transcribir_midiendo(audio, samplerate):
+    with telemetria.tramo("whisper"):
+        return transcribir_falso(audio, samplerate)
+
+
+@pytest.fixture
+def servicio():
+    servicio = servicio_transcripcion.ServicioTranscripcion(
+        procesos=2,
+        maximo_en_cola=2,
+        iniciar=iniciar_falso,
+        transcribir=transcribir_falso,
+    )
+    assert servicio.esperar_listo(timeout=30)
+    yield servicio
+    servicio.cerrar()
+
+
+def _audio(segundos, espera=0.0):
+    audio = np.zeros(int(segundos * 16000), dtype=np.float32)
+    if audio.size:
+        audio[0] = espera
+    return audio
+
+
+def test_id_de_trabajo_sondeo_y_resultado(servicio):
+    id_trabajo = servicio.enviar(_audio(2.0, espera=0.2))
+    assert servicio.estado(id_trabajo)["estado"] in ("en_cola", "procesando")
+    assert servicio.resultado(id_trabajo, timeout=10) == "2.0 s"
+    with pytest.raises(KeyError):
+        servicio.estado(id_trabajo)
+
+    with pytest.raises(RuntimeError, match="audio vacío"):
+        servicio.transcribir(_audio(0), timeout=10)
+    estadisticas = servicio.estadisticas()
+    assert (estadisticas["completados"], estadisticas["errores"]) == (1, 1)
+    assert estadisticas["espera_p50_s"] >= 0
+
+
+def test_cola_acotada_rechaza_o_bloquea(servicio):
+    # 2 procesando + 2 esperando llenan el servicio
+    ids = [servicio.enviar(_audio(1.0, espera=0.5)) for _ in range(4)]
+    with pytest.raises(servicio_transcripcion.ColaLlena):
+        servicio.enviar(_audio(1.0))
+    assert servicio.estadisticas()["rechazados"] == 1
+
+    # Bloqueando, entra en cuanto termina uno
+    extra = servicio.enviar(_audio(1.0), bloquear=True, timeout=10)
+    assert [servicio.resultado(i, timeout=10) for i in ids + [extra]] == ["1.0 s"] * 5
+
+
+def test_aviso_al_terminar(servicio):
+    avisos = []
+    terminado = threading.Event()
+
+    def al_terminar(id_trabajo, estado):
+        avisos.append((id_trabajo, estado["estado"], estado["texto"]))
+        terminado.set()
+
+    id_trabajo = servicio.enviar(_audio(3.0), al_terminar=al_terminar)
+    assert terminado.wait(10)
+    assert avisos == [(id_trabajo, "listo", "3.0 s")]
+
+
+def test_procesos_en_paralelo(servicio):
+    inicio = time.monotonic()
+    ids = [servicio.enviar(_audio(1.0, espera=0.5)) for _ in range(2)]
+    for i in ids:
+        servicio.resultado(i, timeout=10)
+    assert time.monotonic() - inicio < 0.95
+
+
+def test_los_tramos_del_proceso_se_registran_en_la_app():
+    telemetria.registro.reiniciar()
+    servicio = servicio_transcripcion.ServicioTranscripcion(
+        procesos=1, iniciar=iniciar_falso, transcribir=transcribir_midiendo
+    )
+    try:
+        assert servicio.transcribir(_audio(1.0, espera=0.1), timeout=30) == "1.0 s"
+    finally:
+        servicio.cerrar()
+    whisper = telemetria.registro.recientes()["whisper"]
+    assert whisper["veces"] == 1 and whisper["p50_ms"] >= 100
+    telemetria.registro.reiniciar()
+
+
+def test_error_al_iniciar_el_proceso():
+    servicio = servicio_transcripcion.ServicioTranscripcion(
+        procesos=1, iniciar=iniciar_roto, transcribir=transcribir_falso
+    )
+    try:
+        with pytest.raises(RuntimeError, match="sin modelo"):
+            servicio.esperar_listo(timeout=30)
+    finally:
+        servicio.cerrar()
+
+
+def test_sin_procesos_vivos_los_trabajos_fallan_y_no_se_aceptan_mas():
+    servicio = servicio_transcripcion.ServicioTranscripcion(
+        procesos=1, iniciar=iniciar_roto, transcribir=transcribir_falso
+    )
+    try:
+        try:
+            id_trabajo = servicio.enviar(_audio(1.0))
+        except servicio_transcripcion.ServicioCaido:
+            pass  # ya se había detectado la caída
+        else:
+            with pytest.raises(
+                servicio_transcripcion.ServicioCaido, match="sin modelo"
+            ):
+                servicio.resultado(id_trabajo, timeout=10)
+        with pytest.raises(servicio_transcripcion.ServicioCaido):
+            servicio.enviar(_audio(1.0))
+        assert servicio.caido
+    finally:
+        servicio.cerrar()
+
+
+def test_proceso_muerto_a_mitad_de_trabajo(servicio):
+    with pytest.raises(servicio_transcripcion.ServicioCaido, match="terminó"):
+        servicio.transcribir(_audio(1.0, espera=-1.0), timeout=10)
+    # El otro proceso sigue atendiendo y el hueco del trabajo perdido se liberó
+    assert servicio.transcribir(_audio(2.0), timeout=10) == "2.0 s"
+    assert servicio.estadisticas()["errores"] == 1
+    assert not servicio.caido
+
+
+def test_los_procesos_no_ejecutan_el_script_principal(tmp_path, monkeypatch):
+    # Bajo Streamlit, __main__ es el script de la app; spawn lo ejecutaría en cada proceso
+    marca = tmp_path / "ejecutado"
+    guion = tmp_path / "app_falsa.py"
+    guion.write_text(f"open({str(marca)!r}, 'w').close()\n")
+    principal = types.ModuleType("__main__")
+    principal.__file__ = str(guion)
+    monkeypatch.setitem(sys.modules, "__main__", principal)
+
+    servicio = servicio_transcripcion.ServicioTranscripcion(
+        procesos=1, iniciar=iniciar_falso, transcribir=transcribir_falso
+    )
+    try:
+        assert servicio.esperar_listo(timeout=30)
+        assert servicio.transcribir(_audio(1.0), timeout=30) == "1.0 s"
+    finally:
+        servicio.cerrar()
+    assert not marca.exists()
+    assert principal.__file__ == str(guion)
@@ -0,0 +1,133 @@
+import json
+
+import pytest
+
+import db
+import telemetria
+
+
+@pytest.fixture(autouse=True)
+def base_aislada(tmp_path):
+    db.configurar_db(tmp_path / "telemetria.db")
+    db.init_db()
+    telemetria.registro.reiniciar()
+    telemetria.registro.activa = True
+    yield
+    telemetria.registro.reiniciar()
+    db.cerrar_conexiones()
+
+
+def test_tramo_cronometra_y_se_guarda_por_cubos():
+    telemetria.observar("whisper", 0.3)
+    telemetria.observar("whisper", 0.4)
+    telemetria.observar("whisper", 3.0)
+    with telemetria.tramo("limpiar_texto"):
+        pass
+    datos = telemetria.historico()
+    whisper = datos["tramos"]["whisper"]
+    assert whisper["veces"] == 3
+    assert whisper["suma_s"] == pytest.approx(3.7)
+    assert whisper["cubos"] == [(0.5, 2), (5.0, 1)]
+    assert datos["tramos"]["limpiar_texto"]["veces"] == 1
+
+
+def test_tramo_registra_aunque_haya_excepcion():
+    with pytest.raises(ValueError), telemetria.tramo("analizar"):
+        raise ValueError
+    assert telemetria.registro.recientes()["analizar"]["veces"] == 1
+
+
+def test_volcar_suma_a_lo_guardado():
+    telemetria.contar("json_reparaciones")
+    telemetria.registro.volcar()
+    telemetria.contar("json_reparaciones", 2)
+    telemetria.observar("whisper", 0.3)
+    telemetria.registro.volcar()
+    telemetria.observar("whisper", 0.3)
+    datos = telemetria.historico()
+    assert datos["contadores"] == {"json_reparaciones": 3}
+    assert datos["tramos"]["whisper"]["cubos"] == [(0.5, 2)]
+
+
+def test_vuelca_solo_cada_tantas_observaciones(monkeypatch):
+    monkeypatch.setattr(telemetria, "VOLCAR_CADA", 3)
+    telemetria.observar("whisper", 0.1)
+    telemetria.contar("gemini_fallos")
+    assert db.metricas_leer() == ([], [])
+    telemetria.observar("whisper", 0.1)
+    tramos, contadores = db.metricas_leer()
+    assert tramos == [("whisper", 0.1, 2, pytest.approx(0.2))]
+    assert contadores == [("gemini_fallos", 1)]
+
+
+def test_no_escribe_en_una_base_sin_migrar(tmp_path):
+    ruta = tmp_path / "sin_migrar.db"
+    db.configurar_db(ruta)
+    telemetria.contar("gemini_fallos")
+    telemetria.registro.volcar()
+    # Ni siquiera se crea el archivo: la base por defecto del repo queda intacta
+    assert not ruta.exists()
+
+    db.init_db()
+    telemetria.registro.volcar()
+    assert db.metricas_leer()[1] == [("gemini_fallos", 1)]
+
+
+def test_desactivada_no_registra_nada():
+    telemetria.registro.activa = False
+    with telemetria.tramo("whisper"):
+        pass
+    telemetria.contar("gemini_fallos")
+    assert telemetria.registro.recientes() == {}
+    assert telemetria.historico() == {"tramos": {}, "contadores": {}}
+
+
+def test_cuantil_histograma_interpola_dentro_del_cubo():
+    # 10 en (0.25, 0.5] y 10 en (0.5, 1]: la mediana cae justo en 0.5
+    cubos = [(0.5, 10), (1.0, 10)]
+    assert telemetria.cuantil_histograma(cubos, 0.5) == pytest.approx(0.5)
+    assert telemetria.cuantil_histograma(cubos, 0.75) == pytest.approx(0.75)
+    assert telemetria.cuantil_histograma([(float("inf"), 4)], 0.5) == 60.0
+    assert telemetria.cuantil_histograma([], 0.5) is None
+
+
+def test_exportacion_prometheus_acumula_cubos():
+    telemetria.observar("gemini:gemini-2.5-flash", 0.3)
+    telemetria.observar("gemini:gemini-2.5-flash", 3.0)
+    telemetria.contar("gemini_coberturas")
+    texto = telemetria.a_prometheus()
+    assert "# TYPE ambulancias_tramo_segundos histogram" in texto
+    assert (
+        'ambulancias_tramo_segundos_bucket{tramo="gemini:gemini-2.5-flash",le="0.25"} 0'
+        in texto
+    )
+    assert (
+        'ambulancias_tramo_segundos_bucket{tramo="gemini:gemini-2.5-flash",le="0.5"} 1'
+        in texto
+    )
+    assert (
+        'ambulancias_tramo_segundos_bucket{tramo="gemini:gemini-2.5-flash",le="+Inf"} 2'
+        in texto
+    )
+    assert (
+        'ambulancias_tramo_segundos_count{tramo="gemini:gemini-2.5-flash"} 2' in texto
+    )
+    assert 'ambulancias_eventos_total{evento="gemini_coberturas"} 1' in texto
+
+
+def test_exportar_json_a_archivo(tmp_path):
+    telemetria.observar("whisper", 90.0)
+    ruta = tmp_path / "metricas.json"
+    telemetria.exportar(str(ruta), "json")
+    datos = json.loads(ruta.read_text(encoding="utf-8"))
+    assert datos["tramos"]["whisper"]["cubos"] == {"+Inf": 1}
+    with pytest.raises(ValueError):
+        telemetria.exportar(str(ruta), "csv")
+
+
+def test_capturar_recoge_los_tramos_sin_registrarlos():
+    with telemetria.registro.capturar() as tramos:
+        telemetria.observar("whisper", 0.2)
+    telemetria.observar("limpiar_texto", 0.01)
+    assert tramos == [("whisper", 0.2)]
+    assert list(telemetria.registro.recientes()) == ["limpiar_texto"]
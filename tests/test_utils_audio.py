@@ -1,4 +1,7 @@
-from utils_audio import limpiar_texto
+import numpy as np
+
+import utils_audio
+from utils_audio import TranscriptorIncremental, limpiar_texto, unir_transcripciones
 
 
 def test_limpiar_texto_quita_muletillas():
@@ -14,3 +17,214 @@ def test_limpiar_texto_quita_muletillas():
 def test_limpiar_texto_normaliza_espacios():
     texto = "Paciente    con    varios   espacios"
     assert "  " not in limpiar_texto(texto)  # no dobles espacios
+
+
+def test_unir_transcripciones_quita_el_solape():
+    previo = "Paciente masculino de 45 años con dolor"
+    nuevo = "con dolor torácico opresivo"
+    assert (
+        unir_transcripciones(previo, nuevo)
+        == "Paciente masculino de 45 años con dolor torácico opresivo"
+    )
+    assert unir_transcripciones("", "hola") == "hola"
+    assert unir_transcripciones("uno dos", "tres") == "uno dos tres"
+
+
+def test_transcriptor_incremental_une_bloques_solapados():
+    sr = 100
+    # Cada segundo de audio tiene un valor distinto; el transcriptor falso lo convierte en una palabra
+    segundos = [np.full(sr, (i + 1) / 100, dtype=np.float32) for i in range(12)]
+
+    def transcribir(bloque):
+        return " ".join(
+            f"w{round(seg.mean() * 100)}" for seg in np.split(bloque, len(bloque) // sr)
+        )
+
+    transcriptor = TranscriptorIncremental(
+        transcribir, samplerate=sr, duracion_bloque=3, solape=1
+    )
+    for segundo in segundos:
+        # Lecturas de 0.5 s como las del micrófono
+        for lectura in np.split(segundo, 2):
+            transcriptor.agregar(lectura.reshape(-1, 1))
+
+    assert transcriptor.finalizar() == " ".join(f"w{i + 1}" for i in range(12))
+
+
+class _ModeloQueRegistra:
+    def __init__(self):
+        self.entradas = []
+
+    def transcribe(self, audio, **kwargs):
+        self.entradas.append(audio)
+        return {"text": "hola"}
+
+
+def test_transcribir_audio_pasa_el_buffer_sin_archivo(monkeypatch):
+    modelo = _ModeloQueRegistra()
+    monkeypatch.setattr(utils_audio, "modelo", modelo)
+    audio = np.zeros(16000, dtype=np.float32)
+
+    assert utils_audio.transcribir_audio(audio) == "hola"
+    # El mismo buffer float32, sin copia ni WAV temporal
+    assert np.shares_memory(modelo.entradas[0], audio)
+
+
+def test_transcribir_audio_usa_wav_con_otra_frecuencia(monkeypatch):
+    modelo = _ModeloQueRegistra()
+    monkeypatch.setattr(utils_audio, "modelo", modelo)
+
+    assert (
+        utils_audio.transcribir_audio(np.zeros(8000, dtype=np.float32), samplerate=8000)
+        == "hola"
+    )
+    assert isinstance(modelo.entradas[0], str) and modelo.entradas[0].endswith(".wav")
+
+
+def _cabina(segundos, sr=16000, nivel=0.03, semilla=0):
+    """Ruido de banda ancha como el de una cabina de ambulancia."""
+    return (
+        nivel * np.random.default_rng(semilla).standard_normal(int(segundos * sr))
+    ).astype(np.float32)
+
+
+def _voz(segundos, sr=16000):
+    """Voz sintética: tono grave con modulación silábica sobre el ruido de cabina."""
+    t = np.arange(int(segundos * sr)) / sr
+    tono = 0.3 * np.sin(2 * np.pi * 160 * t) * (0.6 + 0.4 * np.sin(2 * np.pi * 4 * t))
+    return (tono + _cabina(segundos, sr, semilla=1)).astype(np.float32)
+
+
+def test_buffer_circular_da_la_vuelta_en_orden():
+    buffer = utils_audio.BufferCircular(5)
+    buffer.escribir(np.array([1, 2, 3], dtype=np.float32))
+    assert np.shares_memory(buffer.contenido(), buffer._datos)
+    buffer.escribir(np.array([[4], [5], [6]], dtype=np.float32))
+    assert len(buffer) == 5
+    assert buffer.contenido().tolist() == [2, 3, 4, 5, 6]
+
+
+def test_detector_voz_distingue_voz_del_ruido_de_cabina():
+    detector = utils_audio.DetectorVoz()
+    lecturas_ruido = np.split(_cabina(1.0), 5)
+    lecturas_voz = np.split(_voz(1.0), 5)
+
+    resultados_ruido = [detector.es_voz(lectura) for lectura in lecturas_ruido]
+    resultados_voz = [detector.es_voz(lectura) for lectura in lecturas_voz]
+    assert not any(resultados_ruido)
+    assert all(resultados_voz)
+    # El ruido de cabina no se confunde con voz aunque sea más fuerte que el umbral fijo antiguo
+    assert np.linalg.norm(lecturas_ruido[-1]) > 0.005
+    assert not detector.es_voz(_cabina(0.2, semilla=7))
+
+
+def test_recortar_silencio_deja_solo_la_voz_con_margen():
+    sr = 16000
+    audio = np.concatenate(
+        [_cabina(2.0, semilla=3), _voz(1.0), _cabina(2.0, semilla=4)]
+    )
+    recortado = utils_audio.recortar_silencio(audio, sr, margen=0.2)
+    assert 1.0 * sr <= recortado.size <= 1.5 * sr
+    assert utils_audio.recortar_silencio(_cabina(1.0), sr).size == 0
+
+
+class _Fuente:
+    """Micrófono falso que entrega `audio` en lecturas del tamaño pedido."""
+
+    def __init__(self, audio):
+        self.audio = audio
+        self.posicion = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def read(self, frames):
+        bloque = self.audio[self.posicion : self.posicion + frames]
+        self.posicion += frames
+        return bloque.reshape(-1, 1), False
+
+
+def test_grabar_audio_con_fuente_falsa_se_detiene_tras_el_silencio():
+    sr = 16000
+    audio = np.concatenate(
+        [_cabina(0.4, semilla=5), _voz(1.0), _cabina(5.0, semilla=6)]
+    )
+    grabado = utils_audio.grabar_audio(samplerate=sr, fuente=_Fuente(audio))
+    # 0.4 s de calibración + 1 s de voz + algo más de 3 s de silencio
+    assert 4.4 * sr <= grabado.size <= 4.8 * sr
+    assert np.array_equal(grabado, audio[: grabado.size])
+
+
+def test_voz_desde_el_primer_instante_no_se_toma_como_piso(monkeypatch):
+    sr = 16000
+    audio = np.concatenate([_voz(6.0), _cabina(4.0, semilla=6)])
+    detector = utils_audio.DetectorVoz(sr)
+    assert all(detector.es_voz(lectura) for lectura in np.split(_voz(1.0), 5))
+
+    modelo = _ModeloQueRegistra()
+    monkeypatch.setattr(utils_audio, "modelo", modelo)
+    assert utils_audio.guardar_y_transcribir(fuente=_Fuente(audio)) == "hola"
+    # Ningún bloque pierde el comienzo del dictado
+    transcrito = sum(entrada.size for entrada in modelo.entradas)
+    assert transcrito >= 6.0 * sr
+
+
+def test_transcriptor_sin_voz_detectada_transcribe_lo_retenido():
+    bloques = []
+    transcriptor = TranscriptorIncremental(
+        lambda b: bloques.append(b.size) or "x", samplerate=10
+    )
+    for _ in range(3):
+        transcriptor.agregar(np.ones(10), voz=False)
+    assert transcriptor.finalizar() == "x"
+    assert bloques == [30]
+
+
+def test_transcriptor_no_transcribe_silencio_inicial_ni_final():
+    bloques = []
+    transcriptor = TranscriptorIncremental(
+        lambda b: bloques.append(b.size) or "x", samplerate=10, margen=0.2
+    )
+    for voz in (False, False, False, True, True, False, True, False, False):
+        transcriptor.agregar(np.ones(10), voz)
+    transcriptor.finalizar()
+    # Pausa interna conservada; del silencio inicial y final solo queda el margen
+    assert sum(bloques) == 2 + 40 + 2
+
+
+def test_modelo_se_carga_una_vez_en_el_primer_uso(monkeypatch):
+    cargas = []
+    monkeypatch.setattr(utils_audio, "modelo", None)
+    monkeypatch.setattr(
+        utils_audio,
+        "cargar_modelo_whisper",
+        lambda: cargas.append(1) or _ModeloQueRegistra(),
+    )
+
+    for _ in range(2):
+        utils_audio.transcribir_audio(np.zeros(160, dtype=np.float32))
+    assert cargas == [1]
+
+
+def test_tamano_de_modelo_no_soportado():
+    import pytest
+
+    with pytest.raises(ValueError):
+        utils_audio.cargar_modelo_whisper("large")
+
+
+class _ServicioCaido:
+    def transcribir(self, audio, samplerate=16000):
+        raise utils_audio.ServicioCaido("Los procesos de transcripción terminaron")
+
+
+def test_con_el_servicio_caido_se_transcribe_en_este_proceso(monkeypatch):
+    modelo = _ModeloQueRegistra()
+    monkeypatch.setattr(utils_audio, "modelo", modelo)
+
+    transcribir = utils_audio._con_respaldo(_ServicioCaido())
+    assert transcribir(np.zeros(16000, dtype=np.float32)) == "hola"
+    assert len(modelo.entradas) == 1
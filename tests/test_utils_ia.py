@@ -0,0 +1,253 @@
+import json
+
+import pytest
+
+import db
+import utils_ia
+
+
+@pytest.fixture
+def conn(tmp_path):
+    db.configurar_db(tmp_path / "test_historias.db")
+    db.init_db()
+    yield
+    db.cerrar_conexiones()
+
+
+def test_clave_cache_depende_de_version_y_modelo():
+    texto = utils_ia.normalizar_texto("Dolor  torácico")
+    assert texto == "dolor torácico"
+    clave = utils_ia.clave_cache(texto, "gemini-2.5-flash")
+    assert clave != utils_ia.clave_cache(texto, "gemini-2.5-flash-lite")
+    assert clave != utils_ia.clave_cache(texto, "gemini-2.5-flash", version="otra")
+
+
+def test_cache_lru_en_memoria_y_persistente(conn):
+    cache = utils_ia.CacheAnalisis(capacidad=2, maximo_persistente=2)
+    for clave in ("a", "b", "c"):
+        cache.guardar(clave, f'{{"v":"{clave}"}}')
+
+    # "a" salió de memoria y del almacén persistente (límite de 2 filas)
+    assert cache.obtener("a") is None
+    assert cache.obtener("c") == '{"v":"c"}'
+    cache.limpiar()
+    assert cache.obtener("b") == '{"v":"b"}'
+    assert cache.estadisticas() == {
+        "aciertos": 1,
+        "fallos": 0,
+        "tasa_aciertos": 1.0,
+        "en_memoria": 1,
+    }
+
+
+def test_cache_respeta_ttl(conn, monkeypatch):
+    cache = utils_ia.CacheAnalisis(ttl=60)
+    cache.guardar("a", "{}")
+    ahora = utils_ia.time.time()
+    monkeypatch.setattr(utils_ia.time, "time", lambda: ahora + 120)
+    assert cache.obtener("a") is None
+
+
+def test_analizar_lote_una_llamada_y_usa_cache(conn, monkeypatch):
+    utils_ia.cache.limpiar()
+    utils_ia.interruptor.reiniciar()
+    prompts = []
+
+    class Resp:
+        def __init__(self, text):
+            self.text = text
+
+    class Modelo:
+        def generate_content(self, prompt, generation_config=None):
+            prompts.append(prompt)
+            return Resp(
+                'Resultado: [{"id": "1", "paciente": "Ana", "edad": 30}, {"id": 2, "paciente": "Luis", "edad": 50},]'
+            )
+
+    monkeypatch.setattr(utils_ia.genai, "GenerativeModel", lambda modelo_id: Modelo())
+
+    resultados = utils_ia.analizar_lote(
+        {"1": "Ana con fiebre", "2": "Luis con tos", "3": "Sin respuesta"}
+    )
+    assert len(prompts) == 1
+    assert json.loads(resultados["1"]) == {
+        "texto_corregido": "",
+        "paciente": "Ana",
+        "edad": 30,
+        "motivo": "",
+        "diagnostico": "",
+        "tratamiento": "",
+    }
+    assert json.loads(resultados["2"])["paciente"] == "Luis"
+    assert "3" not in resultados
+
+    # Los textos ya analizados salen de la caché, también por analizar_texto
+    assert json.loads(utils_ia.analizar_texto("ana  con FIEBRE"))["paciente"] == "Ana"
+    assert utils_ia.analizar_lote({"a": "Luis con tos"}) == {"a": resultados["2"]}
+    assert len(prompts) == 1
+
+
+def test_dictado_de_plantilla_no_llama_al_modelo(conn, monkeypatch):
+    utils_ia.metricas.reiniciar()
+
+    def sin_modelo(modelo_id):
+        raise AssertionError("no debería llamarse a la IA")
+
+    monkeypatch.setattr(utils_ia.genai, "GenerativeModel", sin_modelo)
+    texto = "paciente Juan Pérez, 45 años, motivo dolor torácico, diagnóstico IAM, tratamiento aspirina"
+
+    datos = json.loads(utils_ia.analizar_texto(texto))
+    assert (datos["paciente"], datos["edad"], datos["tratamiento"]) == (
+        "Juan Pérez",
+        45,
+        "Aspirina",
+    )
+    assert json.loads(utils_ia.analizar_lote({"1": texto})["1"]) == datos
+    assert utils_ia.metricas.resumen()["local"]["exitos"] == 2
+
+    # Con el umbral por encima de 1 siempre se consulta el modelo
+    with pytest.raises(RuntimeError):
+        utils_ia.analizar_texto(texto, umbral_local=1.1)
+
+
+def test_telemetria_de_reparaciones_y_coberturas(conn, monkeypatch):
+    import telemetria
+
+    utils_ia.cache.limpiar()
+    utils_ia.interruptor.reiniciar()
+    telemetria.registro.reiniciar()
+
+    class Resp:
+        def __init__(self, text):
+            self.text = text
+
+    class Roto:
+        def generate_content(self, prompt, generation_config=None):
+            return Resp("sin json")
+
+    class Reparable:
+        def generate_content(self, prompt, generation_config=None):
+            return Resp("{'paciente': 'Eva', 'edad': 70,}")
+
+    monkeypatch.setattr(
+        utils_ia.genai,
+        "GenerativeModel",
+        lambda m: Roto() if m.endswith("-flash") else Reparable(),
+    )
+    datos = json.loads(
+        utils_ia.analizar_texto("Eva, setenta años, disnea", retardo_cobertura=60)
+    )
+    assert datos["paciente"] == "Eva"
+
+    historico = telemetria.historico()
+    assert historico["contadores"]["gemini_fallos"] == 1
+    assert historico["contadores"]["gemini_coberturas"] == 1
+    # El JSON roto y el reparable pasan por la reparación; solo el segundo la supera
+    assert historico["contadores"]["json_reparaciones"] == 2
+    assert {
+        "analizar",
+        "gemini:gemini-2.5-flash",
+        "gemini:gemini-2.5-flash-lite",
+        "reparar_json",
+    } <= set(historico["tramos"])
+
+
+def test_validar_resultado_tipa_y_recorta():
+    datos = utils_ia.validar_resultado(
+        {"paciente": "  Ana Ruiz ", "edad": "45 años", "motivo": None, "extra": 1}
+    )
+    assert datos == {
+        "texto_corregido": "",
+        "paciente": "Ana Ruiz",
+        "edad": 45,
+        "motivo": "",
+        "diagnostico": "",
+        "tratamiento": "",
+    }
+    assert utils_ia.validar_resultado({"edad": 37.0})["edad"] == 37
+    assert utils_ia.validar_resultado({"edad": 0})["edad"] == 0
+    # Sin edad válida queda NULL, distinto de un lactante (0)
+    # Misma regla que la columna edad de la base
+    assert utils_ia.validar_resultado({"edad": "8 meses"})["edad"] == 0
+    for edad in ("desconocida", 400, None, float("inf"), float("nan"), "-3", -3):
+        assert utils_ia.validar_resultado({"edad": edad})["edad"] is None
+    with pytest.raises(ValueError):
+        utils_ia.validar_resultado(["no", "es", "objeto"])
+
+
+class _Uso:
+    prompt_token_count = 120
+    candidates_token_count = 40
+
+
+class _RespConUso:
+    usage_metadata = _Uso()
+
+    def __init__(self, text):
+        self.text = text
+
+
+def test_lote_con_salida_estructurada_mapea_por_id(conn, monkeypatch):
+    import telemetria
+
+    utils_ia.cache.limpiar()
+    utils_ia.interruptor.reiniciar()
+    telemetria.registro.reiniciar()
+    monkeypatch.setattr(utils_ia, "MAXIMO_LOTE", 2)
+    llamadas = []
+
+    class Modelo:
+        def generate_content(self, prompt, generation_config=None):
+            llamadas.append(generation_config)
+            enviados = json.loads(prompt[prompt.index("[") :])
+            # Respuesta desordenada, con un id desconocido y la edad como texto
+            respuesta = [{"id": "otro", "paciente": "Nadie"}]
+            respuesta += [
+                {"id": d["id"], "paciente": f" {d['texto']} ", "edad": "50"}
+                for d in reversed(enviados)
+            ]
+            return _RespConUso(json.dumps(respuesta))
+
+    monkeypatch.setattr(utils_ia.genai, "GenerativeModel", lambda modelo_id: Modelo())
+    textos = {"1": "Ana", "2": "Luis", "3": "Eva"}
+    resultados = utils_ia.analizar_lote(textos)
+
+    assert sorted(resultados) == ["1", "2", "3"]
+    for id_texto, texto in textos.items():
+        datos = json.loads(resultados[id_texto])
+        assert (datos["paciente"], datos["edad"]) == (texto, 50)
+    # Tres dictados con lotes de dos: dos solicitudes con el esquema de arreglo
+    assert len(llamadas) == 2
+    assert all(c["response_mime_type"] == "application/json" for c in llamadas)
+    assert all(c["response_schema"] is utils_ia.ESQUEMA_LOTE for c in llamadas)
+
+    consumo = utils_ia.consumo_por_historia()
+    assert consumo["historias"] == 3
+    assert consumo["solicitudes_por_historia"] == pytest.approx(2 / 3)
+    assert consumo["tokens_entrada_por_historia"] == pytest.approx(240 / 3)
+    assert consumo["tokens_salida_por_historia"] == pytest.approx(80 / 3)
+
+
+def test_lote_fallido_no_impide_los_demas(conn, monkeypatch):
+    utils_ia.cache.limpiar()
+    utils_ia.interruptor.reiniciar()
+    monkeypatch.setattr(utils_ia, "MAXIMO_LOTE", 1)
+
+    class Modelo:
+        def generate_content(self, prompt, generation_config=None):
+            enviados = json.loads(prompt[prompt.index("[") :])
+            if enviados[0]["texto"] == "roto":
+                return _RespConUso("no es JSON")
+            return _RespConUso(
+                json.dumps([{"id": enviados[0]["id"], "paciente": "Ana"}])
+            )
+
+    monkeypatch.setattr(utils_ia.genai, "GenerativeModel", lambda modelo_id: Modelo())
+    resultados = utils_ia.analizar_lote(
+        {"1": "bien", "2": "roto"}, retardo_cobertura=60
+    )
+    assert list(resultados) == ["1"]
+
+    utils_ia.interruptor.reiniciar()
+    with pytest.raises(RuntimeError):
+        utils_ia.analizar_lote({"3": "roto"}, retardo_cobertura=60)
@@ -0,0 +1,54 @@
+"""
+Punto de entrada de cada proceso de servicio_transcripcion. Se ejecuta como
+script propio y no con multiprocessing: spawn importaría en cada proceso el
+__main__ de quien lo lanza y, bajo Streamlit, eso es app.py entero.
+
+Protocolo con la app: objetos pickle por stdin (sys.path, la configuración y
+luego los trabajos) y por el stdout original (los mensajes). Lo que Whisper o
+PyTorch impriman va a stderr para no mezclarse con ellos.
+"""
+
+import os
+import pickle
+import sys
+import time
+
+
+class Canal:
+    """Cola de un solo lector sobre las tuberías: get() lee trabajos y put() envía mensajes."""
+
+    def __init__(self, entrada, salida):
+        self.entrada = entrada
+        self.salida = salida
+
+    def get(self):
+        try:
+            return pickle.load(self.entrada)
+        except EOFError:
+            # La app terminó sin cerrar el servicio
+            return None
+
+    def put(self, mensaje) -> None:
+        pickle.dump(mensaje, self.salida)
+        self.salida.flush()
+
+
+def main() -> None:
+    salida = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    entrada = sys.stdin.buffer
+    # Las funciones que se reciben después se importan con el sys.path de la app
+    sys.path[:0] = pickle.load(entrada)
+    import servicio_transcripcion
+
+    canal = Canal(entrada, salida)
+    try:
+        iniciar, hilos, transcribir = pickle.load(entrada)
+    except Exception as e:  # noqa: BLE001 - el error viaja al proceso de la app
+        canal.put(("caido", None, repr(e), time.time()))
+        return
+    servicio_transcripcion._trabajador(canal, canal, iniciar, hilos, transcribir)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,99 +1,312 @@
 import os
+import queue
 import re
-import sounddevice as sd
+import threading
 import numpy as np
 import tempfile
 import wave
-import subprocess
-import whisper
 import time
 import streamlit as st
 
+import normalizacion
+import telemetria
+from servicio_transcripcion import ServicioCaido
+
+# sounddevice y whisper (con PyTorch) se importan al usarse: importar este
+# módulo no debe cargar el modelo ni abrir el audio del sistema.
+
 # --- Asegurar compatibilidad FFmpeg en Windows ---
-os.environ["PATH"] += os.pathsep + r"C:\ffmpeg\bin"  # Cambia si tu FFmpeg está en otra ruta
+# Solo la ruta de respaldo por archivo WAV necesita FFmpeg (whisper lo invoca para decodificar)
+RUTA_FFMPEG_WINDOWS = r"C:\ffmpeg\bin"  # Cambia si tu FFmpeg está en otra ruta
+
+# Whisper trabaja a 16 kHz; con otra frecuencia se usa la ruta por archivo (FFmpeg remuestrea)
+SAMPLERATE_WHISPER = 16000
+
+# --- Modelo Whisper (carga diferida) ---
+MODELOS_WHISPER = ("tiny", "base", "small")
+MODELO_WHISPER = os.environ.get("WHISPER_MODELO", "base")
+
+modelo = None
+_lock_modelo = threading.Lock()
+
+
+def cargar_modelo_whisper(nombre=None):
+    nombre = nombre or MODELO_WHISPER
+    if nombre not in MODELOS_WHISPER:
+        raise ValueError(
+            f"Modelo Whisper no soportado: '{nombre}' (usa {', '.join(MODELOS_WHISPER)})"
+        )
+    import whisper
+
+    return whisper.load_model(nombre)
+
+
+def obtener_modelo():
+    """Devuelve el modelo Whisper, cargándolo una sola vez por proceso en el primer uso."""
+    global modelo
+    if modelo is None:
+        with _lock_modelo:
+            if modelo is None:
+                modelo = cargar_modelo_whisper()
+    return modelo
+
+
+# --- Buffer de grabación ---
+class BufferCircular:
+    """
+    Buffer de audio preasignado. escribir() copia cada lectura en su sitio sin
+    reservar memoria; si se llena, sobrescribe lo más antiguo.
+    """
+
+    def __init__(self, capacidad):
+        self._datos = np.zeros(capacidad, dtype=np.float32)
+        self._posicion = 0
+        self._lleno = False
+
+    def __len__(self):
+        return self._datos.size if self._lleno else self._posicion
+
+    def escribir(self, data):
+        data = np.asarray(data).reshape(-1)
+        capacidad = self._datos.size
+        if data.size >= capacidad:
+            self._datos[:] = data[-capacidad:]
+            self._posicion = 0
+            self._lleno = True
+            return
+        fin = self._posicion + data.size
+        if fin <= capacidad:
+            self._datos[self._posicion : fin] = data
+        else:
+            corte = capacidad - self._posicion
+            self._datos[self._posicion :] = data[:corte]
+            self._datos[: fin - capacidad] = data[corte:]
+            self._lleno = True
+        self._posicion = fin % capacidad
+        if fin == capacidad:
+            self._lleno = True
+
+    def contenido(self):
+        """Audio en orden cronológico; es una vista (sin copia) mientras no haya dado la vuelta."""
+        if not self._lleno:
+            return self._datos[: self._posicion]
+        return np.concatenate(
+            (self._datos[self._posicion :], self._datos[: self._posicion])
+        )
+
+
+# --- Detección de voz ---
+class DetectorVoz:
+    """
+    Detector de actividad de voz por ventanas de `ventana` segundos. Una ventana
+    es voz si su energía supera `factor` veces el piso de ruido y tiene pocos
+    cruces por cero (el ruido de cabina es de banda ancha), o si es muy fuerte.
+    El piso se calibra con las primeras lecturas, nunca por encima de
+    `piso_maximo`, y se adapta con las ventanas que no son voz.
+    """
+
+    def __init__(
+        self,
+        samplerate=16000,
+        ventana=0.02,
+        factor=3.0,
+        max_cruces=0.35,
+        calibracion=0.4,
+        adaptacion=0.05,
+        piso_minimo=1e-4,
+        piso_maximo=0.02,
+    ):
+        self.muestras_ventana = max(1, int(ventana * samplerate))
+        self.factor = factor
+        self.max_cruces = max_cruces
+        self.muestras_calibracion = int(calibracion * samplerate)
+        self.adaptacion = adaptacion
+        self.piso_minimo = piso_minimo
+        self.piso_maximo = piso_maximo
+        self.piso = None
+        self._calibradas = 0
 
-# --- Inicializar modelo Whisper una sola vez ---
-@st.cache_resource
-def cargar_modelo_whisper():
-    return whisper.load_model("base")
+    def caracteristicas(self, audio):
+        """Energía RMS y tasa de cruces por cero de cada ventana completa."""
+        audio = np.asarray(audio, dtype=np.float32).reshape(-1)
+        n = audio.size // self.muestras_ventana
+        ventanas = audio[: n * self.muestras_ventana].reshape(n, self.muestras_ventana)
+        energia = np.sqrt(np.mean(ventanas * ventanas, axis=1))
+        signos = np.signbit(ventanas)
+        cruces = (
+            np.count_nonzero(signos[:, 1:] != signos[:, :-1], axis=1)
+            / self.muestras_ventana
+        )
+        return energia, cruces
 
-modelo = cargar_modelo_whisper()
+    def mascara(self, energia, cruces, piso):
+        umbral = max(piso, self.piso_minimo) * self.factor
+        return ((energia > umbral) & (cruces < self.max_cruces)) | (
+            energia > umbral * 4
+        )
+
+    def es_voz(self, data, fraccion=0.2):
+        """Clasifica una lectura del micrófono y adapta el piso de ruido."""
+        energia, cruces = self.caracteristicas(data)
+        if energia.size == 0:
+            return False
+        if self._calibradas < self.muestras_calibracion:
+            # Calibración con las primeras lecturas. El paramédico puede empezar a
+            # hablar ya: las ventanas fuertes y tonales no cuentan y el tope evita
+            # tomar la voz como piso (nada volvería a ser voz)
+            fondo = energia[(energia <= self.piso_maximo) | (cruces >= self.max_cruces)]
+            piso_lectura = min(
+                float(np.percentile(fondo, 50)) if fondo.size else self.piso_maximo,
+                self.piso_maximo,
+            )
+            self.piso = (
+                piso_lectura if self.piso is None else min(self.piso, piso_lectura)
+            )
+            self._calibradas += energia.size * self.muestras_ventana
+            return bool(self.mascara(energia, cruces, self.piso).mean() >= fraccion)
+
+        voz = self.mascara(energia, cruces, self.piso)
+        # Mueven el piso las ventanas cercanas a él y las de ruido de banda ancha;
+        # las caídas de energía dentro de una palabra no lo hacen subir
+        ruido = (energia <= max(self.piso, self.piso_minimo) * 1.5) | (
+            (cruces >= self.max_cruces) & ~voz
+        )
+        if ruido.any():
+            self.piso += self.adaptacion * (float(energia[ruido].mean()) - self.piso)
+        return bool(voz.mean() >= fraccion)
+
+
+def recortar_silencio(audio, samplerate=16000, margen=0.2, detector=None):
+    """
+    Quita el silencio inicial y final dejando `margen` segundos de contexto. El
+    piso de ruido se estima con las ventanas más silenciosas del propio audio.
+    Devuelve una vista del array (sin copia); vacía si no hay voz.
+    """
+    audio = np.asarray(audio).reshape(-1)
+    detector = detector or DetectorVoz(samplerate)
+    energia, cruces = detector.caracteristicas(audio)
+    if energia.size == 0:
+        return audio
+    voz = np.flatnonzero(
+        detector.mascara(energia, cruces, float(np.percentile(energia, 10)))
+    )
+    if voz.size == 0:
+        return audio[:0]
+    extra = int(margen * samplerate)
+    inicio = max(0, voz[0] * detector.muestras_ventana - extra)
+    fin = min(audio.size, (voz[-1] + 1) * detector.muestras_ventana + extra)
+    return audio[inicio:fin]
 
 
 # --- Grabar audio del micrófono ---
-def grabar_audio(duracion=30, samplerate=16000):
+def grabar_audio(duracion=30, samplerate=16000, al_fragmento=None, fuente=None):
     """
     Graba audio desde el micrófono y detecta silencio para detenerse antes.
     Implementación sin callbacks para evitar actualizar Streamlit desde otro hilo.
+    `al_fragmento(data, voz)` se llama en este mismo hilo con cada lectura y
+    `fuente` permite sustituir el micrófono (pruebas, benchmarks).
     """
-    st.info("🎙️ Grabando... habla ahora (di 'terminar' o guarda silencio para finalizar).")
+    st.info(
+        "🎙️ Grabando... habla ahora (di 'terminar' o guarda silencio para finalizar)."
+    )
     progress = st.empty()
-    audio_buffer = []
+    frame_duration = 0.2  # segundos por lectura
+    frames_per_read = int(samplerate * frame_duration)
+    # Una lectura de margen: el límite de duración se comprueba después de leer
+    audio_buffer = BufferCircular(int(duracion * samplerate) + frames_per_read)
+    detector = DetectorVoz(samplerate)
 
-    with sd.InputStream(samplerate=samplerate, channels=1) as stream:
+    if fuente is None:
+        import sounddevice as sd
+
+        fuente = sd.InputStream(samplerate=samplerate, channels=1)
+
+    with fuente as stream:
         start_time = time.time()
         silencio_tiempo = 0.0
-        frame_duration = 0.2  # segundos por lectura
-        frames_per_read = int(samplerate * frame_duration)
 
         while True:
             data, _ = stream.read(frames_per_read)
-            audio_buffer.append(data.copy())
+            audio_buffer.escribir(data)
+            voz = detector.es_voz(data)
+            if al_fragmento is not None:
+                al_fragmento(data, voz)
 
-            vol = np.linalg.norm(data)
-            barra = "▰" * int(min(vol * 10, 30))
-            progress.text(f"[{barra:<30}] {vol:.2f}")
+            vol = float(np.sqrt(np.mean(np.square(data))))
+            barra = "▰" * int(min(vol * 100, 30))
+            progress.text(f"[{barra:<30}] {vol:.3f}")
 
-            if vol < 0.005:
-                silencio_tiempo += frame_duration
-            else:
+            if voz:
                 silencio_tiempo = 0.0
+            else:
+                silencio_tiempo += frame_duration
 
             if silencio_tiempo > 3 or (time.time() - start_time) > duracion:
                 break
 
     progress.empty()
     st.success("✅ Grabación finalizada.")
-    audio = np.concatenate(audio_buffer, axis=0)
-    return audio.flatten()
-
+    return audio_buffer.contenido()
 
-# --- Guardar y transcribir audio ---
-def guardar_y_transcribir():
-    """
-    Graba, guarda temporalmente el audio en WAV y usa Whisper para convertirlo a texto.
-    """
-    audio = grabar_audio()
 
-    # Asegurar que audio está en formato float32 [-1,1]
+def _normalizar_audio(audio):
+    """Asegura float32 en [-1, 1] sin copiar si el audio ya cumple."""
     audio = np.asarray(audio)
+    if audio.ndim != 1:
+        audio = audio.reshape(-1)
     if audio.dtype != np.float32:
         audio = audio.astype(np.float32)
-    if audio.max() > 1.0 or audio.min() < -1.0:
+    if audio.size and (audio.max() > 1.0 or audio.min() < -1.0):
         # Normalizar por si acaso
         max_val = max(abs(audio.max()), abs(audio.min()))
         if max_val > 0:
             audio = audio / max_val
+    return audio
+
+
+def transcribir_audio(audio, samplerate=SAMPLERATE_WHISPER):
+    """
+    Transcribe un array de audio con Whisper. A 16 kHz el buffer float32 se pasa
+    directamente al modelo (sin disco ni FFmpeg); con otra frecuencia, o si el
+    modelo no acepta arrays, se usa la ruta por archivo WAV.
+    """
+    audio = _normalizar_audio(audio)
+    if samplerate != SAMPLERATE_WHISPER:
+        return _transcribir_wav(audio, samplerate)
+    try:
+        with telemetria.tramo("whisper"):
+            result = obtener_modelo().transcribe(audio, fp16=False, language="es")
+    except TypeError:
+        return _transcribir_wav(audio, samplerate)
+    return result.get("text", "")
+
 
+def _asegurar_ffmpeg():
+    if os.name == "nt" and RUTA_FFMPEG_WINDOWS not in os.environ["PATH"]:
+        os.environ["PATH"] += os.pathsep + RUTA_FFMPEG_WINDOWS
+
+
+def _transcribir_wav(audio, samplerate=SAMPLERATE_WHISPER):
+    """Ruta de respaldo: escribe el audio en un WAV temporal y Whisper lo decodifica con FFmpeg."""
+    _asegurar_ffmpeg()
+    audio = _normalizar_audio(audio)
     temp_wav_path = None
     try:
-        with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_wav:
+        with telemetria.tramo("escribir_wav"), tempfile.NamedTemporaryFile(
+            suffix=".wav", delete=False
+        ) as temp_wav:
             temp_wav_path = temp_wav.name
-            with wave.open(temp_wav, 'wb') as wf:
+            with wave.open(temp_wav, "wb") as wf:
                 wf.setnchannels(1)
                 wf.setsampwidth(2)
-                wf.setframerate(16000)
+                wf.setframerate(samplerate)
                 wf.writeframes((audio * 32767).astype(np.int16).tobytes())
 
-        # --- Transcribir con Whisper ---
-        st.info("🧠 Transcribiendo con Whisper...")
-        result = modelo.transcribe(temp_wav_path, fp16=False, language="es")
-        texto = result.get("text", "")
-
-        # --- Limpiar texto ---
-        texto_limpio = limpiar_texto(texto)
-        st.success("✅ Transcripción completada.")
-        return texto_limpio
+        with telemetria.tramo("whisper"):
+            result = obtener_modelo().transcribe(
+                temp_wav_path, fp16=False, language="es"
+            )
+        return result.get("text", "")
     finally:
         try:
             if temp_wav_path and os.path.exists(temp_wav_path):
@@ -102,15 +315,234 @@ def guardar_y_transcribir():
             pass
 
 
+# --- Transcripción incremental mientras se graba ---
+def unir_transcripciones(previo, nuevo, max_solape=12):
+    """
+    Une dos transcripciones de bloques solapados quitando del inicio de `nuevo`
+    las palabras que ya aparecen al final de `previo`.
+    """
+    palabras_previas = previo.split()
+    palabras_nuevas = nuevo.split()
+
+    def clave(palabra):
+        return re.sub(r"[^\w]", "", palabra.casefold())
+
+    finales = [clave(p) for p in palabras_previas[-max_solape:]]
+    iniciales = [clave(p) for p in palabras_nuevas[:max_solape]]
+    for k in range(min(len(finales), len(iniciales)), 0, -1):
+        if finales[-k:] == iniciales[:k]:
+            palabras_nuevas = palabras_nuevas[k:]
+            break
+    return " ".join(palabras_previas + palabras_nuevas)
+
+
+class TranscriptorIncremental:
+    """
+    Transcribe bloques solapados en un hilo de fondo mientras la grabación
+    continúa. Cada bloque lleva `solape` segundos del anterior para no cortar
+    palabras; los textos se unen con unir_transcripciones(). Al finalizar solo
+    queda por transcribir el último bloque.
+    """
+
+    def __init__(
+        self,
+        transcribir=None,
+        samplerate=16000,
+        duracion_bloque=5.0,
+        solape=1.0,
+        margen=0.2,
+    ):
+        self.transcribir = transcribir or (
+            lambda audio: transcribir_audio(audio, samplerate)
+        )
+        self.muestras_bloque = int(duracion_bloque * samplerate)
+        self.muestras_solape = int(solape * samplerate)
+        self.muestras_margen = int(margen * samplerate)
+        self._pendiente = []
+        self._silencio = []
+        self._hubo_voz = False
+        self._muestras_pendientes = 0
+        self._cola_solape = np.zeros(0, dtype=np.float32)
+        self._bloques = queue.Queue()
+        self._texto = ""
+        self._lock = threading.Lock()
+        self._error = None
+        self._hilo = threading.Thread(target=self._trabajar, daemon=True)
+        self._hilo.start()
+
+    def agregar(self, data, voz=True):
+        """
+        Añade una lectura del micrófono; encola un bloque cuando hay suficiente
+        audio. Las lecturas sin voz se retienen: solo entran si después vuelve a
+        haber voz (pausas internas), así el silencio inicial y final no se transcribe.
+        """
+        data = np.array(data, dtype=np.float32).reshape(-1)
+        if not voz:
+            self._silencio.append(data)
+            return
+        if self._silencio:
+            silencio = np.concatenate(self._silencio)
+            if not self._hubo_voz:
+                silencio = (
+                    silencio[-self.muestras_margen :]
+                    if self.muestras_margen
+                    else silencio[:0]
+                )
+            self._silencio = []
+            self._anadir(silencio)
+        self._hubo_voz = True
+        self._anadir(data)
+
+    def _anadir(self, data):
+        self._pendiente.append(data)
+        self._muestras_pendientes += data.size
+        if self._muestras_pendientes >= self.muestras_bloque:
+            self._encolar()
+
+    def _encolar(self):
+        bloque = np.concatenate([self._cola_solape, *self._pendiente])
+        self._cola_solape = (
+            bloque[-self.muestras_solape :] if self.muestras_solape else bloque[:0]
+        )
+        self._pendiente = []
+        self._muestras_pendientes = 0
+        self._bloques.put(bloque)
+
+    def _trabajar(self):
+        while True:
+            bloque = self._bloques.get()
+            if bloque is None:
+                return
+            try:
+                texto = self.transcribir(bloque).strip()
+            except Exception as e:  # noqa: BLE001 - se relanza en finalizar()
+                self._error = e
+                continue
+            with self._lock:
+                self._texto = unir_transcripciones(self._texto, texto)
+
+    def parcial(self):
+        with self._lock:
+            return self._texto
+
+    def finalizar(self):
+        """
+        Transcribe el audio restante y devuelve el texto completo. Si nunca hubo
+        voz se transcribe todo lo retenido: un detector equivocado no pierde el dictado.
+        """
+        if self._silencio and not self._hubo_voz:
+            self._anadir(np.concatenate(self._silencio))
+        elif self._silencio and self.muestras_margen:
+            self._anadir(np.concatenate(self._silencio)[: self.muestras_margen])
+        if self._muestras_pendientes:
+            self._encolar()
+        self._bloques.put(None)
+        self._hilo.join()
+        if self._error is not None:
+            raise self._error
+        return self.parcial()
+
+
+# --- Guardar y transcribir audio ---
+def _con_respaldo(servicio):
+    """
+    Transcribe con el servicio y, si sus procesos murieron, en este proceso: el
+    audio ya grabado no se pierde.
+    """
+
+    def transcribir(audio):
+        try:
+            return servicio.transcribir(audio)
+        except ServicioCaido:
+            return transcribir_audio(audio)
+
+    return transcribir
+
+
+def _esperar_transcripcion(servicio, audio, intervalo=0.25):
+    """Envía el audio al servicio y sondea su estado mostrando la posición en la cola."""
+    try:
+        id_trabajo = servicio.enviar(audio, bloquear=True)
+    except ServicioCaido:
+        return transcribir_audio(audio)
+    aviso = st.empty()
+    while (estado := servicio.estado(id_trabajo))["estado"] in (
+        "en_cola",
+        "procesando",
+    ):
+        if estado["estado"] == "en_cola":
+            aviso.caption(
+                f"⏳ En cola para transcribir (posición {estado['posicion'] + 1})"
+            )
+        else:
+            aviso.caption("🧠 Transcribiendo con Whisper...")
+        time.sleep(intervalo)
+    aviso.empty()
+    try:
+        return servicio.resultado(id_trabajo)
+    except ServicioCaido:
+        return transcribir_audio(audio)
+
+
+def guardar_y_transcribir(
+    streaming=True, fuente=None, muletillas_extra=(), servicio=None
+):
+    """
+    Graba y usa Whisper para convertir el audio a texto. En modo streaming los
+    bloques se transcriben mientras se graba y se muestra el texto parcial; sin
+    streaming se transcribe todo el audio al terminar la grabación. El texto se
+    limpia con las muletillas comunes más `muletillas_extra` (las del usuario).
+    Con `servicio` (servicio_transcripcion.ServicioTranscripcion) Whisper corre en
+    sus procesos y no en el de Streamlit; si el servicio se cayó, en este.
+    """
+    if not streaming:
+        with telemetria.tramo("grabar_audio"):
+            grabado = grabar_audio(fuente=fuente)
+            # Sin voz detectada se transcribe todo, como en streaming
+            audio = recortar_silencio(grabado)
+            if not audio.size:
+                audio = grabado
+        st.info("🧠 Transcribiendo con Whisper...")
+        with telemetria.tramo("transcribir"):
+            if not audio.size:
+                texto = ""
+            elif servicio is not None:
+                texto = _esperar_transcripcion(servicio, audio)
+            else:
+                texto = transcribir_audio(audio)
+    else:
+        transcriptor = TranscriptorIncremental(
+            transcribir=_con_respaldo(servicio) if servicio is not None else None
+        )
+        vista_parcial = st.empty()
+        ultimo_parcial = [""]
+
+        def al_fragmento(data, voz):
+            transcriptor.agregar(data, voz)
+            parcial = transcriptor.parcial()
+            if parcial != ultimo_parcial[0]:
+                ultimo_parcial[0] = parcial
+                vista_parcial.caption(f"📝 {parcial}")
+
+        with telemetria.tramo("grabar_audio"):
+            grabar_audio(al_fragmento=al_fragmento, fuente=fuente)
+        st.info("🧠 Terminando la transcripción...")
+        # Con streaming solo queda el último bloque: es lo que se espera tras detener
+        with telemetria.tramo("transcribir"):
+            texto = transcriptor.finalizar()
+        vista_parcial.empty()
+
+    # --- Limpiar texto ---
+    with telemetria.tramo("limpiar_texto"):
+        texto_limpio = limpiar_texto(texto, muletillas_extra)
+    st.success("✅ Transcripción completada.")
+    return texto_limpio
+
+
 # --- Limpiar muletillas y palabras innecesarias ---
-def limpiar_texto(texto):
-    """Quita muletillas y normaliza espacios y puntuación manteniendo mayúsculas."""
-    muletillas = ["eh", "este", "pues", "o sea", "mmm", "ajá", "em", "ah"]
-    pattern = r"\b(?:" + "|".join(re.escape(m) for m in muletillas) + r")\b"
-    limpio = re.sub(pattern, "", texto, flags=re.IGNORECASE)
-    # Normalizar espacios
-    limpio = re.sub(r"\s+", " ", limpio)
-    # Quitar espacios antes de comas y puntos sobrantes
-    limpio = re.sub(r"\s+,", ",", limpio)
-    limpio = re.sub(r",+", ",", limpio)
-    return limpio.strip()
+def limpiar_texto(texto, muletillas_extra=()):
+    """
+    Quita muletillas, normaliza espacios y puntuación manteniendo mayúsculas y
+    expande abreviaturas médicas (ver normalizacion.Normalizador).
+    """
+    return normalizacion.limpiar_texto(texto, muletillas_extra)
@@ -0,0 +1,584 @@
+import hashlib
+import json
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, TypedDict
+
+import google.generativeai as genai
+
+import db
+import extraccion_local
+import telemetria
+
+# --- Configuración ---
+MODELOS = ["gemini-2.5-flash", "gemini-2.5-flash-lite"]
+
+# Segundos de espera antes de lanzar también el modelo de respaldo (cobertura)
+RETARDO_COBERTURA = 2.0
+# Tiempo máximo por modelo; pasado ese tiempo se descarta su respuesta
+TIMEOUTS_MODELO = {"gemini-2.5-flash": 15.0, "gemini-2.5-flash-lite": 10.0}
+TIMEOUT_POR_DEFECTO = 15.0
+
+# Cambiar la versión cuando cambie el prompt o el esquema para no reutilizar resultados viejos
+PROMPT_VERSION = "3"
+
+# El formato lo fija el esquema de respuesta (salida estructurada): el prompt solo da la tarea
+PROMPT = (
+    "Dictado de ambulancia. Corrige el texto en español médico y extrae los campos. "
+    'Dato ausente: "" (edad null).\n{texto}'
+)
+PROMPT_LOTE = (
+    "Dictados de ambulancia (JSON). Para cada uno, corrige el texto en español médico y extrae "
+    'los campos con su mismo id. Dato ausente: "" (edad null).\n{dictados}'
+)
+
+# Esquemas de respuesta de Gemini (tipos de OpenAPI en mayúsculas, como los espera la API)
+_PROPIEDADES = {
+    "texto_corregido": {"type": "STRING"},
+    "paciente": {"type": "STRING"},
+    "edad": {"type": "INTEGER", "nullable": True},
+    "motivo": {"type": "STRING"},
+    "diagnostico": {"type": "STRING"},
+    "tratamiento": {"type": "STRING"},
+}
+ESQUEMA_RESULTADO = {
+    "type": "OBJECT",
+    "properties": _PROPIEDADES,
+    "required": list(_PROPIEDADES),
+}
+ESQUEMA_LOTE = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"id": {"type": "STRING"}, **_PROPIEDADES},
+        "required": ["id", *_PROPIEDADES],
+    },
+}
+
+# Dictados por llamada en analizar_lote; más alargan la respuesta y el riesgo de cortarla
+MAXIMO_LOTE = 10
+
+
+# --- Caché de resultados ---
+def normalizar_texto(texto: str) -> str:
+    """Forma canónica del dictado: NFC, minúsculas y espacios colapsados."""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFC", texto)).strip().casefold()
+
+
+def clave_cache(
+    texto_normalizado: str, modelo_id: str, version: str = PROMPT_VERSION
+) -> str:
+    return hashlib.sha256(
+        f"{version}\x00{modelo_id}\x00{texto_normalizado}".encode()
+    ).hexdigest()
+
+
+class CacheAnalisis:
+    """
+    Caché de dos niveles para los resultados de Gemini: un LRU en memoria delante
+    de la tabla cache_ia de SQLite. Las entradas vencen tras `ttl` segundos y el
+    almacén persistente se limita a `maximo_persistente` filas.
+    """
+
+    def __init__(
+        self,
+        capacidad: int = 256,
+        ttl: float = 7 * 24 * 3600,
+        maximo_persistente: int = 5000,
+    ):
+        self.capacidad = capacidad
+        self.ttl = ttl
+        self.maximo_persistente = maximo_persistente
+        self._memoria: OrderedDict[str, tuple[str, float]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, *claves: str) -> str | None:
+        """Devuelve el primer valor vigente entre `claves` (una consulta = un acierto o un fallo)."""
+        ahora = time.time()
+        with self._lock:
+            for clave in claves:
+                entrada = self._memoria.get(clave)
+                if entrada is None:
+                    continue
+                if entrada[1] > ahora:
+                    self._memoria.move_to_end(clave)
+                    self.aciertos += 1
+                    return entrada[0]
+                del self._memoria[clave]
+
+        for clave in claves:
+            valor = db.cache_ia_obtener(clave, ahora - self.ttl)
+            if valor is not None:
+                with self._lock:
+                    self.aciertos += 1
+                    self._recordar(clave, valor, ahora)
+                return valor
+
+        with self._lock:
+            self.fallos += 1
+        return None
+
+    def guardar(self, clave: str, valor: str) -> None:
+        ahora = time.time()
+        with self._lock:
+            self._recordar(clave, valor, ahora)
+        db.cache_ia_guardar(clave, valor, self.maximo_persistente, ahora - self.ttl)
+
+    def _recordar(self, clave: str, valor: str, ahora: float) -> None:
+        self._memoria[clave] = (valor, ahora + self.ttl)
+        self._memoria.move_to_end(clave)
+        while len(self._memoria) > self.capacidad:
+            self._memoria.popitem(last=False)
+
+    def limpiar(self, persistente: bool = False) -> None:
+        with self._lock:
+            self._memoria.clear()
+            self.aciertos = self.fallos = 0
+        if persistente:
+            db.cache_ia_vaciar()
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "en_memoria": len(self._memoria),
+            }
+
+
+cache = CacheAnalisis()
+
+
+# --- Interruptor y métricas por modelo ---
+class Interruptor:
+    """
+    Circuit breaker por modelo: tras `umbral` fallos seguidos el modelo se salta
+    durante `enfriamiento` segundos; luego se permite un nuevo intento.
+    """
+
+    def __init__(self, umbral: int = 3, enfriamiento: float = 60.0):
+        self.umbral = umbral
+        self.enfriamiento = enfriamiento
+        self._fallos: dict[str, int] = {}
+        self._abierto_hasta: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def disponible(self, modelo_id: str) -> bool:
+        with self._lock:
+            return self._abierto_hasta.get(modelo_id, 0.0) <= time.monotonic()
+
+    def registrar_exito(self, modelo_id: str) -> None:
+        with self._lock:
+            self._fallos.pop(modelo_id, None)
+            self._abierto_hasta.pop(modelo_id, None)
+
+    def registrar_fallo(self, modelo_id: str) -> None:
+        with self._lock:
+            fallos = self._fallos.get(modelo_id, 0) + 1
+            self._fallos[modelo_id] = fallos
+            if fallos >= self.umbral:
+                self._abierto_hasta[modelo_id] = time.monotonic() + self.enfriamiento
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._fallos.clear()
+            self._abierto_hasta.clear()
+
+
+class MetricasModelos:
+    """Latencias recientes y contadores de éxito/fallo por modelo."""
+
+    def __init__(self, ventana: int = 200):
+        self.ventana = ventana
+        self._latencias: dict[str, deque[float]] = {}
+        self._contadores: dict[str, dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def registrar(
+        self, modelo_id: str, resultado: str, latencia: float | None = None
+    ) -> None:
+        with self._lock:
+            contadores = self._contadores.setdefault(
+                modelo_id, {"exitos": 0, "fallos": 0, "timeouts": 0}
+            )
+            contadores[resultado] += 1
+            if latencia is not None:
+                self._latencias.setdefault(
+                    modelo_id, deque(maxlen=self.ventana)
+                ).append(latencia)
+
+    def resumen(self) -> dict[str, dict]:
+        with self._lock:
+            resumen = {}
+            for modelo_id, contadores in self._contadores.items():
+                latencias = sorted(self._latencias.get(modelo_id, ()))
+                resumen[modelo_id] = dict(contadores)
+                if latencias:
+                    resumen[modelo_id]["p50_ms"] = latencias[len(latencias) // 2] * 1000
+                    resumen[modelo_id]["p95_ms"] = (
+                        latencias[min(len(latencias) - 1, int(len(latencias) * 0.95))]
+                        * 1000
+                    )
+            return resumen
+
+    def reiniciar(self) -> None:
+        with self._lock:
+            self._latencias.clear()
+            self._contadores.clear()
+
+
+interruptor = Interruptor()
+metricas = MetricasModelos()
+_ejecutor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="gemini")
+
+
+# --- Resultado tipado ---
+class ResultadoAnalisis(TypedDict):
+    texto_corregido: str
+    paciente: str
+    edad: int | None
+    motivo: str
+    diagnostico: str
+    tratamiento: str
+
+
+CAMPOS_RESULTADO = tuple(ResultadoAnalisis.__annotations__)
+
+
+def _a_texto(valor: Any) -> str:
+    return "" if valor is None else str(valor).strip()
+
+
+def validar_resultado(datos: Any) -> ResultadoAnalisis:
+    """Registro con todos los campos: textos recortados ("" si faltan) y edad entera (o None). Lanza ValueError si no es un objeto."""
+    if not isinstance(datos, dict):
+        raise ValueError(  # noqa: TRY004 - respuesta inválida, como JSONDecodeError
+            f"Se esperaba un objeto JSON y llegó {type(datos).__name__}"
+        )
+    resultado = {campo: _a_texto(datos.get(campo)) for campo in CAMPOS_RESULTADO}
+    # La misma regla que la columna edad: la IA y la base no pueden discrepar
+    resultado["edad"] = db.edad_entera(datos.get("edad"))
+    return resultado
+
+
+# --- Análisis con Gemini ---
+def _extraer_json(salida: str, apertura: str = "{", cierre: str = "}") -> str:
+    """
+    Con salida estructurada la respuesta ya es JSON. Si no lo es (modelo que
+    ignora el esquema), recorta el JSON del texto y aplica reparaciones simples.
+    """
+    try:
+        json.loads(salida)
+        return salida
+    except json.JSONDecodeError:
+        pass
+    telemetria.contar("json_reparaciones")
+    with telemetria.tramo("reparar_json"):
+        salida = salida.strip()
+        if apertura in salida and cierre in salida:
+            salida = salida[salida.find(apertura) : salida.rfind(cierre) + 1]
+        try:
+            json.loads(salida)
+        except json.JSONDecodeError:
+            salida = salida.replace("'", '"').replace(",}", "}").replace(",]", "]")
+            json.loads(salida)
+    return salida
+
+
+def _extraer_resultado(salida: str) -> str:
+    return json.dumps(
+        validar_resultado(json.loads(_extraer_json(salida))), ensure_ascii=False
+    )
+
+
+def _extraer_resultados_lote(salida: str) -> str:
+    """Lista de resultados validados, cada uno con su id; los elementos sin id se descartan."""
+    datos = json.loads(_extraer_json(salida, "[", "]"))
+    if not isinstance(datos, list):
+        raise ValueError(  # noqa: TRY004 - respuesta inválida, como JSONDecodeError
+            f"Se esperaba un arreglo JSON y llegó {type(datos).__name__}"
+        )
+    resultados = [
+        {"id": _a_texto(elemento["id"]), **validar_resultado(elemento)}
+        for elemento in datos
+        if isinstance(elemento, dict) and _a_texto(elemento.get("id"))
+    ]
+    return json.dumps(resultados, ensure_ascii=False)
+
+
+def _contar_uso(respuesta: Any) -> None:
+    """Tokens de la llamada según usage_metadata (las respuestas sin él no cuentan tokens)."""
+    uso = getattr(respuesta, "usage_metadata", None)
+    if uso is not None:
+        telemetria.contar(
+            "gemini_tokens_entrada", getattr(uso, "prompt_token_count", 0) or 0
+        )
+        telemetria.contar(
+            "gemini_tokens_salida", getattr(uso, "candidates_token_count", 0) or 0
+        )
+
+
+def _llamar_modelo(
+    modelo_id: str,
+    prompt: str,
+    extraer: Callable[[str], str] = _extraer_resultado,
+    esquema: dict = ESQUEMA_RESULTADO,
+) -> str:
+    """
+    Una llamada a un modelo con salida estructurada; devuelve el JSON validado o
+    lanza la excepción. Las métricas de éxito y fallo las registra quien decide
+    si se usa el resultado (_consultar_con_cobertura).
+    """
+    configuracion = {
+        "temperature": 0.3,
+        "response_mime_type": "application/json",
+        "response_schema": esquema,
+    }
+    with telemetria.tramo(f"gemini:{modelo_id}"):
+        modelo = genai.GenerativeModel(modelo_id)
+        telemetria.contar("gemini_solicitudes")
+        respuesta = modelo.generate_content(prompt, generation_config=configuracion)
+    _contar_uso(respuesta)
+    return extraer(respuesta.text)
+
+
+def _timeout(modelo_id: str) -> float:
+    return TIMEOUTS_MODELO.get(modelo_id, TIMEOUT_POR_DEFECTO)
+
+
+def _consultar_con_cobertura(
+    prompt: str,
+    modelos: list[str],
+    retardo: float,
+    avisar: Callable[[str], object] | None,
+    extraer: Callable[[str], str] = _extraer_resultado,
+    esquema: dict = ESQUEMA_RESULTADO,
+) -> tuple[str, str]:
+    """
+    Lanza el primer modelo y, si no ha respondido tras `retardo` segundos (o en
+    cuanto falla), lanza el siguiente. Gana la primera respuesta con JSON válido;
+    las demás se cancelan si aún no empezaron o se descartan si ya están en
+    curso. Devuelve (modelo_id, salida). Solo cuenta en las métricas el desenlace
+    que se llega a ver: una respuesta tardía (tras su timeout o tras ganar otro
+    modelo) se descarta sin registrarse.
+    """
+    # Los modelos con el interruptor abierto se saltan, salvo que lo estén todos
+    candidatos = [m for m in modelos if interruptor.disponible(m)] or list(modelos)
+    # futuro -> (modelo, límite, inicio)
+    pendientes: dict[Future, tuple[str, float, float]] = {}
+    siguiente = 0
+    proxima_cobertura = 0.0
+
+    def lanzar() -> None:
+        nonlocal siguiente, proxima_cobertura
+        modelo_id = candidatos[siguiente]
+        if siguiente:
+            telemetria.contar("gemini_coberturas")
+        siguiente += 1
+        inicio = time.monotonic()
+        pendientes[
+            _ejecutor.submit(_llamar_modelo, modelo_id, prompt, extraer, esquema)
+        ] = (modelo_id, inicio + _timeout(modelo_id), inicio)
+        proxima_cobertura = time.monotonic() + retardo
+
+    def fallar(modelo_id: str, error: Exception) -> None:
+        interruptor.registrar_fallo(modelo_id)
+        telemetria.contar("gemini_fallos")
+        if avisar:
+            avisar(f"⚠️ {modelo_id} falló: {str(error)[:80]}")
+
+    lanzar()
+    while pendientes:
+        ahora = time.monotonic()
+        plazos = [limite for _, limite, _ in pendientes.values()]
+        if siguiente < len(candidatos):
+            plazos.append(proxima_cobertura)
+        hechos, _ = wait(
+            pendientes,
+            timeout=max(0.0, min(plazos) - ahora),
+            return_when=FIRST_COMPLETED,
+        )
+
+        # Orden de lanzamiento: ante dos respuestas simultáneas gana el modelo preferido
+        for futuro in [f for f in pendientes if f in hechos]:
+            modelo_id, _, inicio = pendientes.pop(futuro)
+            latencia = time.monotonic() - inicio
+            try:
+                salida = futuro.result()
+            except Exception as e:  # noqa: BLE001
+                # Cualquier fallo del modelo pasa al siguiente
+                metricas.registrar(modelo_id, "fallos", latencia)
+                fallar(modelo_id, e)
+                continue
+            metricas.registrar(modelo_id, "exitos", latencia)
+            interruptor.registrar_exito(modelo_id)
+            for otro in pendientes:
+                otro.cancel()
+            return modelo_id, salida
+
+        ahora = time.monotonic()
+        for futuro, (modelo_id, limite, _) in list(pendientes.items()):
+            if limite <= ahora:
+                del pendientes[futuro]
+                futuro.cancel()
+                metricas.registrar(modelo_id, "timeouts")
+                telemetria.contar("gemini_timeouts")
+                fallar(
+                    modelo_id,
+                    TimeoutError(f"sin respuesta en {_timeout(modelo_id):.0f} s"),
+                )
+
+        # Cobertura: el siguiente modelo sale si venció el retardo o si ya no queda nada en curso
+        if siguiente < len(candidatos) and (
+            not pendientes or time.monotonic() >= proxima_cobertura
+        ):
+            lanzar()
+
+    raise RuntimeError("Fallo en análisis IA.")
+
+
+def _analizar_local(texto: str, umbral: float | None) -> str | None:
+    """Resultado del extractor por reglas si todos sus campos superan el umbral."""
+    inicio = time.perf_counter()
+    datos, confianza = extraccion_local.extraer(texto)
+    if not extraccion_local.es_confiable(
+        confianza, extraccion_local.UMBRAL if umbral is None else umbral
+    ):
+        return None
+    metricas.registrar("local", "exitos", time.perf_counter() - inicio)
+    telemetria.contar("analisis_local")
+    return json.dumps(validar_resultado(datos), ensure_ascii=False)
+
+
+def analizar_texto(
+    texto: str,
+    avisar: Callable[[str], object] | None = None,
+    retardo_cobertura: float | None = None,
+    umbral_local: float | None = None,
+) -> str:
+    """
+    Corrige el dictado y extrae los campos de la historia. Devuelve el JSON de un
+    ResultadoAnalisis como texto. Los dictados de plantilla se resuelven con el extractor local (ver
+    extraccion_local; umbral_local > 1 lo desactiva). Si no, consulta la caché y
+    luego los modelos de MODELOS con cobertura (ver _consultar_con_cobertura),
+    avisando de cada fallo con `avisar`.
+    """
+    with telemetria.tramo("analizar"):
+        local = _analizar_local(texto, umbral_local)
+        if local is not None:
+            return local
+
+        normalizado = normalizar_texto(texto)
+        guardado = cache.obtener(
+            *(clave_cache(normalizado, modelo_id) for modelo_id in MODELOS)
+        )
+        if guardado is not None:
+            telemetria.contar("analisis_cache")
+            return guardado
+
+        retardo = RETARDO_COBERTURA if retardo_cobertura is None else retardo_cobertura
+        modelo_id, salida = _consultar_con_cobertura(
+            PROMPT.format(texto=texto), MODELOS, retardo, avisar
+        )
+        telemetria.contar("historias_ia")
+        cache.guardar(clave_cache(normalizado, modelo_id), salida)
+        return salida
+
+
+def analizar_lote(
+    textos: dict[str, str],
+    avisar: Callable[[str], object] | None = None,
+    retardo_cobertura: float | None = None,
+    umbral_local: float | None = None,
+) -> dict[str, str]:
+    """
+    Analiza varios dictados por llamada (hasta MAXIMO_LOTE). `textos` va de id a
+    dictado y el resultado de id al mismo JSON que devuelve analizar_texto(). Los
+    dictados de plantilla o ya en caché no se envían; los ids que falten en la
+    respuesta o cuyo lote falló no aparecen en el resultado para que quien llama
+    los reintente. Si fallan todos los lotes se lanza el error del último.
+    """
+    resultados: dict[str, str] = {}
+    normalizados: dict[str, str] = {}
+    for id_texto, texto in textos.items():
+        local = _analizar_local(texto, umbral_local)
+        if local is not None:
+            resultados[id_texto] = local
+            continue
+        normalizado = normalizar_texto(texto)
+        guardado = cache.obtener(
+            *(clave_cache(normalizado, modelo_id) for modelo_id in MODELOS)
+        )
+        if guardado is not None:
+            telemetria.contar("analisis_cache")
+            resultados[id_texto] = guardado
+        else:
+            normalizados[id_texto] = normalizado
+    if not normalizados:
+        return resultados
+
+    retardo = RETARDO_COBERTURA if retardo_cobertura is None else retardo_cobertura
+    pendientes = list(normalizados)
+    lotes = [
+        pendientes[i : i + MAXIMO_LOTE] for i in range(0, len(pendientes), MAXIMO_LOTE)
+    ]
+    error: Exception | None = None
+    for lote in lotes:
+        dictados = json.dumps(
+            [{"id": id_texto, "texto": textos[id_texto]} for id_texto in lote],
+            ensure_ascii=False,
+        )
+        try:
+            modelo_id, salida = _consultar_con_cobertura(
+                PROMPT_LOTE.format(dictados=dictados),
+                MODELOS,
+                retardo,
+                avisar,
+                _extraer_resultados_lote,
+                ESQUEMA_LOTE,
+            )
+        except RuntimeError as e:
+            error = e
+            continue
+        for datos in json.loads(salida):
+            id_texto = datos.pop("id")
+            if id_texto in lote and id_texto not in resultados:
+                resultados[id_texto] = json.dumps(datos, ensure_ascii=False)
+                cache.guardar(
+                    clave_cache(normalizados[id_texto], modelo_id), resultados[id_texto]
+                )
+                telemetria.contar("historias_ia")
+    if error is not None and not any(id_texto in resultados for id_texto in pendientes):
+        raise error
+    return resultados
+
+
+def consumo_por_historia(contadores: dict[str, int] | None = None) -> dict:
+    """
+    Solicitudes y tokens de Gemini por historia analizada con IA, a partir de los
+    contadores de telemetría (por defecto los guardados). None si aún no hay historias.
+    """
+    contadores = (
+        telemetria.historico()["contadores"] if contadores is None else contadores
+    )
+    historias = contadores.get("historias_ia", 0)
+    entrada, salida = contadores.get("gemini_tokens_entrada", 0), contadores.get(
+        "gemini_tokens_salida", 0
+    )
+    return {
+        "historias": historias,
+        "solicitudes_por_historia": (
+            contadores.get("gemini_solicitudes", 0) / historias if historias else None
+        ),
+        "tokens_entrada_por_historia": entrada / historias if historias else None,
+        "tokens_salida_por_historia": salida / historias if historias else None,
+    }